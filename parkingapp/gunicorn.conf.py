@@ -0,0 +1,12 @@
+import os
+
+
+# Load sẵn các model AI trong từng worker trước khi nhận request (MODEL_WARMUP=1)
+def post_worker_init(worker):
+    if os.getenv('MODEL_WARMUP', '0') != '1' or os.getenv('ML_ENABLED', '1') != '1':
+        return
+    from parking.services.model_registry import registry
+    errors = registry.warm_up()
+    for name, error in errors.items():
+        worker.log.error("Không load được model %s: %s", name, error)
+    worker.log.info("Models ready: %s", registry.status())
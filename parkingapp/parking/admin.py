@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import (User, Vehicle, FeeRule, Payment, ParkingLog, Wallet, WalletTransaction, UserFace)
+from .models import (User, Vehicle, FeeRule, Payment, ParkingLog, Wallet, WalletTransaction, UserFace, GateEvent,
+                     DailyParkingStat)
 
 
 class ParkingAppAdminSite(admin.AdminSite):
@@ -59,6 +60,19 @@ class UserFaceAdmin(admin.ModelAdmin):
     list_filter = ('created_date',)
 
 
+class GateEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'direction', 'captured_at', 'ok', 'msg', 'plate_text', 'created_date')
+    list_filter = ('direction', 'ok')
+    search_fields = ('event_id', 'plate_text')
+
+
+class DailyParkingStatAdmin(admin.ModelAdmin):
+    list_display = ('day', 'vehicle_type', 'user', 'entries', 'exits', 'revenue', 'minutes')
+    list_filter = ('vehicle_type', 'day')
+    search_fields = ('user__username',)
+    readonly_fields = ('day', 'vehicle_type', 'user', 'entries', 'exits', 'revenue', 'minutes')
+
+
 admin_site.register(User, UserAdmin)
 admin_site.register(Vehicle, VehicleAdmin)
 admin_site.register(FeeRule, FeeRuleAdmin)
@@ -67,3 +81,5 @@ admin_site.register(ParkingLog, ParkingLogAdmin)
 admin_site.register(Wallet, WalletAdmin)
 admin_site.register(WalletTransaction, WalletTransactionAdmin)
 admin_site.register(UserFace, UserFaceAdmin)
+admin_site.register(GateEvent, GateEventAdmin)
+admin_site.register(DailyParkingStat, DailyParkingStatAdmin)
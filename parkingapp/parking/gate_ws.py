@@ -0,0 +1,170 @@
+import json
+import asyncio
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from oauth2_provider.models import AccessToken
+
+from .models import UserRole
+from .services.model_registry import registry
+from .views import scan_event
+
+# CẤU HÌNH
+GATE_WS_PATH = '/ws/gate/'
+MAX_FRAME_BYTES = 4 * 1024 * 1024  # khung JPEG 1280px chỉ vài trăm KB
+_HEADER_SIZE = struct.Struct('>I')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# Kênh WebSocket giữ kết nối lâu dài với máy cổng:
+# - xác thực 1 lần khi kết nối bằng access token OAuth2 của tài khoản nhân viên/admin
+#   (header "Authorization: Bearer <token>" hoặc ?token=<token>)
+# - máy cổng gửi message nhị phân: 4 byte độ dài header (big-endian) + header JSON
+#   {"event_id", "lane", "direction", "captured_at"} + ảnh JPEG của khung hình
+# - server trả message text JSON {"event_id", "lane", "ok", "msg", "plate_text"} ngay khi có kết quả
+#   (kèm "pending": true nếu bản gửi trước của event_id đang xử lý -> máy cổng gửi lại sau),
+#   hoặc {"event_id", "lane", "ok": false, "error"} khi lỗi
+class GateProtocolError(ValueError):
+    pass
+
+
+# HÀM: tách header JSON và ảnh JPEG từ 1 message nhị phân
+def parse_frame(message: bytes):
+    if len(message) < _HEADER_SIZE.size:
+        raise GateProtocolError("Message quá ngắn")
+    (size,) = _HEADER_SIZE.unpack_from(message)
+    end = _HEADER_SIZE.size + size
+    if end > len(message):
+        raise GateProtocolError("Độ dài header không hợp lệ")
+    try:
+        header = json.loads(message[_HEADER_SIZE.size:end])
+    except ValueError:
+        raise GateProtocolError("Header không phải JSON hợp lệ")
+    if not isinstance(header, dict) or header.get('direction') not in ('IN', 'OUT'):
+        raise GateProtocolError("Thiếu hướng vào/ra")
+    return header, message[end:]
+
+
+# HÀM: đóng gói 1 khung hình để gửi qua kênh (dùng ở máy cổng và trong test)
+def build_frame(header: dict, image: bytes) -> bytes:
+    data = json.dumps(header).encode()
+    return _HEADER_SIZE.pack(len(data)) + data + image
+
+
+def _token_from_scope(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            scheme, _, token = value.decode().partition(' ')
+            if scheme.lower() == 'bearer':
+                return token.strip()
+    return (parse_qs(scope.get('query_string', b'').decode()).get('token') or [None])[0]
+
+
+# HÀM: tài khoản nhân viên/admin sở hữu access token còn hạn, None nếu không hợp lệ
+def get_gate_user(token):
+    if not token:
+        return None
+    close_old_connections()
+    access = AccessToken.objects.select_related('user').filter(token=token).first()
+    if access is None or access.is_expired():
+        return None
+    user = access.user
+    if not user.is_active or user.user_role not in (UserRole.STAFF, UserRole.ADMIN):
+        return None
+    return user
+
+
+def _workers():
+    return getattr(settings, 'GATE_WS_WORKERS', 4)
+
+
+# HÀM: thread pool riêng cho các lượt quét qua WebSocket, giới hạn bởi GATE_WS_WORKERS.
+# Không dùng chung pool của pipeline: lượt quét gửi các bước con vào pool đó và chờ,
+# nếu chính lượt quét chiếm hết thread thì các bước con không bao giờ được chạy
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_workers(),
+                                               thread_name_prefix='gate-ws')
+    return _executor
+
+
+# HÀM: chạy 1 lượt quét (đồng bộ) trên thread pool của kênh WebSocket
+def _process_frame(header, image):
+    close_old_connections()
+    try:
+        files = {'image': ContentFile(image, name=f"{header.get('lane') or 'gate'}.jpg")}
+        return scan_event(files, header['direction'], header.get('event_id'), header.get('captured_at'))
+    finally:
+        close_old_connections()
+
+
+async def _handle_frame(send, send_lock, message):
+    header = {}
+    try:
+        header, image = parse_frame(message)
+        if len(image) > MAX_FRAME_BYTES:
+            raise GateProtocolError("Ảnh quá lớn")
+        loop = asyncio.get_running_loop()
+        ok, msg, plate_text, timings = await loop.run_in_executor(get_executor(), _process_frame, header, image)
+        reply = {"ok": ok, "msg": msg, "plate_text": plate_text}
+        if timings.get('pending'):
+            reply["pending"] = True
+    except Exception as e:
+        reply = {"ok": False, "error": str(e)}
+    reply.update(event_id=header.get('event_id'), lane=header.get('lane'))
+    async with send_lock:
+        await send({'type': 'websocket.send', 'text': json.dumps(reply)})
+
+
+# ASGI app cho đường dẫn GATE_WS_PATH (xem parkingapp/asgi.py)
+async def gate_socket(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if not registry.enabled:
+        await send({'type': 'websocket.close', 'code': 1013})  # worker chỉ phục vụ API
+        return
+    user = await sync_to_async(get_gate_user, thread_sensitive=False)(_token_from_scope(scope))
+    if user is None:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    await send({'type': 'websocket.accept'})
+
+    send_lock = asyncio.Lock()
+    # số lượt đang xử lý tối đa trên 1 kết nối = số thread của pool, nhiều hơn cũng chỉ nằm chờ
+    inflight = asyncio.Semaphore(_workers())
+    tasks = set()
+
+    async def run(data):
+        try:
+            await _handle_frame(send, send_lock, data)
+        finally:
+            inflight.release()
+
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('bytes') is None:
+                continue  # message text (ping của client) bỏ qua
+            # mỗi khung xử lý song song: làn chậm không làm làn khác phải chờ
+            await inflight.acquire()
+            task = asyncio.ensure_future(run(message['bytes']))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        # lượt đã gửi vào thread pool vẫn chạy xong (đã ghi DB), chỉ bỏ phần trả kết quả
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,33 @@
+import time
+
+
+# HÀM: đo thời gian chạy (ms) của fn sau vài lần chạy khởi động
+def measure(fn, repeat=20, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, p):
+    data = sorted(samples)
+    if not data:
+        return 0.0
+    k = (len(data) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(data) - 1)
+    return data[lo] + (data[hi] - data[lo]) * (k - lo)
+
+
+def summarize(samples):
+    return {
+        'n': len(samples),
+        'mean_ms': sum(samples) / len(samples) if samples else 0.0,
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+    }
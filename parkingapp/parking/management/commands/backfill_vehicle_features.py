@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from parking.models import Vehicle
+from parking.services.detection_vehicle import refresh_vehicle_features
+
+
+class Command(BaseCommand):
+    help = "Tính embedding OSNet + histogram màu cho các xe đã đăng ký nhưng chưa có đặc trưng"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Tính lại cho tất cả xe, kể cả xe đã có đặc trưng")
+        parser.add_argument('--include-pending', action='store_true', help="Tính cả xe chưa được duyệt")
+
+    def handle(self, *args, **options):
+        vehicles = Vehicle.objects.exclude(image__isnull=True).exclude(image='')
+        if not options['all']:
+            vehicles = vehicles.filter(reid_embedding__isnull=True)
+        if not options['include_pending']:
+            vehicles = vehicles.filter(is_approved=True)
+
+        done = failed = 0
+        for vehicle in vehicles.iterator():
+            try:
+                refresh_vehicle_features(vehicle)
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{vehicle.license_plate}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Đã tính đặc trưng cho {done} xe, lỗi {failed} xe"))
@@ -0,0 +1,83 @@
+import json
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from parking.services.face_index import FaceIndex, EMBEDDING_DIM, INDEX_DTYPES
+from ._bench import measure, summarize
+
+
+def _random_unit(rng, n, dim=EMBEDDING_DIM):
+    matrix = rng.standard_normal((n, dim), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+class Command(BaseCommand):
+    help = "So sánh tìm khuôn mặt bằng vòng lặp UserFace (cách cũ) với FaceIndex trên dữ liệu giả lập"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--loop-sample', type=int, default=10_000,
+                            help="Số dòng tối đa chạy vòng lặp cũ, phần còn lại được ngoại suy tuyến tính")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--dtypes', nargs='+', choices=INDEX_DTYPES, default=[],
+                            help="So sánh thêm RAM / độ trễ / recall@1 của ma trận lượng tử hóa với float32")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        queries = _random_unit(rng, options['queries'])
+        self.stdout.write(f"{'faces':>10} {'loop p50 (ms)':>15} {'index p50 (ms)':>15} {'index p99 (ms)':>15} {'x':>8}")
+
+        for n in options['sizes']:
+            index = FaceIndex()
+            for start in range(0, n, 100_000):
+                count = min(100_000, n - start)
+                index.add_many(np.arange(start + 1, start + count + 1), _random_unit(rng, count))
+            if options['dtypes']:
+                self._compare_dtypes(index, options['dtypes'], options['queries'], rng)
+
+            # cách cũ (detection_face.cosine_similarity): mỗi dòng giải mã JSON rồi tính tích vô hướng
+            sample = min(n, options['loop_sample'])
+            rows = [json.dumps(vec.tolist()) for vec in _random_unit(rng, sample)]
+            query_iter = iter(np.tile(queries, (2, 1)))
+
+            def legacy_loop():
+                q = next(query_iter)
+                for text in rows:
+                    np.dot(np.array(q), np.array(json.loads(text)))
+
+            loop = summarize(measure(legacy_loop, repeat=max(1, options['queries'] // 4)))
+            scale = n / sample
+            loop_p50 = loop['p50_ms'] * scale
+
+            query_iter_idx = iter(np.tile(queries, (2, 1)))
+            indexed = summarize(measure(lambda: index.search(next(query_iter_idx), k=3),
+                                        repeat=options['queries'] - 1))
+
+            suffix = "" if scale == 1 else f"  (vòng lặp ngoại suy từ {sample} dòng)"
+            self.stdout.write(
+                f"{n:>10} {loop_p50:>15.1f} {indexed['p50_ms']:>15.2f} {indexed['p99_ms']:>15.2f} "
+                f"{loop_p50 / max(indexed['p50_ms'], 1e-6):>8.0f}{suffix}"
+            )
+
+    # HÀM: dựng lại chỉ mục với từng dtype, truy vấn bằng bản sao có nhiễu của các dòng có sẵn
+    def _compare_dtypes(self, base, dtypes, n_queries, rng):
+        rows = rng.choice(len(base), size=n_queries, replace=False)
+        queries = base._matrix[rows] + rng.normal(0, 0.02, (n_queries, base.dim)).astype(np.float32)
+        expected = [base.search(q, k=1)[0] for q in queries]
+
+        self.stdout.write(f"  {'dtype':>8} {'RAM (MB)':>10} {'p50 (ms)':>10} {'recall@1':>9} {'max |Δscore|':>13}")
+        for dtype in dtypes:
+            index = FaceIndex(dtype=dtype)
+            for start in range(0, len(base), 100_000):
+                index.add_many(base._ids[start:start + 100_000], base._matrix[start:start + 100_000])
+            results = [index.search(q, k=1)[0] for q in queries]
+            hits = sum(got[0] == exp[0] for got, exp in zip(results, expected))
+            error = max(abs(got[1] - exp[1]) for got, exp in zip(results, expected))
+            query_iter = iter(np.tile(queries, (2, 1)))
+            timing = summarize(measure(lambda: index.search(next(query_iter), k=3), repeat=n_queries - 1))
+            self.stdout.write(
+                f"  {dtype:>8} {index.nbytes / 2 ** 20:>10.1f} {timing['p50_ms']:>10.2f} "
+                f"{hits / n_queries:>9.3f} {error:>13.4f}"
+            )
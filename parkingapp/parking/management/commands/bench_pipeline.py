@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+from contextlib import contextmanager
+from importlib import metadata
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import post_save
+
+from parking.models import Vehicle, UserFace
+from parking.signals import update_face_index
+from parking.services import detection_face
+from parking.services.face_index import FaceIndex
+from parking.services.model_registry import registry
+from parking.services.detection_face import math_emb
+from parking.services.detection_plate import detect_license_plates, detect_vehicle
+from parking.services.detection_vehicle import extract_vehicle_features, check_vehicle
+from parking.services.helpers import pack_vector
+from parking.services.pipeline import run_scan
+from .check_model_backends import load_fixtures
+from ._bench import measure, summarize
+
+BUNDLED_IMAGE = os.path.join(os.path.dirname(__file__), '..', '..', 'services', 'plate.jpg')
+STAGES = ('face', 'plate', 'vehicle', 'vehicle_features', 'check_vehicle', 'pipeline')
+LIBRARIES = ('numpy', 'opencv-python', 'torch', 'ultralytics', 'insightface', 'onnxruntime', 'torchreid')
+
+
+# HÀM: sinh ảnh giả lập cỡ camera cổng (nền nhiễu + khối chữ nhật sáng giống biển số)
+def synthetic_frames(count, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        height, width = (720, 1280) if i % 2 else (480, 640)
+        frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        x, y = width // 2 - 80, height // 2 + 60
+        cv2.rectangle(frame, (x, y), (x + 160, y + 50), (235, 235, 235), -1)
+        cv2.putText(frame, f"30A-{12345 + i}", (x + 8, y + 35), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (20, 20, 20), 2)
+        frames.append((f"synthetic_{i}.jpg", frame))
+    return frames
+
+
+def peak_rss_mb():
+    # Linux trả về KB, macOS trả về byte
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def library_versions():
+    versions = {}
+    for name in LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def _upload(name, img):
+    ok, buf = cv2.imencode('.jpg', img)
+    if not ok:
+        raise CommandError(f"Không mã hóa được ảnh {name}")
+    return buf.tobytes()
+
+
+# Xe giả lập (không lưu DB) có sẵn đặc trưng để đo check_vehicle mà không tải ảnh từ Cloudinary
+def _reference_vehicle(img):
+    emb, color = extract_vehicle_features(img)
+    return Vehicle(license_plate='BENCH', image='bench', reid_embedding=pack_vector(emb),
+                   color_hist=pack_vector(color))
+
+
+# Bộ ghi sau giả: bỏ mọi cập nhật khuôn mặt của benchmark (các dòng UserFace đã bị rollback)
+class _DiscardFaceWriter:
+    def submit(self, face_id, embedding=None, face_img=None):
+        pass
+
+
+# Trong lúc benchmark, lượt quét dùng bản sao chỉ mục khuôn mặt nạp từ DB và bộ ghi giả:
+# khuôn mặt tạo ra (bị rollback) không lọt vào chỉ mục dùng chung, không có cập nhật embedding/ảnh nào được ghi
+@contextmanager
+def isolated_face_state():
+    index = FaceIndex(dtype=getattr(settings, 'FACE_INDEX_DTYPE', 'float32'))
+    index.load_from_db()
+    original = detection_face.get_face_index, detection_face.face_writer
+    detection_face.get_face_index, detection_face.face_writer = (lambda: index), _DiscardFaceWriter()
+    post_save.disconnect(update_face_index, sender=UserFace)
+    try:
+        yield index
+    finally:
+        post_save.connect(update_face_index, sender=UserFace)
+        detection_face.get_face_index, detection_face.face_writer = original
+
+
+# HÀM: chạy toàn bộ lượt quét (giống /scan-plate/) rồi rollback DB; gọi trong isolated_face_state
+# để chỉ mục khuôn mặt và bộ ghi sau cũng không bị thay đổi
+def _run_pipeline(data, name, direction):
+    files = [SimpleUploadedFile(name, data, content_type='image/jpeg') for _ in range(3)]
+    with transaction.atomic():
+        run_scan(*files, direction)
+        transaction.set_rollback(True)
+
+
+class Command(BaseCommand):
+    help = "Đo độ trễ (p50/p95/p99), thông lượng theo số lời gọi đồng thời và RAM đỉnh của các bước nhận diện"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixtures', help="Thư mục ảnh chụp tại cổng (mặc định chỉ dùng services/plate.jpg)")
+        parser.add_argument('--synthetic', type=int, default=4, help="Số ảnh giả lập thêm vào bộ ảnh")
+        parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+        parser.add_argument('--repeat', type=int, default=10, help="Số lần đo mỗi ảnh")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--calls', type=int, default=20, help="Số lời gọi mỗi mức đồng thời")
+        parser.add_argument('--direction', choices=['IN', 'OUT'], default='IN')
+        parser.add_argument('--json', help="Ghi kết quả ra file JSON")
+        parser.add_argument('--baseline', help="File JSON của lần chạy trước để so sánh p50")
+
+    def handle(self, *args, **options):
+        images = [('plate.jpg', cv2.imread(BUNDLED_IMAGE))] if os.path.exists(BUNDLED_IMAGE) else []
+        if options['fixtures']:
+            images += load_fixtures(options['fixtures'])
+        images += synthetic_frames(options['synthetic'])
+        images = [(name, img) for name, img in images if img is not None]
+        if not images:
+            raise CommandError("Không có ảnh để benchmark")
+
+        rss_start = peak_rss_mb()
+        load_start = time.perf_counter()
+        errors = registry.warm_up()
+        if errors:
+            raise CommandError(f"Không load được model: {errors}")
+        load_s = time.perf_counter() - load_start
+        rss_models = peak_rss_mb()
+
+        encoded = [(name, _upload(name, img)) for name, img in images]
+        reference = _reference_vehicle(images[0][1])
+        features = [extract_vehicle_features(img) for _, img in images]
+        calls = {
+            'face': [lambda img=img: math_emb(img) for _, img in images],
+            'plate': [lambda img=img: detect_license_plates(img) for _, img in images],
+            'vehicle': [lambda img=img: detect_vehicle(img) for _, img in images],
+            'vehicle_features': [lambda img=img: extract_vehicle_features(img) for _, img in images],
+            'check_vehicle': [lambda f=f: check_vehicle(reference, f) for f in features],
+            'pipeline': [lambda d=d, n=n: _run_pipeline(d, n, options['direction']) for n, d in encoded],
+        }
+
+        self.stdout.write(f"{len(images)} ảnh, load model {load_s:.1f}s, RAM {rss_start:.0f} -> {rss_models:.0f} MB")
+        self.stdout.write(f"{'bước':<17} {'p50':>8} {'p95':>8} {'p99':>8} "
+                          + ' '.join(f"{f'{c} luồng/s':>10}" for c in options['concurrency']) + f" {'RSS MB':>8}")
+        results = {}
+        with isolated_face_state():
+            for stage in options['stages']:
+                fns = calls[stage]
+                samples = []
+                for fn in fns:
+                    samples += measure(fn, repeat=options['repeat'])
+                latency = summarize(samples)
+                throughput = {c: self._throughput(fns, c, options['calls']) for c in options['concurrency']}
+                results[stage] = dict(latency, throughput_per_s=throughput, peak_rss_mb=round(peak_rss_mb(), 1))
+                self.stdout.write(
+                    f"{stage:<17} {latency['p50_ms']:>8.1f} {latency['p95_ms']:>8.1f} {latency['p99_ms']:>8.1f} "
+                    + ' '.join(f"{throughput[c]:>10.2f}" for c in options['concurrency'])
+                    + f" {results[stage]['peak_rss_mb']:>8.0f}"
+                )
+
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+            'libraries': library_versions(),
+            'backends': registry.backends,
+            'images': [name for name, _ in images],
+            'model_load_s': round(load_s, 2),
+            'rss_mb': {'start': round(rss_start, 1), 'models_loaded': round(rss_models, 1), 'peak': round(peak_rss_mb(), 1)},
+            'stages': results,
+        }
+        if options['baseline']:
+            self._compare(options['baseline'], results)
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Đã ghi kết quả vào {options['json']}"))
+
+    # HÀM: số lời gọi hoàn thành mỗi giây khi có `workers` nơi gọi cùng lúc
+    @staticmethod
+    def _throughput(fns, workers, total):
+        def call(i):
+            try:
+                fns[i % len(fns)]()
+            finally:
+                connections.close_all()  # mỗi thread có kết nối DB riêng
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(call, range(total)))
+        return total / (time.perf_counter() - start)
+
+    def _compare(self, path, results):
+        with open(path) as f:
+            baseline = json.load(f).get('stages', {})
+        self.stdout.write(f"So với {path}:")
+        for stage, result in results.items():
+            old = baseline.get(stage)
+            if old:
+                change = (result['p50_ms'] - old['p50_ms']) / max(old['p50_ms'], 1e-6) * 100
+                self.stdout.write(f"  {stage:<17} p50 {old['p50_ms']:.1f} -> {result['p50_ms']:.1f} ms ({change:+.0f}%)")
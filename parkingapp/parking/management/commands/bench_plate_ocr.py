@@ -0,0 +1,122 @@
+import json
+from collections import defaultdict
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from parking.services.detection_plate import characters_to_text, LINE_THRESHOLD
+from ._bench import measure, summarize
+
+CHARSET = '0123456789ABCDEFGHKLMNPSTUVXYZ'
+
+
+# Cách cũ: .tolist() từng box, dict Python cho mỗi ký tự; cách gom dòng giống hệt characters_to_text
+def legacy_characters_to_text(xyxy, cls, conf, names, line_threshold=LINE_THRESHOLD):
+    char_data = []
+    for i in range(len(cls)):
+        cx1, cy1, cx2, cy2 = xyxy[i].tolist()
+        char_data.append({'char': names[int(cls[i])], 'conf': float(conf[i]),
+                          'cx': (cx1 + cx2) / 2, 'cy': (cy1 + cy2) / 2})
+    lines = defaultdict(list)
+    for char in char_data:
+        for key in lines:
+            if abs(char['cy'] - key) < line_threshold:
+                lines[key].append(char)
+                break
+        else:
+            lines[char['cy']].append(char)
+    plate_text = ""
+    for _, chars_in_line in sorted(lines.items(), key=lambda x: x[0]):
+        plate_text += ''.join([ch['char'] for ch in sorted(chars_in_line, key=lambda x: x['cx'])])
+    return plate_text
+
+
+# HÀM: sinh kết quả giả lập của model ký tự cho biển 2 dòng (xe máy) và 1 dòng (ô tô)
+def synthetic_outputs(count, seed=0):
+    rng = np.random.default_rng(seed)
+    outputs = []
+    for i in range(count):
+        rows = [4, 5] if i % 2 == 0 else [9]
+        boxes = []
+        for row, n in enumerate(rows):
+            for col in range(n):
+                x, y = 20 + col * 50 + rng.uniform(-3, 3), 30 + row * 110 + rng.uniform(-6, 6)
+                boxes.append([x, y, x + 40, y + 80])
+        perm = rng.permutation(len(boxes))  # model trả box không theo thứ tự
+        outputs.append({
+            'xyxy': np.asarray(boxes, dtype=np.float32)[perm],
+            'cls': rng.integers(0, len(CHARSET), len(boxes)),
+            'conf': rng.uniform(0.5, 1.0, len(boxes)).astype(np.float32),
+        })
+    return outputs, dict(enumerate(CHARSET))
+
+
+def load_outputs(path):
+    data = np.load(path)
+    names = {int(k): v for k, v in json.loads(str(data['names'])).items()}
+    count = int(data['count'])
+    return [{key: data[f'{key}_{i}'] for key in ('xyxy', 'cls', 'conf')} for i in range(count)], names
+
+
+# HÀM: chạy model thật trên ảnh và ghi lại kết quả của model ký tự để benchmark lặp lại được
+def record_outputs(images, path):
+    import cv2
+    from parking.services.detection_plate import load_models, crop_and_resize_plate, TARGET_WIDTH
+    model_plate, model_char = load_models()
+    arrays, count = {}, 0
+    for image_path in images:
+        img = cv2.imread(image_path)
+        if img is None:
+            raise CommandError(f"Không đọc được ảnh {image_path}")
+        for box in model_plate(img, verbose=False)[0].boxes.xyxy.cpu().numpy():
+            boxes = model_char(crop_and_resize_plate(img, box, TARGET_WIDTH), verbose=False)[0].boxes
+            arrays[f'xyxy_{count}'] = boxes.xyxy.cpu().numpy()
+            arrays[f'cls_{count}'] = boxes.cls.cpu().numpy().astype(int)
+            arrays[f'conf_{count}'] = boxes.conf.cpu().numpy()
+            count += 1
+    np.savez(path, count=count, names=json.dumps(model_char.names), **arrays)
+    return count
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark phần hậu xử lý OCR biển số: cách cũ (dict + vòng lặp) so với NumPy"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixture', help="File .npz chứa kết quả model đã ghi lại")
+        parser.add_argument('--record', nargs='+', metavar='IMAGE',
+                            help="Chạy model trên các ảnh này và ghi kết quả vào --fixture")
+        parser.add_argument('--plates', type=int, default=200, help="Số biển số giả lập khi không có fixture")
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        fixture = options['fixture']
+        if options['record']:
+            if not fixture:
+                raise CommandError("Cần --fixture để ghi kết quả")
+            count = record_outputs(options['record'], fixture)
+            self.stdout.write(f"Đã ghi {count} biển số vào {fixture}")
+
+        if fixture:
+            outputs, names = load_outputs(fixture)
+        else:
+            outputs, names = synthetic_outputs(options['plates'])
+
+        mismatches = sum(
+            legacy_characters_to_text(o['xyxy'], o['cls'], o['conf'], names) != characters_to_text(o['xyxy'], o['cls'], names)
+            for o in outputs
+        )
+
+        def run_legacy():
+            for o in outputs:
+                legacy_characters_to_text(o['xyxy'], o['cls'], o['conf'], names)
+
+        def run_vectorized():
+            for o in outputs:
+                characters_to_text(o['xyxy'], o['cls'], names)
+
+        legacy = summarize(measure(run_legacy, repeat=options['repeat']))
+        vectorized = summarize(measure(run_vectorized, repeat=options['repeat']))
+        per_plate = 1000 / max(len(outputs), 1)  # ms -> µs cho mỗi biển số
+        self.stdout.write(f"{len(outputs)} biển số, {mismatches} kết quả khác nhau giữa 2 cách")
+        self.stdout.write(f"{'':<12} {'p50 (µs/biển)':>15} {'p99 (µs/biển)':>15}")
+        for label, result in (('legacy', legacy), ('vectorized', vectorized)):
+            self.stdout.write(f"{label:<12} {result['p50_ms'] * per_plate:>15.1f} {result['p99_ms'] * per_plate:>15.1f}")
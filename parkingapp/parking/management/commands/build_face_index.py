@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from parking.services.face_index import FaceIndex, face_index, snapshot_path
+
+
+class Command(BaseCommand):
+    help = "Dựng lại chỉ mục khuôn mặt từ bảng UserFace và ghi snapshot để các worker memmap khi khởi động"
+
+    def handle(self, *args, **options):
+        path = snapshot_path()
+        if not path:
+            raise CommandError("Chưa cấu hình FACE_INDEX_PATH")
+        state = FaceIndex._db_state()
+        face_index.load_from_db()
+        face_index.save_snapshot(path, state)
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã ghi {len(face_index)} embedding ({face_index.nbytes / 2 ** 20:.1f} MB) vào {path}.npy"
+        ))
@@ -0,0 +1,112 @@
+import os
+import json
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from parking.services.backends import BACKENDS
+from parking.services.model_registry import build_registry
+from parking.services.detection_plate import read_plate, vehicle_class
+from ._bench import measure, summarize
+
+MODELS = ('plate', 'vehicle', 'face', 'reid')  # 'plate' = model biển số + model ký tự
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def _cosine(a, b):
+    a, b = np.asarray(a, dtype=np.float32).reshape(-1), np.asarray(b, dtype=np.float32).reshape(-1)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-12))
+
+
+def _reid_features(extractor, img):
+    features = extractor([cv2.cvtColor(img, cv2.COLOR_BGR2RGB)])
+    return features[0].cpu().numpy() if hasattr(features, 'cpu') else features[0]
+
+
+def _face_embedding(app, img):
+    faces = app.get(img)
+    return faces[0].normed_embedding if faces else None
+
+
+# Mỗi model: hàm chạy trên 1 ảnh + hàm so sánh kết quả với native (trả về điểm 0..1 hoặc None nếu bỏ qua)
+RUNNERS = {
+    'plate': (lambda reg, img: read_plate(img, reg.get('plate'), reg.get('char')),
+              lambda ref, got: float(ref == got)),
+    'vehicle': (lambda reg, img: vehicle_class(img, reg.get('vehicle')),
+                lambda ref, got: float(ref == got)),
+    'face': (lambda reg, img: _face_embedding(reg.get('face'), img),
+             lambda ref, got: None if ref is None or got is None else _cosine(ref, got)),
+    'reid': (lambda reg, img: _reid_features(reg.get('reid'), img),
+             lambda ref, got: _cosine(ref, got)),
+}
+
+
+def load_fixtures(path):
+    if not os.path.isdir(path):
+        raise CommandError(f"Không tìm thấy thư mục ảnh {path}")
+    images = []
+    for filename in sorted(os.listdir(path)):
+        if filename.lower().endswith(IMAGE_EXTS):
+            img = cv2.imread(os.path.join(path, filename))
+            if img is not None:
+                images.append((filename, img))
+    if not images:
+        raise CommandError(f"Thư mục {path} không có ảnh")
+    return images
+
+
+class Command(BaseCommand):
+    help = "So sánh độ chính xác và độ trễ giữa backend native và backend ONNX trên bộ ảnh mẫu"
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', help="Thư mục ảnh chụp tại cổng dùng làm bộ kiểm tra")
+        parser.add_argument('--backend', choices=[b for b in BACKENDS if b != 'native'], default='onnx')
+        parser.add_argument('--models', nargs='+', choices=MODELS, default=list(MODELS))
+        parser.add_argument('--repeat', type=int, default=5, help="Số lần đo mỗi ảnh")
+        parser.add_argument('--min-agreement', type=float, default=0.98,
+                            help="Ngưỡng tối thiểu (tỉ lệ khớp / cosine trung bình), dưới ngưỡng thì báo lỗi")
+        parser.add_argument('--json', help="Ghi báo cáo ra file JSON")
+
+    def handle(self, *args, **options):
+        images = load_fixtures(options['fixtures'])
+        backend = options['backend']
+        native = build_registry({name: 'native' for name in ('plate', 'char', 'vehicle', 'face', 'reid')})
+        candidate = build_registry({name: backend for name in ('plate', 'char', 'vehicle', 'face', 'reid')})
+
+        report, failed = {}, []
+        self.stdout.write(f"{len(images)} ảnh, backend {backend}")
+        self.stdout.write(f"{'model':<8} {'khớp':>7} {'native p50':>11} {backend + ' p50':>14} {'p95':>8} {'x':>6}")
+        for name in options['models']:
+            run, compare = RUNNERS[name]
+            scores, native_ms, candidate_ms, mismatches = [], [], [], []
+            for filename, img in images:
+                ref, got = run(native, img), run(candidate, img)
+                score = compare(ref, got)
+                if score is None:
+                    continue
+                scores.append(score)
+                if score < options['min_agreement']:
+                    mismatches.append({'image': filename, 'score': score})
+                native_ms += measure(lambda: run(native, img), repeat=options['repeat'])
+                candidate_ms += measure(lambda: run(candidate, img), repeat=options['repeat'])
+
+            if not scores:
+                self.stdout.write(f"{name:<8} bỏ qua (không có ảnh phù hợp)")
+                continue
+            agreement = sum(scores) / len(scores)
+            ref_stats, got_stats = summarize(native_ms), summarize(candidate_ms)
+            report[name] = {'agreement': agreement, 'images': len(scores), 'native': ref_stats,
+                            backend: got_stats, 'mismatches': mismatches}
+            self.stdout.write(
+                f"{name:<8} {agreement:>7.3f} {ref_stats['p50_ms']:>11.1f} {got_stats['p50_ms']:>14.1f} "
+                f"{got_stats['p95_ms']:>8.1f} {ref_stats['p50_ms'] / max(got_stats['p50_ms'], 1e-6):>6.2f}"
+            )
+            if agreement < options['min_agreement']:
+                failed.append(name)
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({'backend': backend, 'models': report}, f, indent=2, ensure_ascii=False)
+        if failed:
+            raise CommandError(f"Backend {backend} lệch so với native: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS("Các model đều đạt ngưỡng độ chính xác"))
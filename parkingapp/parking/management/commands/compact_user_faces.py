@@ -0,0 +1,105 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from parking.models import UserFace, ParkingLog
+from parking.services.face_index import to_unit_vector, EMBEDDING_DIM
+from parking.services.face_writer import face_writer
+from parking.services.helpers import pack_vector
+
+SCORE_BUDGET = 2 ** 26  # số phần tử tối đa của 1 khối ma trận điểm (~256 MB float32)
+
+
+# HÀM: tìm các nhóm khuôn mặt trùng nhau (cosine >= threshold) bằng nhân ma trận theo khối.
+# Liên kết đầy đủ (complete linkage): khuôn mặt chỉ vào nhóm khi giống MỌI thành viên, kể cả bản được giữ
+# (cũ nhất) -> A≈B, B≈C không kéo A và C của 2 người khác nhau vào cùng nhóm
+def find_clusters(matrix, threshold, block=None):
+    n = len(matrix)
+    block = block or max(1, min(n, SCORE_BUDGET // max(n, 1)))
+    neighbors = {}
+    for start in range(0, n, block):
+        scores = matrix[start:start + block] @ matrix.T
+        rows, cols = np.nonzero(scores >= threshold)
+        rows += start
+        for a, b in zip(rows[rows != cols].tolist(), cols[rows != cols].tolist()):
+            neighbors.setdefault(a, set()).add(b)
+
+    clusters, assigned = [], set()
+    for keep in sorted(neighbors):  # bản cũ nhất chưa thuộc nhóm nào làm gốc
+        if keep in assigned:
+            continue
+        members = [keep]
+        for i in sorted(neighbors[keep]):
+            if i not in assigned and all(m in neighbors[i] for m in members):
+                members.append(i)
+        if len(members) > 1:
+            assigned.update(members)
+            clusters.append(members)
+    return clusters
+
+
+def load_faces():
+    ids, vectors = [], []
+    for face_id, embedding in UserFace.objects.order_by('id').values_list('id', 'embedding').iterator(chunk_size=2000):
+        vec = to_unit_vector(embedding)
+        if vec is not None:
+            ids.append(face_id)
+            vectors.append(vec)
+    matrix = np.vstack(vectors) if vectors else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    return np.asarray(ids, dtype=np.int64), matrix
+
+
+# HÀM: gộp 1 nhóm vào khuôn mặt cũ nhất: embedding trung bình, chuyển ParkingLog, xóa bản trùng
+def merge_cluster(keep_id, duplicate_ids):
+    faces = UserFace.objects.select_for_update().in_bulk([keep_id] + duplicate_ids)
+    keep = faces.get(keep_id)
+    if keep is None:
+        return 0
+    duplicates = [faces[i] for i in duplicate_ids if i in faces]
+    vectors = [to_unit_vector(face.embedding) for face in [keep] + duplicates]
+    mean = np.mean([vec for vec in vectors if vec is not None], axis=0)
+    # chuẩn hóa lại: chỉ mục/update_parking so bằng tích vô hướng, trung bình các vector đơn vị có norm < 1
+    keep.embedding = pack_vector(mean / np.linalg.norm(mean))
+    if not keep.face_img:
+        keep.face_img = next((face.face_img for face in reversed(duplicates) if face.face_img), None)
+    keep.save()
+
+    ParkingLog.objects.filter(user_face_id__in=duplicate_ids).update(user_face_id=keep_id)
+    _, deleted = UserFace.objects.filter(id__in=[face.id for face in duplicates]).delete()
+    return deleted.get(UserFace._meta.label, 0)
+
+
+class Command(BaseCommand):
+    help = "Gộp các UserFace gần trùng nhau (cùng 1 người) và chuyển ParkingLog về bản được giữ lại"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.7,
+                            help="Cosine tối thiểu giữa mọi cặp trong nhóm để coi là cùng người "
+                                 "(cao hơn ngưỡng check-in 0.6)")
+        parser.add_argument('--block', type=int, help="Số dòng mỗi khối nhân ma trận")
+        parser.add_argument('--dry-run', action='store_true', help="Chỉ báo cáo, không ghi DB")
+
+    def handle(self, *args, **options):
+        face_writer.flush()  # ghi nốt cập nhật đang chờ để embedding trong DB là mới nhất
+        total = UserFace.objects.count()
+        ids, matrix = load_faces()
+        clusters = find_clusters(matrix, options['threshold'], options['block'])
+        duplicates = sum(len(members) - 1 for members in clusters)
+
+        self.stdout.write(f"{total} khuôn mặt ({len(ids)} embedding hợp lệ), "
+                          f"{len(clusters)} nhóm trùng, {duplicates} bản ghi có thể gộp")
+        if options['dry_run'] or not clusters:
+            return
+
+        deleted = 0
+        for members in clusters:
+            face_ids = ids[members].tolist()
+            with transaction.atomic():
+                deleted += merge_cluster(face_ids[0], face_ids[1:])
+
+        remaining = UserFace.objects.count()
+        saved_mb = deleted * EMBEDDING_DIM * 4 / 2 ** 20
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã gộp {deleted} khuôn mặt: {total} -> {remaining} "
+            f"(giảm {deleted / max(total, 1):.1%}, chỉ mục nhỏ hơn ~{saved_mb:.1f} MB)"
+        ))
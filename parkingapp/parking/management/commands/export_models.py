@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from parking.services import backends
+from parking.services.model_registry import (
+    MODEL_PLATE_PATH, MODEL_CHAR_PATH, MODEL_VEHICLE_PATH, FACE_MODEL_NAME, REID_MODEL_NAME,
+)
+
+YOLO_WEIGHTS = {'plate': MODEL_PLATE_PATH, 'char': MODEL_CHAR_PATH, 'vehicle': MODEL_VEHICLE_PATH}
+
+
+class Command(BaseCommand):
+    help = "Xuất các model sang ONNX (và bản lượng tử hóa int8) vào MODEL_ONNX_DIR"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', default=['plate', 'char', 'vehicle', 'face', 'reid'],
+                            choices=['plate', 'char', 'vehicle', 'face', 'reid'])
+        parser.add_argument('--no-int8', action='store_true', help="Không tạo bản lượng tử hóa int8")
+
+    def handle(self, *args, **options):
+        int8 = not options['no_int8']
+        for name in options['models']:
+            if name in YOLO_WEIGHTS:
+                path = backends.export_yolo(name, YOLO_WEIGHTS[name], int8=int8)
+            elif name == 'reid':
+                path = backends.export_reid(name, REID_MODEL_NAME, int8=int8)
+            elif int8:
+                # insightface vốn đã là ONNX, chỉ cần bản int8
+                path = backends.export_face_int8(FACE_MODEL_NAME)
+            else:
+                continue
+            self.stdout.write(self.style.SUCCESS(f"{name}: {path}"))
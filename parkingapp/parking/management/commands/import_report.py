@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+HEAVY_MODULES = ['torch', 'torchvision', 'torchreid', 'ultralytics', 'insightface', 'onnxruntime']
+
+# Chạy trong process con sạch để đo đúng thời gian import + RAM của 1 worker mới
+SNIPPET = """
+import os, sys, json, time, resource
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'parkingapp.settings')
+import django
+django.setup()
+import parking.views, parking.serializers
+imported = time.perf_counter() - start
+errors = {}
+if os.environ.get('IMPORT_REPORT_WARMUP') == '1':
+    from parking.services.model_registry import registry
+    errors = registry.warm_up()
+print(json.dumps({
+    'import_s': imported,
+    'total_s': time.perf_counter() - start,
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'heavy_modules': [m for m in HEAVY if m in sys.modules],
+    'errors': errors,
+}))
+"""
+
+
+def _run(ml_enabled, warm_up, importtime=False):
+    env = dict(os.environ, ML_ENABLED='1' if ml_enabled else '0', IMPORT_REPORT_WARMUP='1' if warm_up else '0')
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', f"HEAVY = {HEAVY_MODULES!r}\n" + SNIPPET]
+    proc = subprocess.run(cmd, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "process lỗi")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+# HÀM: đọc output của `python -X importtime`, cộng dồn thời gian theo package gốc
+def _top_packages(stderr, limit):
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line.split(':', 1)[1].split('|')
+        root = name.strip().split('.')[0]
+        totals[root] = totals.get(root, 0) + int(self_us)
+    return sorted(totals.items(), key=lambda x: -x[1])[:limit]
+
+
+class Command(BaseCommand):
+    help = "Đo thời gian import và RAM của worker API-only so với worker load đủ model AI"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help="Số package import chậm nhất cần liệt kê")
+        parser.add_argument('--skip-warmup', action='store_true', help="Không đo chế độ load sẵn model")
+
+    def handle(self, *args, **options):
+        modes = [('api-only (ML_ENABLED=0)', False, False), ('scan, lazy (ML_ENABLED=1)', True, False)]
+        if not options['skip_warmup']:
+            modes.append(('scan + warm_up()', True, True))
+
+        self.stdout.write(f"{'mode':<28} {'import (s)':>10} {'total (s)':>10} {'peak RSS (MB)':>14}  heavy modules")
+        for label, ml_enabled, warm_up in modes:
+            try:
+                result, _ = _run(ml_enabled, warm_up)
+            except RuntimeError as e:
+                self.stdout.write(f"{label:<28} lỗi: {e}")
+                continue
+            self.stdout.write(
+                f"{label:<28} {result['import_s']:>10.2f} {result['total_s']:>10.2f} "
+                f"{result['peak_rss_mb']:>14.0f}  {', '.join(result['heavy_modules']) or '-'}"
+            )
+            for name, error in result['errors'].items():
+                self.stdout.write(self.style.WARNING(f"    {name}: {error}"))
+
+        _, stderr = _run(False, False, importtime=True)
+        self.stdout.write("\nPackage import chậm nhất (api-only, self time):")
+        for name, us in _top_packages(stderr, options['top']):
+            self.stdout.write(f"  {name:<30} {us / 1000:>8.1f} ms")
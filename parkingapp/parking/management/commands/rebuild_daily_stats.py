@@ -0,0 +1,50 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from parking.models import DailyParkingStat
+from parking.services.stats import STAT_FIELDS, compute_daily_stats, stored_daily_stats, stats_range
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise CommandError(f"Ngày không hợp lệ: {value} (định dạng YYYY-MM-DD)")
+
+
+# HÀM: so 2 bộ số liệu, trả về các khóa (ngày, loại xe, user_id) bị lệch; dòng toàn 0 coi như không có
+def diff_stats(expected: dict, stored: dict) -> list:
+    zero = dict.fromkeys(STAT_FIELDS, 0)
+    return sorted((key for key in expected.keys() | stored.keys()
+                   if expected.get(key, zero) != stored.get(key, zero)), key=str)
+
+
+class Command(BaseCommand):
+    help = "Tính lại bảng thống kê theo ngày (DailyParkingStat) từ ParkingLog: lấp dữ liệu cũ hoặc sửa số liệu lệch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help="Từ ngày (YYYY-MM-DD), mặc định toàn bộ")
+        parser.add_argument('--to', dest='date_to', help="Đến ngày (YYYY-MM-DD), tính cả ngày này")
+        parser.add_argument('--check', action='store_true', help="Chỉ báo các dòng bị lệch, không ghi")
+
+    def handle(self, *args, **options):
+        date_from, date_to = _parse_date(options['date_from']), _parse_date(options['date_to'])
+
+        with transaction.atomic():
+            expected = compute_daily_stats(date_from, date_to)
+            stored = stored_daily_stats(date_from, date_to)
+            mismatched = diff_stats(expected, stored)
+            for key in mismatched[:20]:
+                self.stdout.write(f"Lệch {key}: lưu {stored.get(key)} / đúng {expected.get(key)}")
+
+            if options['check']:
+                self.stdout.write(f"{len(mismatched)} dòng lệch trên {len(expected)} dòng")
+                return
+
+            stats_range(date_from, date_to).delete()
+            DailyParkingStat.objects.bulk_create([
+                DailyParkingStat(day=day, vehicle_type=vehicle_type, user_id=user_id, **values)
+                for (day, vehicle_type, user_id), values in expected.items()
+            ], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi {len(expected)} dòng thống kê, sửa {len(mismatched)} dòng lệch"))
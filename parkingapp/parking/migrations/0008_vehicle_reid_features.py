@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0007_remove_userface_extra_embeddings_userface_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='color_hist',
+            field=models.BinaryField(blank=True, editable=False, help_text='Histogram màu HSV của ảnh xe (float32)', null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='reid_embedding',
+            field=models.BinaryField(blank=True, editable=False, help_text='Embedding OSNet của ảnh xe (float32)', null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:05
+
+import re
+from django.db import migrations, models
+
+
+def fill_plate_normalized(apps, schema_editor):
+    Vehicle = apps.get_model('parking', 'Vehicle')
+    for vehicle in Vehicle.objects.only('id', 'license_plate').iterator():
+        normalized = re.sub(r'[^A-Z0-9]', '', (vehicle.license_plate or '').upper())
+        Vehicle.objects.filter(id=vehicle.id).update(plate_normalized=normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0008_vehicle_reid_features'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='plate_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='Biển số đã chuẩn hóa để tra cứu', max_length=15),
+        ),
+        migrations.RunPython(fill_plate_normalized, migrations.RunPython.noop),
+    ]
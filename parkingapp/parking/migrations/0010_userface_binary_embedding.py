@@ -0,0 +1,53 @@
+# Generated by Django 4.2.23 on 2026-10-18 11:20
+
+import struct
+from django.db import migrations, models
+
+
+def json_to_blob(apps, schema_editor):
+    UserFace = apps.get_model('parking', 'UserFace')
+    for face in UserFace.objects.only('id', 'embedding').iterator(chunk_size=2000):
+        try:
+            values = [float(x) for x in face.embedding]
+            blob = struct.pack(f'<{len(values)}f', *values)
+        except (TypeError, ValueError):
+            blob = b''  # embedding hỏng -> chỉ mục khuôn mặt sẽ bỏ qua
+        UserFace.objects.filter(id=face.id).update(embedding_bin=blob)
+
+
+def blob_to_json(apps, schema_editor):
+    UserFace = apps.get_model('parking', 'UserFace')
+    for face in UserFace.objects.only('id', 'embedding_bin').iterator(chunk_size=2000):
+        blob = bytes(face.embedding_bin or b'')
+        values = list(struct.unpack(f'<{len(blob) // 4}f', blob[:len(blob) // 4 * 4]))
+        UserFace.objects.filter(id=face.id).update(embedding=values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0009_vehicle_plate_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userface',
+            name='embedding_bin',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(json_to_blob, blob_to_json),
+        migrations.RemoveField(
+            model_name='userface',
+            name='embedding',
+        ),
+        migrations.RenameField(
+            model_name='userface',
+            old_name='embedding_bin',
+            new_name='embedding',
+        ),
+        migrations.AlterField(
+            model_name='userface',
+            name='embedding',
+            field=models.BinaryField(help_text='embedding trung bình (float32 little-endian)'),
+        ),
+    ]
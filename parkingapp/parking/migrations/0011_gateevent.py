@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0010_userface_binary_embedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GateEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active', models.BooleanField(default=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('event_id', models.CharField(help_text='Mã sự kiện do máy cổng sinh (chống xử lý trùng)', max_length=64, unique=True)),
+                ('direction', models.CharField(choices=[('IN', 'Đang gửi'), ('OUT', 'Đã lấy xe')], max_length=4)),
+                ('captured_at', models.DateTimeField(blank=True, help_text='Thời điểm chụp ảnh tại cổng', null=True)),
+                ('ok', models.BooleanField(blank=True, help_text='Kết quả xử lý, rỗng = đang xử lý', null=True)),
+                ('msg', models.CharField(blank=True, default='', max_length=255)),
+                ('plate_text', models.CharField(blank=True, default='', max_length=50)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'abstract': False,
+            },
+        ),
+    ]
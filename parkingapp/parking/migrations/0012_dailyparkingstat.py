@@ -0,0 +1,62 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+import django.db.models.deletion
+
+
+# Lấp bảng thống kê từ các lượt gửi đã có (sau này dùng lệnh rebuild_daily_stats để sửa số liệu lệch)
+def backfill_daily_stats(apps, schema_editor):
+    ParkingLog = apps.get_model('parking', 'ParkingLog')
+    DailyParkingStat = apps.get_model('parking', 'DailyParkingStat')
+    out = Q(status='OUT')
+    rows = (ParkingLog.objects.annotate(day=TruncDate('created_date'))
+            .values('day', 'fee_rule__fee_type', 'user_id')
+            .annotate(entries=Count('id'),
+                      exits=Count('id', filter=out),
+                      revenue=Coalesce(Sum('fee', filter=out), 0),
+                      minutes=Coalesce(Sum('duration_minutes', filter=out), 0))
+            .order_by())
+    DailyParkingStat.objects.bulk_create([
+        DailyParkingStat(day=row['day'], vehicle_type=row['fee_rule__fee_type'], user_id=row['user_id'],
+                         entries=row['entries'], exits=row['exits'], revenue=row['revenue'], minutes=row['minutes'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('parking', '0011_gateevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyParkingStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active', models.BooleanField(default=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('day', models.DateField()),
+                ('vehicle_type', models.CharField(choices=[('MOTORCYCLE', 'Xe máy'), ('CAR', 'Ô tô')], max_length=10)),
+                ('entries', models.PositiveIntegerField(default=0, help_text='Số lượt gửi tạo trong ngày')),
+                ('exits', models.PositiveIntegerField(default=0, help_text='Số lượt (tạo trong ngày) đã lấy xe')),
+                ('revenue', models.PositiveIntegerField(default=0, help_text='Tổng phí các lượt đã lấy xe (VNĐ)')),
+                ('minutes', models.PositiveIntegerField(default=0, help_text='Tổng thời gian gửi các lượt đã lấy xe (phút)')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyparkingstat',
+            constraint=models.UniqueConstraint(fields=('day', 'vehicle_type', 'user'), name='uniq_daily_stat_day_type_user'),
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
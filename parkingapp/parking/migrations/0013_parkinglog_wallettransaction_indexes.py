@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0012_dailyparkingstat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parkinglog',
+            index=models.Index(fields=['status', 'created_date'], name='parklog_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkinglog',
+            index=models.Index(fields=['user', 'status', 'created_date'], name='parklog_user_status_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkinglog',
+            index=models.Index(fields=['vehicle', 'status'], name='parklog_vehicle_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkinglog',
+            index=models.Index(fields=['created_date'], name='parklog_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['wallet', 'active', 'id'], name='wallettx_wallet_active_id_idx'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import re
 from cloudinary.models import CloudinaryField
 from django.contrib.auth.models import AbstractUser
 from django.db import models
@@ -35,6 +36,11 @@ class UserRole(models.TextChoices):
     CUSTOMER = "CUSTOMER", "Khách hàng"
 
 
+# Chuẩn hóa biển số: bỏ dấu gạch, chấm, khoảng trắng và viết hoa ("30a-123.45" -> "30A12345")
+def normalize_plate(text) -> str:
+    return re.sub(r'[^A-Z0-9]', '', (text or '').upper())
+
+
 class BaseModel(models.Model):
     active = models.BooleanField(default=True)
     created_date = models.DateTimeField(auto_now_add=True)
@@ -60,17 +66,30 @@ class Vehicle(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="vehicles")
     name = models.CharField(max_length=255, help_text="Tên/đời xe – ví dụ: Yamaha Sirius")
     license_plate = models.CharField(max_length=15, unique=True, help_text="Biển số xe")
+    plate_normalized = models.CharField(max_length=15, db_index=True, editable=False, default='',
+                                        help_text="Biển số đã chuẩn hóa để tra cứu")
     image = CloudinaryField(null=True, blank=True, help_text="Ảnh xe")
     vehicle_type = models.CharField(max_length=20, choices=FeeType.choices)
     is_approved = models.BooleanField(default=False, help_text="Đã được admin duyệt chưa")
+    reid_embedding = models.BinaryField(null=True, blank=True, editable=False,
+                                        help_text="Embedding OSNet của ảnh xe (float32)")
+    color_hist = models.BinaryField(null=True, blank=True, editable=False,
+                                    help_text="Histogram màu HSV của ảnh xe (float32)")
 
     def __str__(self):
         return self.license_plate
 
+    def save(self, *args, **kwargs):
+        self.plate_normalized = normalize_plate(self.license_plate)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'license_plate' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'plate_normalized'}
+        super().save(*args, **kwargs)
+
 
 class UserFace(BaseModel):
     face_img = CloudinaryField(null=True, blank=True, help_text="Ảnh khuôn mặt")
-    embedding = models.JSONField(help_text="embedding trung bình")
+    embedding = models.BinaryField(help_text="embedding trung bình (float32 little-endian)")
 
     def __str__(self):
         return f"{self.id}"
@@ -107,10 +126,39 @@ class ParkingLog(BaseModel):
     user_face = models.ForeignKey(UserFace, on_delete=models.SET_NULL, related_name="parking_logs", null=True,
                                   blank=True)
 
+    # index theo các truy vấn thực tế: lọc khoảng ngày, xe đang trong bãi, lịch sử của 1 người dùng
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['status', 'created_date'], name='parklog_status_created_idx'),
+            models.Index(fields=['user', 'status', 'created_date'], name='parklog_user_status_crt_idx'),
+            models.Index(fields=['vehicle', 'status'], name='parklog_vehicle_status_idx'),
+            models.Index(fields=['created_date'], name='parklog_created_idx'),
+        ]
+
     def __str__(self):
         return f"Log {self.id} - {self.vehicle.license_plate}"
 
 
+# Bảng tổng hợp theo ngày (ngày tạo lượt gửi) x loại xe x người dùng, cập nhật cùng transaction với lượt vào/ra.
+# Các API thống kê đọc bảng này thay vì quét ParkingLog; lệch số liệu thì chạy rebuild_daily_stats
+class DailyParkingStat(BaseModel):
+    day = models.DateField()
+    vehicle_type = models.CharField(max_length=10, choices=FeeType.choices)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_stats")
+    entries = models.PositiveIntegerField(default=0, help_text="Số lượt gửi tạo trong ngày")
+    exits = models.PositiveIntegerField(default=0, help_text="Số lượt (tạo trong ngày) đã lấy xe")
+    revenue = models.PositiveIntegerField(default=0, help_text="Tổng phí các lượt đã lấy xe (VNĐ)")
+    minutes = models.PositiveIntegerField(default=0, help_text="Tổng thời gian gửi các lượt đã lấy xe (phút)")
+
+    class Meta(BaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'vehicle_type', 'user'], name='uniq_daily_stat_day_type_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.vehicle_type} - {self.user_id}"
+
+
 class Wallet(BaseModel):
     user = models.OneToOneField(User, on_delete=models.PROTECT, related_name="wallet")
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
@@ -159,5 +207,23 @@ class WalletTransaction(BaseModel):
     transaction_type = models.CharField(max_length=10, choices=TransactionType.choices)
     description = models.TextField(blank=True)
 
+    # lịch sử giao dịch của ví: lọc (wallet, active), sắp xếp theo -id
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['wallet', 'active', 'id'], name='wallettx_wallet_active_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} {self.amount}vnđ - {self.created_date.strftime('%d-%m-%Y %H:%M:%S')}"
+
+
+class GateEvent(BaseModel):
+    event_id = models.CharField(max_length=64, unique=True, help_text="Mã sự kiện do máy cổng sinh (chống xử lý trùng)")
+    direction = models.CharField(max_length=4, choices=ParkingStatus.choices)
+    captured_at = models.DateTimeField(null=True, blank=True, help_text="Thời điểm chụp ảnh tại cổng")
+    ok = models.BooleanField(null=True, blank=True, help_text="Kết quả xử lý, rỗng = đang xử lý")
+    msg = models.CharField(max_length=255, blank=True, default='')
+    plate_text = models.CharField(max_length=50, blank=True, default='')
+
+    def __str__(self):
+        return f"{self.event_id} - {self.direction}"
@@ -1,4 +1,3 @@
-import os
 from rest_framework import serializers
 from datetime import date, datetime
 
@@ -11,8 +10,10 @@ from .models import (User,
                      WalletTransaction,
                      UserFace)
 
-from .services.helpers import upload_image
+from .services.helpers import decode_image
 from .services.detection_plate import detect_vehicle
+from .services.detection_vehicle import vehicle_feature_fields
+from .services.model_registry import ModelsDisabled
 
 
 class ImageFieldMixin:
@@ -82,19 +83,34 @@ class VehicleSerializer(serializers.ModelSerializer, ImageFieldMixin, UserFullNa
     def create(self, validated_data):
         user = self.context['request'].user
         image_file = validated_data.get('image')
-        save_path = upload_image(image_file, 'vehicle', 'vehicles')
-
         try:
-            vehicle_type = detect_vehicle(save_path)
-            if not vehicle_type:
-                raise serializers.ValidationError({'image': 'Không nhận diện được loại xe'})
-
-            validated_data['user'] = user
-            validated_data['vehicle_type'] = vehicle_type
-            return super().create(validated_data)
-        finally:
-            if os.path.exists(save_path):
-                os.remove(save_path)
+            img = decode_image(image_file)
+        except (AttributeError, ValueError):
+            raise serializers.ValidationError({'image': 'Ảnh xe không hợp lệ'})
+
+        vehicle_type = detect_vehicle(img)
+        if not vehicle_type:
+            raise serializers.ValidationError({'image': 'Không nhận diện được loại xe'})
+
+        validated_data['user'] = user
+        validated_data['vehicle_type'] = vehicle_type
+        # tính sẵn đặc trưng để lúc check-in không phải tải lại ảnh xe
+        validated_data.update(vehicle_feature_fields(img))
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        image_file = validated_data.get('image')
+        if image_file is not None and hasattr(image_file, 'read'):
+            try:
+                validated_data.update(vehicle_feature_fields(decode_image(image_file)))
+            except ValueError:
+                raise serializers.ValidationError({'image': 'Ảnh xe không hợp lệ'})
+            except ModelsDisabled:
+                # worker API-only: xóa đặc trưng cũ, lệnh backfill_vehicle_features sẽ tính lại
+                validated_data.update(reid_embedding=None, color_hist=None)
+        elif 'image' in validated_data:
+            validated_data.update(reid_embedding=None, color_hist=None)
+        return super().update(instance, validated_data)
 
 
 class FeeRuleSerializer(serializers.ModelSerializer):
@@ -0,0 +1,153 @@
+import os
+import shutil
+import numpy as np
+from django.conf import settings
+
+# CẤU HÌNH
+BACKENDS = ('native', 'onnx', 'onnx-int8')
+REID_INPUT_SIZE = (256, 128)  # (cao, rộng) ảnh đầu vào OSNet, giống FeatureExtractor của torchreid
+REID_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+REID_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+FACE_RECOGNITION_PREFIX = 'w600k'  # model nhận diện trong bộ buffalo_l, chỉ model này được lượng tử hóa
+
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend '{backend}' không hợp lệ, chọn một trong {BACKENDS}")
+    return backend
+
+
+def onnx_dir():
+    return getattr(settings, 'MODEL_ONNX_DIR', os.path.join(settings.BASE_DIR, 'parking/runs/onnx'))
+
+
+# HÀM: đường dẫn file ONNX của model theo backend (onnx: fp32, onnx-int8: lượng tử hóa động)
+def onnx_path(name, backend):
+    suffix = '.int8.onnx' if backend == 'onnx-int8' else '.onnx'
+    return os.path.join(onnx_dir(), f"{name}{suffix}")
+
+
+def face_model_name(base_name, backend):
+    return f"{base_name}_int8" if backend == 'onnx-int8' else base_name
+
+
+def _require(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Chưa có {path}, hãy chạy: python manage.py export_models")
+    return path
+
+
+def _session_options():
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    threads = getattr(settings, 'SCAN_INTRAOP_THREADS', 0)
+    if threads > 0:
+        options.intra_op_num_threads = threads
+    return options
+
+
+# ----------  Xuất model  ----------
+# HÀM: lượng tử hóa động trọng số sang int8 (giữ nguyên metadata, vd danh sách lớp của YOLO)
+def quantize_int8(src, dst):
+    import onnx
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+    source, quantized = onnx.load(src), onnx.load(dst)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, dst)
+    return dst
+
+
+def export_yolo(name, weights, int8=False):
+    from ultralytics import YOLO
+    os.makedirs(onnx_dir(), exist_ok=True)
+    exported = YOLO(weights).export(format='onnx', dynamic=True, simplify=True)
+    path = onnx_path(name, 'onnx')
+    shutil.move(exported, path)
+    if int8:
+        quantize_int8(path, onnx_path(name, 'onnx-int8'))
+    return path
+
+
+def export_reid(name, model_name, int8=False):
+    import torch
+    from torchreid.reid.utils.feature_extractor import FeatureExtractor
+    os.makedirs(onnx_dir(), exist_ok=True)
+    model = FeatureExtractor(model_name=model_name, device='cpu').model.eval()
+    path = onnx_path(name, 'onnx')
+    # opset 14: torch==1.11 (requirements.txt) chưa xuất được opset mới hơn 15
+    torch.onnx.export(
+        model, torch.zeros(1, 3, *REID_INPUT_SIZE), path,
+        input_names=['images'], output_names=['features'],
+        dynamic_axes={'images': {0: 'batch'}, 'features': {0: 'batch'}}, opset_version=14,
+    )
+    if int8:
+        quantize_int8(path, onnx_path(name, 'onnx-int8'))
+    return path
+
+
+# HÀM: insightface đã chạy bằng onnxruntime -> chỉ tạo bản sao bộ model với model nhận diện int8
+def export_face_int8(model_name):
+    from insightface.app import FaceAnalysis
+    FaceAnalysis(name=model_name, providers=['CPUExecutionProvider'])  # tải bộ model nếu chưa có
+    src_dir = os.path.join(os.path.expanduser('~/.insightface'), 'models', model_name)
+    dst_dir = os.path.join(onnx_dir(), 'models', face_model_name(model_name, 'onnx-int8'))
+    os.makedirs(dst_dir, exist_ok=True)
+    for filename in os.listdir(src_dir):
+        if not filename.endswith('.onnx'):
+            continue
+        src, dst = os.path.join(src_dir, filename), os.path.join(dst_dir, filename)
+        if filename.startswith(FACE_RECOGNITION_PREFIX):
+            quantize_int8(src, dst)
+        else:
+            shutil.copyfile(src, dst)
+    return dst_dir
+
+
+# ----------  Load model theo backend  ----------
+def load_yolo(name, weights, backend):
+    path = weights if check_backend(backend) == 'native' else _require(onnx_path(name, backend))
+    from ultralytics import YOLO
+    if backend == 'native':
+        return YOLO(path)
+    # ultralytics chạy file .onnx qua onnxruntime, kết quả trả về giữ nguyên dạng Results
+    return YOLO(path, task='detect')
+
+
+def load_face(model_name, backend):
+    from insightface.app import FaceAnalysis
+    if check_backend(backend) == 'onnx-int8':
+        name = face_model_name(model_name, backend)
+        _require(os.path.join(onnx_dir(), 'models', name))
+        app = FaceAnalysis(name=name, root=onnx_dir(), providers=['CPUExecutionProvider'])
+    else:
+        app = FaceAnalysis(name=model_name)  # bộ model đã train gồm detector face và recognizer face
+    app.prepare(ctx_id=0, det_size=(640, 640))
+    return app
+
+
+def load_reid(name, model_name, backend):
+    if check_backend(backend) == 'native':
+        from torchreid.reid.utils.feature_extractor import FeatureExtractor
+        return FeatureExtractor(model_name=model_name, device='cpu')
+    return OnnxFeatureExtractor(_require(onnx_path(name, backend)))
+
+
+# Thay thế FeatureExtractor của torchreid: nhận list ảnh RGB (numpy), trả về ma trận đặc trưng numpy
+class OnnxFeatureExtractor:
+    def __init__(self, path):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(path, _session_options(), providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def preprocess(self, images):
+        import cv2
+        height, width = REID_INPUT_SIZE
+        batch = np.stack([cv2.resize(img, (width, height), interpolation=cv2.INTER_LINEAR) for img in images])
+        batch = (batch.astype(np.float32) / 255 - REID_MEAN) / REID_STD
+        return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+    def __call__(self, images):
+        return self.session.run(None, {self.input_name: self.preprocess(images)})[0]
@@ -0,0 +1,67 @@
+import time
+import threading
+import cv2
+
+
+# Mỗi camera có 1 thread đọc liên tục, chỉ giữ khung hình mới nhất (có khóa).
+# read() trả về (ret, frame) giống cv2.VideoCapture nhưng không chờ camera và không lấy khung cũ trong buffer.
+class CameraStream:
+    def __init__(self, source, name=None):
+        self.name = name or f"camera-{source}"
+        self.cap = cv2.VideoCapture(source)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # driver hỗ trợ thì chỉ giữ 1 khung trong buffer
+        self._lock = threading.Lock()
+        self._frame = None
+        self._seq = 0  # tăng mỗi khi có khung mới
+        self._stamp = 0.0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(0.05)
+                continue
+            with self._lock:
+                self._frame, self._seq, self._stamp = frame, self._seq + 1, time.monotonic()
+
+    # Khung hình không bị sửa sau khi đưa ra (mỗi lần đọc camera tạo mảng mới) nên không cần copy
+    def read(self):
+        with self._lock:
+            frame = self._frame
+        return frame is not None, frame
+
+    # HÀM: (số thứ tự, khung hình) mới nhất, để giao diện bỏ qua khi chưa có khung mới
+    def latest(self):
+        with self._lock:
+            return self._seq, self._frame
+
+    # HÀM: lấy `count` khung hình mới liên tiếp (chụp loạt), tối đa `timeout` giây
+    def burst(self, count=5, timeout=0.6):
+        frames, last_seq = [], None
+        deadline = time.monotonic() + timeout
+        while len(frames) < count and time.monotonic() < deadline:
+            seq, frame = self.latest()
+            if frame is not None and seq != last_seq:
+                frames.append(frame)
+                last_seq = seq
+            else:
+                time.sleep(0.005)
+        return frames
+
+    def age(self):
+        with self._lock:
+            return time.monotonic() - self._stamp if self._frame is not None else None
+
+    def release(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self.cap.release()
@@ -1,13 +1,11 @@
-import cv2
-from insightface.app import FaceAnalysis
 import numpy as np
-from django.db import transaction
-from ..models import UserFace
-import requests
-
-
-app = FaceAnalysis(name="buffalo_l")  # bộ model đã train gồm detector face và recognizer face
-app.prepare(ctx_id=0, det_size=(640, 640))
+from django.conf import settings
+from django.db.models import Q
+from ..models import UserFace, ParkingLog
+from .face_index import get_face_index
+from .face_writer import face_writer
+from .model_registry import registry
+from .helpers import load_image, pack_vector
 
 
 # hàm so sách embedding
@@ -19,31 +17,65 @@ def cosine_similarity(vec1, vec2):
     return np.dot(v1, v2)
 
 
-@transaction.atomic
-def find_or_create_user_face(new_embedding, face_img=None, threshold=0.6):
-    new_emb = np.array(new_embedding)
+# HÀM: id các khuôn mặt gần đây từng gửi/lấy xe này hoặc xe khác của cùng chủ (qua ParkingLog.user_face)
+def scoped_face_ids(vehicle, limit=None):
+    if vehicle is None:
+        return []
+    if limit is None:
+        limit = getattr(settings, 'FACE_SCOPED_GALLERY_SIZE', 20)
+    face_ids = (ParkingLog.objects
+                .filter(Q(vehicle_id=vehicle.id) | Q(user_id=vehicle.user_id), user_face__isnull=False)
+                .order_by('-check_in')
+                .values_list('user_face_id', flat=True)[:limit])
+    return list(dict.fromkeys(face_ids))
+
 
-    for user_face in UserFace.objects.all():
-        if not user_face.embedding:
+# HÀM: lấy khuôn mặt đầu tiên đạt ngưỡng trong danh sách (id, độ tương đồng) đã sắp giảm dần
+def _first_match(index, matches, threshold):
+    for face_id, sim in matches:
+        if sim < threshold:
+            break
+        user_face = UserFace.objects.only('id').filter(id=face_id).first()
+        if user_face is None:
+            index.remove(face_id)  # bản ghi đã bị xóa ở worker khác
             continue
-        emb = user_face.embedding
-        sim = cosine_similarity(new_emb, emb)
-        if sim >= threshold:
-            update_emb = ((emb + new_emb) / 2).tolist()
-            user_face.embedding = update_emb
-            user_face.face_img = face_img
-            user_face.save()
-            return user_face
-
-    user_face = UserFace.objects.create(
-        face_img=face_img,
-        embedding=new_emb.tolist()
-    )
+        return user_face
+    return None
+
+
+# Lượt check-in chỉ đọc chỉ mục (và tạo UserFace mới nếu cần); cập nhật embedding trung bình
+# và ảnh khuôn mặt được đưa vào face_writer để ghi sau theo lô, không giữ khóa dòng khi upload ảnh
+def find_or_create_user_face(new_embedding, face_img=None, threshold=0.6, top_k=3, candidate_ids=None):
+    new_emb = np.asarray(new_embedding, dtype=np.float32)
+    index = get_face_index()
+
+    # so trước với vài khuôn mặt từng đi cùng xe/chủ xe, chỉ tìm toàn bộ chỉ mục khi không khớp
+    user_face = None
+    if candidate_ids:
+        user_face = _first_match(index, index.search_ids(new_emb, candidate_ids, k=top_k), threshold)
+    if user_face is None:
+        # tìm các khuôn mặt gần nhất trong chỉ mục (đã sắp xếp theo độ tương đồng giảm dần)
+        user_face = _first_match(index, index.search(new_emb, k=top_k), threshold)
+    if user_face is not None:
+        face_writer.submit(user_face.id, new_emb, face_img)
+        return user_face
+
+    user_face = UserFace.objects.create(embedding=pack_vector(new_emb))
+    face_writer.submit(user_face.id, face_img=face_img)
     return user_face
 
 
+# HÀM: khuôn mặt lớn nhất (gần camera nhất) trong ảnh, có bbox + normed_embedding; None nếu không có
+def detect_face(img):
+    faces = registry.get('face').get(load_image(img))
+    if len(faces) == 0:
+        return None
+    return max(faces, key=lambda face: (face.bbox[2] - face.bbox[0]) * (face.bbox[3] - face.bbox[1]))
+
+
 def math_emb(img):
-    img1 = cv2.imread(img)
+    app = registry.get('face')
+    img1 = load_image(img)
     faces1 = app.get(img1)
     if len(faces1) > 0:
         emb = faces1[0].normed_embedding
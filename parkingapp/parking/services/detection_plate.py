@@ -1,25 +1,21 @@
-from ultralytics import YOLO
-import cv2
-from collections import defaultdict
+import numpy as np
+from .model_registry import registry
+from .helpers import load_image
 
 # CẤU HÌNH
-MODEL_PLATE_PATH = "parking/runs/detect/plate/weights/best.pt"
-MODEL_CHAR_PATH = "parking/runs/detect/ocr/weights/best.pt"
-vehicle_model = YOLO('yolov8n.pt')
 VEHICLE_CLASSES = ['car', 'motorcycle', 'bus', 'truck']
 LINE_THRESHOLD = 50
 TARGET_WIDTH = 500
 
 
-# HÀM: Load mô hình
+# HÀM: Lấy mô hình (đã load sẵn trong registry của process)
 def load_models():
-    model_plate = YOLO(MODEL_PLATE_PATH)
-    model_char = YOLO(MODEL_CHAR_PATH)
-    return model_plate, model_char
+    return registry.get('plate'), registry.get('char')
 
 
 # HÀM: Cắt và resize ảnh biển số
 def crop_and_resize_plate(img, box, target_width):
+    import cv2
     x1, y1, x2, y2 = map(int, box)
     plate_crop = img[y1:y2, x1:x2].copy()
     h, w = plate_crop.shape[:2]
@@ -31,85 +27,90 @@ def crop_and_resize_plate(img, box, target_width):
     return plate_crop
 
 
-# HÀM: Gom ký tự theo dòng
-def group_characters_by_line(char_data, line_threshold):
-    lines = defaultdict(list)
-    for char in char_data:
-        cy = char['cy']
-        assigned = False
-        for key in lines:
-            if abs(cy - key) < line_threshold:
-                lines[key].append(char)
-                assigned = True
+# HÀM: Ghép ký tự thành biển số từ mảng kết quả của model (xyxy: N x 4, cls: N)
+def characters_to_text(xyxy, cls, names, line_threshold=LINE_THRESHOLD):
+    if len(cls) == 0:
+        return ""
+    cx = (xyxy[:, 0] + xyxy[:, 2]) / 2
+    cy = (xyxy[:, 1] + xyxy[:, 3]) / 2
+
+    # Gom theo dòng như cách cũ: ký tự vào dòng đầu tiên (theo thứ tự model trả về) có cy của ký tự mở dòng
+    # lệch < line_threshold, không có thì mở dòng mới -> biển nghiêng vẫn tách đúng 2 dòng
+    anchors = []
+    line_ids = np.empty(len(cy), dtype=np.int64)
+    for i, y in enumerate(cy.tolist()):
+        for k, anchor in enumerate(anchors):
+            if abs(y - anchor) < line_threshold:
+                line_ids[i] = k
                 break
-        if not assigned:
-            lines[cy].append(char)
-    return lines
+        else:
+            line_ids[i] = len(anchors)
+            anchors.append(y)
+    line_rank = np.argsort(np.argsort(anchors, kind='stable'))
 
+    # Sắp xếp theo dòng (trên -> dưới) rồi theo cx (trái -> phải)
+    order = np.lexsort((cx, line_rank[line_ids]))
+    return ''.join([names[c] for c in cls[order].tolist()])
 
-# HÀM: Nhận diện ký tự từ ảnh biển số
-def recognize_plate_characters(plate_img, model_char):
-    result = model_char(plate_img)[0]
-    boxes = result.boxes
 
+# HÀM: Đọc kết quả của model ký tự (tensor) thành chuỗi
+def result_to_text(result, names):
+    boxes = result.boxes
     if boxes is None or len(boxes.cls) == 0:
         return ""
+    return characters_to_text(boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy().astype(int), names)
 
-    char_data = []
-    for i in range(len(boxes.cls)): #cls -> class id
-        cx1, cy1, cx2, cy2 = boxes.xyxy[i].tolist()
-        cls_id = int(boxes.cls[i])
-        conf = float(boxes.conf[i])
-        cx = (cx1 + cx2) / 2
-        cy = (cy1 + cy2) / 2
-        char_data.append({
-            'char': model_char.names[cls_id],
-            'conf': conf,
-            'cx': cx,
-            'cy': cy
-        })
-
-    # Gom theo dòng
-    lines = group_characters_by_line(char_data, LINE_THRESHOLD)
-
-    # Sắp xếp từng dòng từ trái sang phải và ghép ký tự
-    sorted_lines = sorted(lines.items(), key=lambda x: x[0])  # sắp xếp theo cy
-    plate_text = ""
-    for _, chars_in_line in sorted_lines:
-        chars_sorted = sorted(chars_in_line, key=lambda x: x['cx']) # sắp xếp theo cx
-        plate_text += ''.join([ch['char'] for ch in chars_sorted])
-
-    return plate_text
 
+# HÀM: Nhận diện ký tự từ ảnh biển số
+def recognize_plate_characters(plate_img, model_char):
+    result = model_char(plate_img, verbose=False)[0]
+    return result_to_text(result, model_char.names)
 
-# HÀM CHÍNH: Nhận diện biển số từ ảnh
-def detect_license_plates(image_path: str):
-    model_plate, model_char = load_models()
-    img = cv2.imread(image_path)
-    if img is None:
-        raise FileNotFoundError(f"Không tìm thấy ảnh tại {image_path}")
 
-    result = model_plate(img)[0]
+# HÀM: Đọc biển số từ ảnh (BGR) với cặp model cho trước
+def read_plate(img, model_plate, model_char):
+    result = model_plate(img, verbose=False)[0]
     if len(result.boxes.xyxy) == 0:
         return "Không phát hiện biển số."
 
-    for plate_box in result.boxes.xyxy:
-        plate_crop = crop_and_resize_plate(img, plate_box, TARGET_WIDTH)
-        plate_text = recognize_plate_characters(plate_crop, model_char)
-
+    # Gửi tất cả biển số trong ảnh vào model ký tự trong 1 lần gọi (batch)
+    crops = [crop_and_resize_plate(img, box, TARGET_WIDTH) for box in result.boxes.xyxy.cpu().numpy()]
+    for char_result in model_char(crops, verbose=False):
+        plate_text = result_to_text(char_result, model_char.names)
         if plate_text:
             return plate_text
-        else:
-            return "Không phát hiện ký tự."
+    return "Không phát hiện ký tự."
 
 
-#HÀM: Nhận diện phương tiện
-def detect_vehicle(image_path):
-    results = vehicle_model(image_path)[0]
-    boxes = results.boxes
-    for i in range(len(boxes.cls)):
-        class_id = int(boxes.cls[i])
+# HÀM CHÍNH: Nhận diện biển số từ ảnh
+def detect_license_plates(image):
+    model_plate, model_char = load_models()
+    return read_plate(load_image(image), model_plate, model_char)
+
+
+# HÀM: Lấy loại phương tiện đầu tiên model phát hiện được
+def vehicle_class(img, vehicle_model):
+    boxes = vehicle_model(img)[0].boxes
+    for class_id in boxes.cls.cpu().numpy().astype(int).tolist():
         class_name = vehicle_model.names[class_id]
         if class_name in VEHICLE_CLASSES:
             return class_name.upper()
-    return None
\ No newline at end of file
+    return None
+
+
+# HÀM: Vùng (x1, y1, x2, y2) của phương tiện lớn nhất trong khung hình, None nếu không thấy
+def locate_vehicle(img, vehicle_model):
+    boxes = vehicle_model(img, verbose=False)[0].boxes
+    best, best_area = None, 0
+    for box, class_id in zip(boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy().astype(int).tolist()):
+        if vehicle_model.names[class_id] not in VEHICLE_CLASSES:
+            continue
+        area = (box[2] - box[0]) * (box[3] - box[1])
+        if area > best_area:
+            best, best_area = box, area
+    return best
+
+
+#HÀM: Nhận diện phương tiện
+def detect_vehicle(image):
+    return vehicle_class(load_image(image), registry.get('vehicle'))
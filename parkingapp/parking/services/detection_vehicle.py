@@ -1,47 +1,99 @@
 from ..models import Vehicle
+import logging
+import threading
 import numpy as np
 import  requests
-import torch
-import cv2
-from torchreid.reid.utils.feature_extractor import FeatureExtractor
-from PIL import Image
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections
+from .model_registry import registry
+from .helpers import load_image, decode_bytes, pack_vector, unpack_vector
 
-# Load model OSNet (GPU)
-extractor = FeatureExtractor(model_name='osnet_x1_0', device='cpu')
+logger = logging.getLogger(__name__)
+_feature_executor = None
+_feature_lock = threading.Lock()
 
 
 # Hàm color histogram
 def extract_color_histogram_from_array(image, bins=(8,8,8)):
+    import cv2
     image = cv2.cvtColor(image, cv2.COLOR_RGB2HSV) # Chuyển ảnh từ GRB sang HSV
     hist = cv2.calcHist([image], [0,1,2], None, bins, [0,180,0,256,0,256]) # tính giá trị Histogram
     cv2.normalize(hist, hist) # chuẩn hóa về L2
     return hist.flatten() # Chuyển thành vector 1D
 
 
-# Hàm so sánh 2 ảnh
-def check_vehicle(img1, img2):
-    response = requests.get(img1.url)
-    img1 = Image.open(BytesIO(response.content)).convert('RGB')
-    img1 = np.array(img1)
+# Hàm trích đặc trưng của ảnh xe (RGB): embedding OSNet + histogram màu
+def extract_features_from_array(image):
+    extractor = registry.get('reid')  # model OSNet (torch trả về tensor, backend ONNX trả về numpy)
+    features = extractor([image])
+    emb = features[0].cpu().numpy() if hasattr(features, 'cpu') else features[0]
+    color = extract_color_histogram_from_array(image)
+    return emb, color
 
-    img2 = cv2.imread(img2)
-    img2 = cv2.cvtColor(img2, cv2.COLOR_BGR2RGB)
 
-    emb1 = extractor([img1])[0]
-    emb2 = extractor([img2])[0]
+# Hàm trích đặc trưng ảnh xe chụp tại cổng (không phụ thuộc biển số -> chạy song song được)
+def extract_vehicle_features(image):
+    import cv2
+    img = cv2.cvtColor(load_image(image), cv2.COLOR_BGR2RGB)
+    return extract_features_from_array(img)
 
-    color1 = extract_color_histogram_from_array(img1)
-    color2 = extract_color_histogram_from_array(img2)
 
-    sim_emb = torch.nn.functional.cosine_similarity(emb1, emb2, dim=0)
-    sim_emb = sim_emb.item()
+# Hàm tính sẵn đặc trưng cho ảnh xe đã đăng ký (ảnh BGR), dạng float32 nhị phân để lưu vào Vehicle
+def vehicle_feature_fields(image) -> dict:
+    emb, color = extract_vehicle_features(image)
+    return {'reid_embedding': pack_vector(emb), 'color_hist': pack_vector(color)}
+
+
+# Hàm tải ảnh xe đã đăng ký từ Cloudinary và lưu lại đặc trưng
+def refresh_vehicle_features(vehicle: Vehicle):
+    response = requests.get(vehicle.image.url, timeout=10)
+    response.raise_for_status()
+    for field, value in vehicle_feature_fields(decode_bytes(response.content)).items():
+        setattr(vehicle, field, value)
+    vehicle.save(update_fields=['reid_embedding', 'color_hist'])
+
+
+# Hàm tính đặc trưng cho xe vừa duyệt (chạy nền): đọc lại xe, bỏ qua nếu đã có đặc trưng hoặc bị hủy duyệt
+def _refresh_vehicle_features_job(vehicle_id):
+    close_old_connections()
+    try:
+        vehicle = Vehicle.objects.filter(id=vehicle_id, is_approved=True, reid_embedding__isnull=True).first()
+        if vehicle is not None and vehicle.image:
+            refresh_vehicle_features(vehicle)
+    except Exception:
+        logger.exception("Không tính được đặc trưng xe %s (chạy lại bằng lệnh backfill_vehicle_features)", vehicle_id)
+    finally:
+        close_old_connections()
+
+
+# Hàm đưa việc tính đặc trưng vào thread nền (1 thread/process), không chạy trong request lưu xe
+def schedule_vehicle_features(vehicle_id):
+    global _feature_executor
+    if _feature_executor is None:
+        with _feature_lock:
+            if _feature_executor is None:
+                _feature_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vehicle-features')
+    return _feature_executor.submit(_refresh_vehicle_features_job, vehicle_id)
+
+
+# Hàm lấy đặc trưng xe đã đăng ký; xe cũ chưa có thì tính bù 1 lần
+def get_vehicle_features(vehicle: Vehicle):
+    if vehicle.reid_embedding is None or vehicle.color_hist is None:
+        refresh_vehicle_features(vehicle)
+    return unpack_vector(vehicle.reid_embedding), unpack_vector(vehicle.color_hist)
+
+
+# Hàm so sánh xe đã đăng ký với đặc trưng ảnh xe tại cổng
+def check_vehicle(vehicle: Vehicle, features2):
+    if not vehicle.image:
+        return False, "Phương tiện chưa có ảnh đăng ký."
+    emb1, color1 = get_vehicle_features(vehicle)
+    emb2, color2 = features2
+
+    sim_emb = np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2))
 
     sim_color = np.dot(color1, color2) / (np.linalg.norm(color1) * np.linalg.norm(color2))
 
     if sim_emb > 0.8 and sim_color > 0.9:
         return True, "Xe hợp lệ."
     return False,  "Phát hiện gian lận biển số."
-
-
-
@@ -0,0 +1,326 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from ..models import UserFace
+from .helpers import unpack_vector
+
+EMBEDDING_DIM = 512  # buffalo_l trả về vector 512 chiều
+INDEX_DTYPES = ('float32', 'float16', 'int8')
+SEARCH_BLOCK = 16384  # số dòng giải lượng tử mỗi lần khi tìm trên ma trận float16/int8
+# sync đọc lại cả các dòng sửa trong khoảng này trước mốc đã đồng bộ: transaction commit chậm hơn lúc gán
+# updated_date, đồng hồ các máy lệch nhau
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+# HÀM: chuyển embedding (bytes float32 hoặc list) thành vector float32 đã chuẩn hóa L2
+def to_unit_vector(embedding, dim=EMBEDDING_DIM):
+    try:
+        if isinstance(embedding, (bytes, bytearray, memoryview)):
+            vec = unpack_vector(embedding)
+        else:
+            vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    except (TypeError, ValueError):
+        return None
+    if vec.size != dim:
+        return None
+    norm = np.linalg.norm(vec)
+    if norm == 0 or not np.isfinite(norm):
+        return None
+    return vec / norm
+
+
+# HÀM: lượng tử hóa các dòng đã chuẩn hóa; int8 dùng hệ số riêng cho từng dòng
+def quantize(matrix, dtype):
+    if dtype == 'int8':
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.rint(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return matrix.astype(dtype), None
+
+
+# Chỉ mục embedding khuôn mặt trong RAM của từng process:
+# ma trận liên tục (mỗi dòng là 1 embedding đã chuẩn hóa) + mảng id,
+# tìm kiếm bằng 1 phép nhân ma trận-vector thay vì lặp từng bản ghi UserFace.
+# dtype float16/int8 giảm RAM 2-4 lần, đổi lại điểm tương đồng sai số nhỏ (xem bench_face_index).
+class FaceIndex:
+    def __init__(self, dim=EMBEDDING_DIM, dtype='float32'):
+        if dtype not in INDEX_DTYPES:
+            raise ValueError(f"dtype phải là một trong {INDEX_DTYPES}")
+        self.dim = dim
+        self.dtype = dtype
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._matrix = np.empty((0, self.dim), dtype=self.dtype)
+        self._scales = np.empty(0, dtype=np.float32) if self.dtype == 'int8' else None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._rows = {}  # id -> vị trí dòng trong ma trận
+        self._synced_at = None  # updated_date lớn nhất đã nạp
+        self._writable = True
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        scales = self._size * 4 if self._scales is not None else 0
+        return self._size * self.dim * self._matrix.itemsize + scales
+
+    # ----------  Cập nhật  ----------
+    def _ensure_capacity(self, extra):
+        # ma trận từ snapshot là memmap chỉ đọc -> copy ra RAM khi cần ghi
+        need = self._size + extra
+        if self._writable and need <= len(self._matrix):
+            return
+        capacity = max(need, 2 * len(self._matrix), 1024)
+        matrix = np.empty((capacity, self.dim), dtype=self.dtype)
+        ids = np.empty(capacity, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+        if self._scales is not None:
+            scales = np.empty(capacity, dtype=np.float32)
+            scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+        self._matrix, self._ids = matrix, ids
+        self._writable = True
+
+    def _write_rows(self, start, matrix):
+        stored, scales = quantize(matrix, self.dtype)
+        self._matrix[start:start + len(stored)] = stored
+        if scales is not None:
+            self._scales[start:start + len(stored)] = scales
+
+    def upsert(self, face_id, embedding):
+        vec = to_unit_vector(embedding, self.dim)
+        with self._lock:
+            if vec is None:
+                self.remove(face_id)
+                return False
+            row = self._rows.get(face_id)
+            if row is None:
+                self._ensure_capacity(1)
+                row = self._size
+                self._size += 1
+                self._rows[face_id] = row
+                self._ids[row] = face_id
+            elif self._unchanged(row, vec):
+                return True  # sync đọc lại dòng cũ -> không copy snapshot chỉ đọc ra RAM
+            elif not self._writable:
+                self._ensure_capacity(0)
+            self._write_rows(row, vec[None, :])
+            return True
+
+    def _unchanged(self, row, vec):
+        stored, scales = quantize(vec[None, :], self.dtype)
+        return np.array_equal(self._matrix[row], stored[0]) and (scales is None or self._scales[row] == scales[0])
+
+    def remove(self, face_id):
+        with self._lock:
+            row = self._rows.pop(face_id, None)
+            if row is None:
+                return False
+            self._ensure_capacity(0)
+            last = self._size - 1
+            if row != last:
+                # đưa dòng cuối vào chỗ trống để ma trận luôn liên tục
+                self._matrix[row] = self._matrix[last]
+                if self._scales is not None:
+                    self._scales[row] = self._scales[last]
+                moved_id = int(self._ids[last])
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._size = last
+            return True
+
+    # HÀM: thêm nhiều embedding một lần (chuẩn hóa dạng vector hóa), dùng khi nạp hàng loạt
+    def add_many(self, ids, embeddings):
+        ids = np.asarray(ids, dtype=np.int64)
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), self.dim)
+        norms = np.linalg.norm(matrix, axis=1)
+        valid = (norms > 0) & np.isfinite(norms)
+        ids, matrix = ids[valid], matrix[valid] / norms[valid, None]
+        with self._lock:
+            new = np.array([face_id not in self._rows for face_id in ids.tolist()], dtype=bool)
+            for face_id, vec in zip(ids[~new].tolist(), matrix[~new]):
+                self.upsert(face_id, vec)
+            ids, matrix = ids[new], matrix[new]
+            self._ensure_capacity(len(ids))
+            start, end = self._size, self._size + len(ids)
+            self._write_rows(start, matrix)
+            self._ids[start:end] = ids
+            self._rows.update((face_id, row) for row, face_id in enumerate(ids.tolist(), start))
+            self._size = end
+
+    # ----------  Tìm kiếm  ----------
+    def _scores(self, vec):
+        matrix = self._matrix[:self._size]
+        if self.dtype == 'float32':
+            return matrix @ vec
+        # float16/int8: giải lượng tử từng khối để không tạo bản sao float32 của cả ma trận
+        scores = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, SEARCH_BLOCK):
+            block = matrix[start:start + SEARCH_BLOCK]
+            scores[start:start + len(block)] = block.astype(np.float32) @ vec
+        if self._scales is not None:
+            scores *= self._scales[:self._size]
+        return scores
+
+    def search(self, embedding, k=1):
+        vec = to_unit_vector(embedding, self.dim)
+        if vec is None:
+            return []
+        with self._lock:
+            if self._size == 0:
+                return []
+            scores = self._scores(vec)
+            k = min(k, self._size)
+            if k < self._size:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.arange(self._size)
+            top = top[np.argsort(-scores[top])]
+            return [(int(self._ids[i]), float(scores[i])) for i in top]
+
+    # HÀM: chỉ so khớp với một tập id cho trước (vd các khuôn mặt từng đi cùng xe / chủ xe)
+    def search_ids(self, embedding, face_ids, k=1):
+        vec = to_unit_vector(embedding, self.dim)
+        if vec is None:
+            return []
+        with self._lock:
+            found = [(face_id, self._rows[face_id]) for face_id in dict.fromkeys(face_ids) if face_id in self._rows]
+            if not found:
+                return []
+            rows = np.fromiter((row for _, row in found), dtype=np.int64, count=len(found))
+            scores = self._matrix[rows].astype(np.float32) @ vec
+            if self._scales is not None:
+                scores *= self._scales[rows]
+            return [(found[i][0], float(scores[i])) for i in np.argsort(-scores)[:k]]
+
+    # ----------  Nạp dữ liệu  ----------
+    def _append_rows(self, rows, chunk_size=2000):
+        ids, embeddings = [], []
+        for face_id, embedding in rows:
+            vec = to_unit_vector(embedding, self.dim)
+            if vec is None:
+                continue
+            ids.append(face_id)
+            embeddings.append(vec)
+            if len(ids) >= chunk_size:
+                self.add_many(ids, embeddings)
+                ids, embeddings = [], []
+        if ids:
+            self.add_many(ids, embeddings)
+
+    def load_from_db(self, chunk_size=2000):
+        with self._lock:
+            self._reset()
+            # lấy mốc trước khi đọc: dòng sửa trong lúc nạp sẽ được sync đọc lại
+            self._synced_at = UserFace.objects.aggregate(updated=Max('updated_date'))['updated']
+            rows = UserFace.objects.order_by('id').values_list('id', 'embedding').iterator(chunk_size=chunk_size)
+            self._append_rows(rows, chunk_size)
+            self.loaded = True
+
+    # HÀM: nạp các UserFace được tạo/sửa ở worker khác (embedding cập nhật dần, gộp khuôn mặt) theo updated_date
+    def sync(self):
+        with self._lock:
+            rows = UserFace.objects.order_by('updated_date')
+            if self._synced_at is not None:
+                rows = rows.filter(updated_date__gte=self._synced_at - SYNC_OVERLAP)
+            for face_id, embedding, updated in rows.values_list('id', 'embedding', 'updated_date'):
+                self.upsert(face_id, embedding)  # embedding không hợp lệ -> bỏ khỏi chỉ mục
+                self._synced_at = updated if self._synced_at is None else max(self._synced_at, updated)
+
+    # ----------  Snapshot trên đĩa  ----------
+    @staticmethod
+    def _db_state():
+        state = UserFace.objects.aggregate(count=Count('id'), max_id=Max('id'), updated=Max('updated_date'))
+        return {
+            'count': state['count'] or 0,
+            'max_id': state['max_id'] or 0,
+            'updated': state['updated'].isoformat() if state['updated'] else None,
+        }
+
+    def save_snapshot(self, path, db_state=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            meta = dict(db_state or self._db_state(), dim=self.dim, dtype=self.dtype, size=self._size)
+            _atomic_save_npy(f"{path}.npy", self._matrix[:self._size])
+            _atomic_save_npy(f"{path}.ids.npy", self._ids[:self._size])
+            if self._scales is not None:
+                _atomic_save_npy(f"{path}.scales.npy", self._scales[:self._size])
+            tmp = f"{path}.json.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp, f"{path}.json")  # ghi meta cuối cùng -> snapshot chỉ hợp lệ khi đủ các file
+
+    def load_snapshot(self, path, db_state=None):
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            if meta.get('dim') != self.dim or meta.get('dtype', 'float32') != self.dtype:
+                return False
+            state = db_state or self._db_state()
+            if any(meta.get(key) != state[key] for key in ('count', 'max_id', 'updated')):
+                return False  # bảng UserFace đã thay đổi sau khi ghi snapshot
+            matrix = np.load(f"{path}.npy", mmap_mode='r')
+            ids = np.load(f"{path}.ids.npy")
+            scales = np.load(f"{path}.scales.npy") if self.dtype == 'int8' else None
+        except (OSError, ValueError):
+            return False
+        size = meta['size']
+        if matrix.shape != (size, self.dim) or ids.shape != (size,) or (scales is not None and scales.shape != (size,)):
+            return False
+
+        with self._lock:
+            self._reset()
+            self._matrix, self._ids = matrix, ids
+            if scales is not None:
+                self._scales = scales
+            self._size = len(ids)
+            self._rows = {int(face_id): row for row, face_id in enumerate(ids)}
+            self._synced_at = datetime.fromisoformat(meta['updated']) if meta.get('updated') else None
+            self._writable = False
+            self.loaded = True
+        return True
+
+
+def _atomic_save_npy(path, array):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp, path)
+
+
+face_index = FaceIndex(dtype=getattr(settings, 'FACE_INDEX_DTYPE', 'float32'))
+_load_lock = threading.Lock()
+
+
+def snapshot_path():
+    return getattr(settings, 'FACE_INDEX_PATH', None)
+
+
+# HÀM: lấy chỉ mục dùng chung của process, nạp từ snapshot (hoặc DB) ở lần gọi đầu tiên
+def get_face_index():
+    if not face_index.loaded:
+        with _load_lock:
+            if not face_index.loaded:
+                path = snapshot_path()
+                if not (path and face_index.load_snapshot(path)):
+                    state = FaceIndex._db_state()
+                    face_index.load_from_db()
+                    if path:
+                        try:
+                            face_index.save_snapshot(path, state)
+                        except OSError:
+                            pass
+                return face_index
+    face_index.sync()
+    return face_index
@@ -0,0 +1,164 @@
+import io
+import atexit
+import logging
+import threading
+import numpy as np
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+
+from ..models import UserFace
+from .face_index import face_index
+from .helpers import pack_vector, unpack_vector
+
+logger = logging.getLogger(__name__)
+
+
+# HÀM: đọc ảnh khuôn mặt (file upload) thành (bytes, tên) để giữ được sau khi request kết thúc
+def image_payload(face_img):
+    if face_img is None or not hasattr(face_img, 'read'):
+        return None
+    face_img.seek(0)
+    data = face_img.read()
+    face_img.seek(0)
+    return (data, getattr(face_img, 'name', 'face.jpg')) if data else None
+
+
+def upload_face_image(data, name):
+    import cloudinary.uploader
+    stream = io.BytesIO(data)
+    stream.name = name
+    return cloudinary.uploader.upload_resource(stream)
+
+
+# Bộ đệm ghi sau (write-behind) cho UserFace: lượt check-in chỉ ghi vào RAM,
+# thread nền gộp các cập nhật theo từng khuôn mặt rồi ghi DB/Cloudinary theo lô.
+# Gộp n lần "emb = (emb + e) / 2" liên tiếp: emb * 0.5^n + acc  (acc = acc / 2 + e / 2)
+class FaceWriteBuffer:
+    def __init__(self, uploader=upload_face_image):
+        self._uploader = uploader
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = {}  # face_id -> {'decay', 'acc', 'image', 'attempts'}
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'FACE_WRITE_BEHIND', True)
+
+    def submit(self, face_id, embedding=None, face_img=None):
+        image = image_payload(face_img)
+        if embedding is None and image is None:
+            return
+        with self._lock:
+            update = self._pending.setdefault(face_id, {'decay': 1.0, 'acc': None, 'image': None, 'attempts': 0})
+            if embedding is not None:
+                vec = np.asarray(embedding, dtype=np.float32)
+                update['acc'] = vec / 2 if update['acc'] is None else update['acc'] / 2 + vec / 2
+                update['decay'] /= 2
+            if image is not None:
+                update['image'], update['attempts'] = image, 0  # chỉ giữ ảnh mới nhất
+            size = len(self._pending)
+
+        if not self.enabled:
+            self.flush()
+        elif size >= getattr(settings, 'FACE_WRITE_BATCH', 100):
+            self._ensure_thread()
+            self._wake.set()
+        else:
+            self._ensure_thread()
+
+    # HÀM: ghi toàn bộ cập nhật đang chờ, trả về số khuôn mặt đã ghi
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            return self._write(pending)
+        except Exception:
+            # không bỏ cập nhật: trả cả lô về hàng đợi, lần flush sau ghi lại
+            logger.exception("Không ghi được %d cập nhật khuôn mặt, đưa lại vào hàng đợi", len(pending))
+            self._requeue(pending)
+            return 0
+
+    def _write(self, pending):
+        # upload ảnh trước, ngoài transaction -> không giữ khóa dòng trong lúc chờ mạng.
+        # Ảnh lỗi chỉ ảnh hưởng khuôn mặt đó: embedding vẫn ghi, ảnh thử lại ở lần flush sau
+        images, failed = {}, []
+        for face_id, update in pending.items():
+            if update['image'] is None:
+                continue
+            try:
+                images[face_id] = self._uploader(*update['image'])
+            except Exception:
+                logger.exception("Không upload được ảnh khuôn mặt %s (lần %d)", face_id, update['attempts'] + 1)
+                failed.append(face_id)
+
+        now = timezone.now()
+        with transaction.atomic():
+            faces = UserFace.objects.select_for_update().in_bulk(list(pending))
+            for face_id, face in faces.items():
+                update = pending[face_id]
+                if update['acc'] is not None and len(face.embedding or b'') == update['acc'].nbytes:
+                    emb = unpack_vector(face.embedding)
+                    face.embedding = pack_vector(emb * update['decay'] + update['acc'])
+                if face_id in images:
+                    face.face_img = images[face_id]
+                face.updated_date = now
+            UserFace.objects.bulk_update(list(faces.values()), ['embedding', 'face_img', 'updated_date'])
+
+        # bulk_update không gửi post_save -> tự đồng bộ chỉ mục của process này
+        if face_index.loaded:
+            for face in faces.values():
+                face_index.upsert(face.id, face.embedding)
+        self._retry_images({face_id: pending[face_id] for face_id in failed if face_id in faces})
+        return len(faces)
+
+    # ảnh upload lỗi -> đưa riêng ảnh về hàng đợi; lỗi quá FACE_IMAGE_MAX_ATTEMPTS lần thì bỏ ảnh
+    def _retry_images(self, failed):
+        max_attempts = getattr(settings, 'FACE_IMAGE_MAX_ATTEMPTS', 3)
+        retry = {}
+        for face_id, update in failed.items():
+            attempts = update['attempts'] + 1
+            if attempts >= max_attempts:
+                logger.error("Bỏ ảnh khuôn mặt %s sau %d lần upload lỗi", face_id, attempts)
+            else:
+                retry[face_id] = {'decay': 1.0, 'acc': None, 'image': update['image'], 'attempts': attempts}
+        if retry:
+            self._requeue(retry)
+
+    # ghi lỗi -> trả cập nhật về hàng đợi, gộp với các cập nhật mới đến trong lúc ghi
+    def _requeue(self, pending):
+        with self._lock:
+            for face_id, old in pending.items():
+                new = self._pending.get(face_id)
+                if new is None:
+                    self._pending[face_id] = old
+                    continue
+                if old['acc'] is not None:
+                    new['acc'] = old['acc'] * new['decay'] + (new['acc'] if new['acc'] is not None else 0)
+                    new['decay'] *= old['decay']
+                if new['image'] is None:
+                    new['image'], new['attempts'] = old['image'], old['attempts']
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='face-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(getattr(settings, 'FACE_WRITE_INTERVAL', 2.0))
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+
+face_writer = FaceWriteBuffer()
+atexit.register(face_writer.flush)
@@ -3,29 +3,21 @@ from typing import Optional
 from django.db.models.functions import Coalesce
 from django.db.models import Sum
 
+from .helpers import date_range_lookups
+from .stats import stats_range, sum_stat
 from ..models import (ParkingLog,
                       ParkingStatus,
                       User,
                       UserRole)
 
 
+# Doanh thu đọc từ bảng tổng hợp theo ngày (DailyParkingStat), không quét ParkingLog
 def get_total_revenue_range(regimen: str, user: User,
                             date_from: Optional[date] = None,
                             date_to: Optional[date] = None) -> int:
     if regimen == 'my' or user.user_role == UserRole.CUSTOMER:
-        parking_logs = ParkingLog.objects.filter(status=ParkingStatus.OUT, user=user)
-    else:
-        parking_logs = ParkingLog.objects.filter(status=ParkingStatus.OUT)
-
-    if date_from:
-        # lấy các bảng ghi có ngày lớn hơn date_from
-        parking_logs = parking_logs.filter(created_date__date__gte=date_from)
-    if date_to:
-        # lấy các bảng ghi có ngày nhỏ lơn date_to
-        parking_logs = parking_logs.filter(created_date__date__lte=date_to)
-
-    total_revenue = parking_logs.aggregate(total=Coalesce(Sum("fee"), 0))["total"]
-    return total_revenue
+        return sum_stat('revenue', date_from, date_to, user=user)
+    return sum_stat('revenue', date_from, date_to)
 
 
 def compare_monthly_revenue(user: User, current_start: Optional[date] = None,
@@ -47,23 +39,17 @@ def compare_monthly_revenue(user: User, current_start: Optional[date] = None,
 
 def get_revenue_by_user(date_from: Optional[date] = None,
                         date_to: Optional[date] = None):
-    parking_logs = ParkingLog.objects.filter(status=ParkingStatus.OUT)
-    if date_from:
-        parking_logs = parking_logs.filter(created_date__date__gte=date_from)
-    if date_to:
-        parking_logs = parking_logs.filter(created_date__date__lte=date_to)
-
-    results = parking_logs.values("user__username").annotate(total=Coalesce(Sum('fee'), 0))
+    # chỉ người dùng có lượt đã lấy xe trong khoảng ngày
+    results = (stats_range(date_from, date_to).filter(exits__gt=0)
+               .values("user__username").annotate(total=Coalesce(Sum('revenue'), 0)).order_by())
     return results
 
 
+# Bảng tổng hợp không chia theo từng xe nên thống kê theo xe vẫn tính trên ParkingLog
 def get_revenue_by_vehicle(date_from: Optional[date] = None,
                            date_to: Optional[date] = None):
-    parking_logs = ParkingLog.objects.filter(status=ParkingStatus.OUT)
-    if date_from:
-        parking_logs = parking_logs.filter(created_date__date__gte=date_from)
-    if date_to:
-        parking_logs = parking_logs.filter(created_date__date__lte=date_to)
+    parking_logs = ParkingLog.objects.filter(status=ParkingStatus.OUT,
+                                             **date_range_lookups('created_date', date_from, date_to))
 
     results = parking_logs.values("user__full_name", "vehicle__name", "vehicle__license_plate").annotate(
         total=Coalesce(Sum('fee'), 0))
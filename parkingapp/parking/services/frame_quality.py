@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+
+# CẤU HÌNH
+ANALYSIS_WIDTH = 320  # chấm điểm trên ảnh xám thu nhỏ để mỗi khung chỉ tốn ~1 ms
+MIN_SHARPNESS = 60.0  # phương sai Laplacian tối thiểu (ảnh mờ nhòe thấp hơn)
+BRIGHTNESS_RANGE = (40, 220)  # độ sáng trung bình chấp nhận được
+MAX_CLIPPED = 0.35  # tỉ lệ điểm ảnh quá tối/cháy sáng tối đa
+MAX_MOTION = 25.0  # chênh lệch trung bình với khung trước, lớn hơn = xe còn đang chạy
+
+
+def _gray(frame):
+    h, w = frame.shape[:2]
+    if w > ANALYSIS_WIDTH:
+        frame = cv2.resize(frame, (ANALYSIS_WIDTH, round(h * ANALYSIS_WIDTH / w)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+# HÀM: chấm điểm 1 khung hình: độ nét, độ sáng, chuyển động so với khung trước (nếu có)
+def score_frame(frame, prev_gray=None):
+    gray = _gray(frame)
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    brightness = float(gray.mean())
+    clipped = float(np.count_nonzero((gray < 10) | (gray > 245))) / gray.size
+    motion = None
+    if prev_gray is not None and prev_gray.shape == gray.shape:
+        motion = float(cv2.absdiff(gray, prev_gray).mean())
+
+    reasons = []
+    if sharpness < MIN_SHARPNESS:
+        reasons.append("mờ")
+    if not BRIGHTNESS_RANGE[0] <= brightness <= BRIGHTNESS_RANGE[1] or clipped > MAX_CLIPPED:
+        reasons.append("thiếu/thừa sáng")
+    if motion is not None and motion > MAX_MOTION:
+        reasons.append("đang chuyển động")
+    # ưu tiên khung nét, giảm điểm khi còn chuyển động
+    score = sharpness / (1 + (motion or 0) / 10)
+    return {'score': score, 'sharpness': sharpness, 'brightness': brightness, 'clipped': clipped,
+            'motion': motion, 'ok': not reasons, 'reasons': reasons}, gray
+
+
+# HÀM: chọn khung tốt nhất trong loạt ảnh chụp liên tiếp; trả về (frame, thông tin) hoặc (None, thông tin các khung)
+def select_best_frame(frames, use_motion=True):
+    best, best_info, infos = None, None, []
+    prev_gray = None
+    for frame in frames:
+        info, gray = score_frame(frame, prev_gray if use_motion else None)
+        prev_gray = gray
+        infos.append(info)
+        if info['ok'] and (best_info is None or info['score'] > best_info['score']):
+            best, best_info = frame, info
+    return (best, best_info) if best is not None else (None, infos)
@@ -0,0 +1,60 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import GateEvent
+
+
+# HÀM: đọc thời điểm chụp do máy cổng gửi (ISO 8601); không hợp lệ hoặc ở tương lai thì dùng giờ server
+def parse_captured_at(value):
+    captured_at = parse_datetime(value) if value else None
+    if captured_at is None:
+        return None
+    if timezone.is_naive(captured_at):
+        captured_at = timezone.make_aware(captured_at)
+    return min(captured_at, timezone.now())
+
+
+PENDING_MSG = "Sự kiện đang được xử lý."
+
+
+# HÀM: nhận xử lý lại sự kiện "đang xử lý" đã quá GATE_EVENT_CLAIM_TIMEOUT giây (worker xử lý bản đầu đã chết).
+# Cập nhật có điều kiện theo updated_date -> trong các bản gửi lại cùng lúc chỉ 1 bản nhận được
+def _reclaim_stale(event):
+    timeout = getattr(settings, 'GATE_EVENT_CLAIM_TIMEOUT', 60)
+    if event.updated_date > timezone.now() - timedelta(seconds=timeout):
+        return False
+    return GateEvent.objects.filter(pk=event.pk, ok__isnull=True, updated_date=event.updated_date) \
+        .update(updated_date=timezone.now()) == 1
+
+
+# HÀM: xử lý 1 sự kiện cổng đúng 1 lần theo event_id.
+# Gửi lại (mất mạng, hết thời gian chờ, phát lại từ hàng đợi) chỉ nhận kết quả đã lưu, không trừ tiền lần 2.
+# Bản gửi trước còn đang xử lý -> trả về timings {'pending': True}: máy cổng phải giữ sự kiện và gửi lại sau
+# (bản đầu có thể lỗi và bị xóa). Bản đầu treo quá GATE_EVENT_CLAIM_TIMEOUT giây thì bản gửi lại xử lý thay.
+def process_gate_event(event_id, direction, captured_at, scan):
+    if not event_id:
+        return scan()
+    try:
+        with transaction.atomic():
+            event, created = GateEvent.objects.get_or_create(
+                event_id=event_id, defaults={'direction': direction, 'captured_at': captured_at}
+            )
+    except IntegrityError:
+        # 2 bản gửi cùng lúc: bản kia vừa tạo dòng trước
+        event, created = GateEvent.objects.filter(event_id=event_id).first(), False
+    if not created and not (event is not None and event.ok is None and _reclaim_stale(event)):
+        if event is None or event.ok is None:
+            return False, PENDING_MSG, getattr(event, 'plate_text', ''), {'duplicate': True, 'pending': True}
+        return event.ok, event.msg, event.plate_text, {'duplicate': True}
+
+    try:
+        ok, msg, plate_text, timings = scan()
+    except Exception:
+        event.delete()  # lỗi trước khi có kết quả -> cho phép gửi lại
+        raise
+    event.ok, event.msg, event.plate_text = ok, (msg or '')[:255], (plate_text or '')[:50]
+    event.save(update_fields=['ok', 'msg', 'plate_text', 'updated_date'])
+    return ok, msg, plate_text, timings
@@ -0,0 +1,62 @@
+import json
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# CẤU HÌNH
+CONNECT_TIMEOUT = 3.05  # giây chờ mở kết nối
+READ_TIMEOUT = 20  # giây chờ server nhận diện xong và trả kết quả
+RETRIES = 2
+BACKOFF = 0.5  # chờ 0.5s, 1s, ... giữa các lần thử lại
+RETRY_STATUS = (502, 503)  # proxy/server chưa sẵn sàng -> request chưa được xử lý, gửi lại an toàn
+
+
+# HÀM: tạo Session giữ kết nối (keep-alive) và tự thử lại có giới hạn.
+# Chỉ thử lại khi chưa kết nối được hoặc server báo 502/503; không thử lại khi đã gửi xong
+# mà chờ phản hồi quá lâu (server có thể đã ghi lượt vào/ra -> tránh ghi 2 lần).
+def create_session(retries=RETRIES, backoff=BACKOFF, pool_size=4):
+    retry = Retry(
+        total=retries, connect=retries, read=0, status=retries,
+        backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# Client HTTP dùng chung cho cả 2 cổng trong suốt thời gian chạy app
+class GateClient:
+    def __init__(self, api_url, session=None, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.api_url = api_url
+        self.session = session or create_session()
+        self.timeout = timeout
+
+    def post_scan(self, files, data):
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.api_url, files=files, data=data, timeout=self.timeout)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"⏱ {data.get('direction', '')} {self.api_url}: {elapsed:.0f} ms")
+        # server lỗi/chưa sẵn sàng, hoặc 409 (bản gửi trước của sự kiện đang xử lý) -> để máy cổng lưu vào hàng đợi
+        if response.status_code >= 500 or response.status_code == 409:
+            response.raise_for_status()
+        return response.json()
+
+    # HÀM: gửi lô sự kiện từ hàng đợi offline, trả về danh sách kết quả theo event_id
+    def post_batch(self, events):
+        meta = [{key: event[key] for key in ('event_id', 'direction', 'captured_at')} for event in events]
+        files = [(f"{event['event_id']}.{field}", part) for event in events for field, part in event['files'].items()]
+        start = time.perf_counter()
+        response = self.session.post(f"{self.api_url.rstrip('/')}/batch/", data={'events': json.dumps(meta)},
+                                     files=files, timeout=(self.timeout[0], self.timeout[1] * len(events)))
+        print(f"⏱ batch {len(events)} sự kiện: {(time.perf_counter() - start) * 1000:.0f} ms")
+        response.raise_for_status()
+        return response.json()['results']
+
+    def close(self):
+        self.session.close()
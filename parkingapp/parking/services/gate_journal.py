@@ -0,0 +1,139 @@
+import time
+import sqlite3
+import threading
+
+# CẤU HÌNH
+BATCH_SIZE = 10  # số sự kiện gửi mỗi lô (server nhận tối đa 20)
+REPLAY_INTERVAL = 5.0  # giây giữa các lần kiểm tra hàng đợi
+MAX_BACKOFF = 60.0
+
+
+# Hàng đợi bền vững trên máy cổng (SQLite): sự kiện gửi không được thì lưu lại cả ảnh + hướng + giờ chụp,
+# thứ tự giữ theo seq tăng dần. Dùng chung cho nhiều thread (1 kết nối + khóa).
+class GateJournal:
+    def __init__(self, path="gate_journal.sqlite3"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")  # mất điện cũng không mất sự kiện đã ghi
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT UNIQUE NOT NULL,
+                direction TEXT NOT NULL,
+                captured_at TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS event_files (
+                event_id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (event_id, field)
+            );
+        """)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    # files: {tên trường: (tên file, bytes, content type)} giống tham số files của requests
+    def append(self, event_id, direction, captured_at, files):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO events (event_id, direction, captured_at, created) VALUES (?, ?, ?, ?)",
+                    (event_id, direction, captured_at, time.time()),
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO event_files (event_id, field, filename, data) VALUES (?, ?, ?, ?)",
+                    [(event_id, field, part[0], part[1]) for field, part in files.items()],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    # HÀM: lấy các sự kiện cũ nhất (kèm ảnh) theo đúng thứ tự đã ghi
+    def peek(self, limit=BATCH_SIZE):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT event_id, direction, captured_at FROM events ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+            events = []
+            for event_id, direction, captured_at in rows:
+                files = {field: (filename, data, "image/jpeg") for field, filename, data in self._db.execute(
+                    "SELECT field, filename, data FROM event_files WHERE event_id = ?", (event_id,))}
+                events.append({"event_id": event_id, "direction": direction, "captured_at": captured_at,
+                               "files": files})
+            return events
+
+    def remove(self, event_ids):
+        if not event_ids:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany("DELETE FROM event_files WHERE event_id = ?", [(i,) for i in event_ids])
+            self._db.executemany("DELETE FROM events WHERE event_id = ?", [(i,) for i in event_ids])
+            self._db.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# Thread nền phát lại hàng đợi lên server theo lô khi có mạng trở lại (server chống trùng theo event_id)
+class ReplayWorker:
+    def __init__(self, journal, client, batch_size=BATCH_SIZE, interval=REPLAY_INTERVAL):
+        self.journal = journal
+        self.client = client
+        self.batch_size = batch_size
+        self.interval = interval
+        self._drain_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._backoff = interval
+
+    def start(self):
+        threading.Thread(target=self._run, name="gate-replay", daemon=True).start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    # HÀM: gửi hết hàng đợi, dừng ở lô đầu tiên bị lỗi mạng; trả về True nếu hàng đợi đã trống
+    def drain(self):
+        with self._drain_lock:
+            while True:
+                events = self.journal.peek(self.batch_size)
+                if not events:
+                    return True
+                try:
+                    results = self.client.post_batch(events)
+                except Exception as e:
+                    print("❌ Chưa gửi lại được hàng đợi:", e)
+                    return False
+                done = []
+                for result in results:
+                    if result.get("pending"):
+                        continue  # server còn đang xử lý bản gửi trước -> giữ lại; treo quá lâu thì server tự xử lý lại
+                    if result.get("error"):
+                        print("❌ Server từ chối sự kiện", result.get("event_id"), result["error"])
+                    else:
+                        print(f"📤 Đã gửi lại {result.get('event_id')}: {result.get('msg')}")
+                    done.append(result.get("event_id"))
+                done = [event_id for event_id in done if event_id]
+                if not done:
+                    return False
+                self.journal.remove(done)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._backoff)
+            self._wake.clear()
+            if len(self.journal) == 0:
+                continue
+            if self.drain():
+                self._backoff = self.interval
+            else:
+                self._backoff = min(self._backoff * 2, MAX_BACKOFF)
@@ -0,0 +1,77 @@
+import json
+import struct
+import threading
+from concurrent.futures import Future
+import requests
+from websockets.sync.client import connect
+
+# CẤU HÌNH
+CONNECT_TIMEOUT = 3.05
+RESULT_TIMEOUT = 20  # giây chờ server trả quyết định cho 1 khung hình
+_HEADER_SIZE = struct.Struct('>I')
+
+
+# Kênh WebSocket giữ 1 kết nối lâu dài tới server (/ws/gate/), dùng chung cho mọi làn.
+# post_scan có cùng cách gọi với GateClient: gửi khung hình kèm hướng/làn, chờ quyết định theo event_id.
+# Lỗi kết nối được báo bằng requests.ConnectionError để handlers lưu sự kiện vào hàng đợi như với HTTP.
+class GateSocketClient:
+    def __init__(self, ws_url, token, timeout=RESULT_TIMEOUT):
+        self.ws_url = ws_url
+        self.token = token
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._ws = None
+        self._pending = {}  # event_id -> Future chờ kết quả
+
+    def _connection(self):
+        with self._lock:
+            if self._ws is None:
+                self._ws = connect(self.ws_url, open_timeout=CONNECT_TIMEOUT,
+                                   additional_headers={"Authorization": f"Bearer {self.token}"})
+                threading.Thread(target=self._read_loop, args=(self._ws,), name="gate-ws", daemon=True).start()
+            return self._ws
+
+    # Thread đọc: server đẩy quyết định về ngay khi có, chuyển cho lượt đang chờ theo event_id
+    def _read_loop(self, ws):
+        try:
+            for message in ws:
+                result = json.loads(message)
+                future = self._pending.pop(result.get("event_id"), None)
+                if future is not None:
+                    future.set_result(result)
+        except Exception as e:
+            print("❌ Mất kết nối WebSocket:", e)
+        finally:
+            with self._lock:
+                if self._ws is ws:
+                    self._ws = None
+            for event_id in list(self._pending):
+                future = self._pending.pop(event_id, None)
+                if future is not None and not future.done():
+                    future.set_exception(requests.ConnectionError("Mất kết nối WebSocket"))
+
+    # files: {"image": (tên file, bytes, content type)}, data: {"direction", "event_id", "captured_at", "lane"}
+    def post_scan(self, files, data):
+        header = json.dumps({key: data.get(key) for key in ("event_id", "lane", "direction", "captured_at")}).encode()
+        message = _HEADER_SIZE.pack(len(header)) + header + files["image"][1]
+        future = Future()
+        self._pending[data["event_id"]] = future
+        try:
+            self._connection().send(message)
+            result = future.result(timeout=self.timeout)
+        except requests.RequestException:
+            raise
+        except Exception as e:
+            raise requests.ConnectionError(str(e)) from e
+        finally:
+            self._pending.pop(data["event_id"], None)
+        if result.get("error"):
+            raise requests.HTTPError(result["error"])  # lỗi phía server -> lưu hàng đợi, gửi lại sau
+        if result.get("pending"):
+            raise requests.HTTPError(result.get("msg"))  # bản gửi trước còn đang xử lý -> lưu hàng đợi, gửi lại sau
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._ws is not None:
+                self._ws.close()
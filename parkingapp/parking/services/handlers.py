@@ -1,45 +1,51 @@
 import cv2
-import requests
 import time
+import uuid
+import requests
+from datetime import datetime, timezone
 from PIL import Image, ImageTk
-from gtts import gTTS
 import io, threading, pygame
+from frame_quality import select_best_frame
 
 # Biến toàn cục sẽ được gán từ file main_gui
 arduino = None
 API_URL = None
-cam_in = None
-cam_out = None
-label_captured_in = None
-label_captured_out = None
-label_cam_in = None
-label_cam_out = None
-plate_text_in = None
-plate_text_out = None
+lanes = []
+lane_workers = {}  # trigger Arduino -> LaneWorker của làn
 root = None
+scan_client = None  # GateClient (HTTP) hoặc GateSocketClient (WebSocket)
+voice_cache = None
+journal = None
+replay_worker = None
+
+# CẤU HÌNH ẢNH GỬI LÊN SERVER
+JPEG_QUALITY = 85
+# Cạnh dài tối đa: model biển số chạy ở 640px, giữ 1280px để ảnh biển số cắt ra vẫn đủ nét cho OCR
+MAX_SIDE = 1280
+# Chụp loạt khi có xe: số khung, thời gian tối đa (giây); chỉ gửi khung tốt nhất đạt chất lượng
+BURST_SIZE = 5
+BURST_TIMEOUT = 0.6
 
 def init_globals(**kwargs):
-    global arduino, API_URL, cam_in, cam_out
-    global label_captured_in, label_captured_out
-    global label_cam_in, label_cam_out
-    global plate_text_in, plate_text_out, root
+    global arduino, API_URL, lanes, lane_workers, root, scan_client, voice_cache
+    global journal, replay_worker
 
     for k, v in kwargs.items():
         globals()[k] = v
 
 
-def show_captured_image(frame, gate_type):
+def _show_captured_image(frame, lane):
     frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
     img = Image.fromarray(frame_rgb)
     img = img.resize((280, 200), Image.Resampling.LANCZOS)
     imgtk = ImageTk.PhotoImage(image=img)
+    lane.label_captured.imgtk = imgtk
+    lane.label_captured.configure(image=imgtk)
 
-    if gate_type == "IN":
-        label_captured_in.imgtk = imgtk
-        label_captured_in.configure(image=imgtk)
-    elif gate_type == "OUT":
-        label_captured_out.imgtk = imgtk
-        label_captured_out.configure(image=imgtk)
+
+# HÀM: các thread làn không sửa widget trực tiếp, chuyển việc cập nhật giao diện về luồng Tk
+def show_captured_image(frame, lane):
+    root.after(0, _show_captured_image, frame, lane)
 
 
 def _play_audio(fp):
@@ -50,87 +56,138 @@ def _play_audio(fp):
     pygame.mixer.music.play()
 
 
+# HÀM: phát mp3 (bytes) ở thread riêng
+def play_async(audio):
+    threading.Thread(target=_play_audio, args=(io.BytesIO(audio),), daemon=True).start()
+
+
 def speak_google_async(text):
-    if not text.strip():
+    if not text or not text.strip():
         return
+    # câu đã có trong bộ đệm thì phát ngay (không cần mạng), câu mới được tạo ở thread nền
+    voice_cache.speak(text)
+
+
+# HÀM: thu nhỏ (nếu lớn hơn max_side) và nén JPEG ngay trong bộ nhớ, không ghi file ra đĩa
+def encode_frame(frame, quality=JPEG_QUALITY, max_side=MAX_SIDE):
+    h, w = frame.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        frame = cv2.resize(frame, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Không nén được ảnh")
+    return buf.tobytes()
+
+
+# HÀM: chụp loạt ảnh và chọn khung nét/đủ sáng/ít chuyển động nhất, None nếu không khung nào đạt
+def capture_best_frame(cam):
+    frames = cam.burst(BURST_SIZE, BURST_TIMEOUT)
+    if not frames:
+        return None
+    frame, info = select_best_frame(frames)
+    if frame is None:
+        print("❌ Không có khung hình đạt chất lượng:", [", ".join(i['reasons']) for i in info])
+    return frame
+
+
+_serial_lock = threading.Lock()
+
+
+# HÀM: gửi lệnh xuống Arduino; nhiều làn dùng chung 1 cổng serial nên phải khóa khi ghi
+def send_command(command):
+    with _serial_lock:
+        arduino.write(f"{command}\n".encode())  # gửi kiểu byte
 
-    # Tạo bộ nhớ đệm (RAM) để lưu âm thanh MP3
-    fp = io.BytesIO()
-    # Chuyển văn bản thành giọng đọc tiếng Việt và ghi trực tiếp vào fp
-    gTTS(text=text, lang='vi').write_to_fp(fp)
-    # Đưa con trỏ đọc/ghi của fp về đầu để chuẩn bị load
-    fp.seek(0)
-    # Tạo thread để phát âm thanh song song
-    threading.Thread(target=_play_audio, args=(fp,), daemon=True).start()
-
-
-def capture_and_send(cam, event_type):
-    ret, frame = cam.read()
-    if ret:
-        filename = "plate.jpg"
-        cv2.imwrite(filename, frame)
-        show_captured_image(frame, event_type)
-        with open(filename, "rb") as img: # mở file nhị phân
-            files = {"image": img}
-            data = {"direction": event_type}
-            try:
-                response = requests.post(API_URL, files=files, data=data)
-                resp_json = response.json()
-                plate_info = resp_json.get("plate_text")
-                msg = resp_json.get("msg")
-                ok = resp_json.get("ok")
-                if event_type == "IN":
-                    plate_text_in.set(plate_info)
-                else:
-                    plate_text_out.set(plate_info)
-
-                speak_google_async(msg)
-
-                if ok:
-                    if event_type == 'IN':
-                        arduino.write(b"OPEN_IN\n") # gửi kiểu byte
-                    else:
-                        arduino.write(b"OPEN_OUT\n")
-            except Exception as e:
-                print("❌ Lỗi gửi ảnh:", e)
-    else:
-        print("❌ Không chụp được ảnh")
 
+# HÀM: xử lý kết quả server trả về: hiện biển số, đọc thông báo, mở barie của làn nếu hợp lệ
+def handle_result(resp_json, lane):
+    plate_info = resp_json.get("plate_text")
+    msg = resp_json.get("msg")
+    ok = resp_json.get("ok")
+    root.after(0, lane.plate_text.set, plate_info)
 
+    speak_google_async(msg)
+
+    if ok:
+        send_command(lane.open_command)
+
+
+# HÀM: chụp -> gửi -> mở barie cho 1 làn, chạy trên thread riêng của làn (LaneWorker)
+def capture_and_send(lane):
+    event_type = lane.direction
+    frame = capture_best_frame(lane.cam)
+    if frame is None:
+        print(f"❌ Làn {lane.name}: không chụp được ảnh phù hợp, bỏ qua lượt gửi")
+        return
+    show_captured_image(frame, lane)
+    event_id = uuid.uuid4().hex  # server dùng mã này để không xử lý 1 sự kiện 2 lần
+    captured_at = datetime.now(timezone.utc).isoformat()
+    files = {"image": (f"{lane.name}.jpg", encode_frame(frame), "image/jpeg")}
+    data = {"direction": event_type, "event_id": event_id, "captured_at": captured_at, "lane": lane.name}
+
+    # xe đang đứng ở barie -> luôn gửi thẳng để mở cổng ngay; sự kiện cũ trong hàng đợi do thread nền gửi lại
+    # (kết quả gửi lại chỉ để ghi sổ, không điều khiển barie), 1 sự kiện kẹt trong hàng đợi không chặn làn
+    if len(journal):
+        replay_worker.wake()
+    try:
+        resp_json = scan_client.post_scan(files, data)
+    except requests.RequestException as e:
+        journal.append(event_id, event_type, captured_at, files)
+        replay_worker.wake()
+        print("📥 Lỗi gửi ảnh, đã lưu sự kiện vào hàng đợi:", e)
+        return
+    try:
+        handle_result(resp_json, lane)
+    except Exception as e:
+        print("❌ Lỗi xử lý kết quả:", e)
+
+
+# Thread đọc Arduino chỉ chuyển tín hiệu cho làn tương ứng, không tự chụp/gửi nên không bao giờ bị chặn
 def arduino_listener():
     while True:
         try:
             line = arduino.readline().decode().strip()
-            if line == "VEHICLE_IN":
-                capture_and_send(cam_in, "IN")
-            elif line == "VEHICLE_OUT":
-                capture_and_send(cam_out, "OUT")
+            worker = lane_workers.get(line)
+            if worker is not None:
+                worker.submit()
         except Exception as e:
             print("❌ Lỗi Arduino:", e)
-        time.sleep(0.1)
+            time.sleep(0.1)
+
+
+# CẤU HÌNH XEM TRƯỚC CAMERA
+PREVIEW_FPS = 15
+PREVIEW_SIZE = (320, 240)
+_preview_seq = {}
+
+
+# HÀM: vẽ khung mới nhất lên label (bỏ qua nếu camera chưa có khung mới), dùng lại PhotoImage cũ
+def render_preview(cam, label):
+    seq, frame = cam.latest()
+    if frame is None or _preview_seq.get(label) == seq:
+        return
+    _preview_seq[label] = seq
+    frame = cv2.resize(frame, PREVIEW_SIZE, interpolation=cv2.INTER_AREA)
+    img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    imgtk = getattr(label, 'imgtk', None)
+    if imgtk is not None and (imgtk.width(), imgtk.height()) == PREVIEW_SIZE:
+        imgtk.paste(img)
+    else:
+        imgtk = ImageTk.PhotoImage(image=img)
+        label.imgtk = imgtk
+        label.configure(image=imgtk)
 
 
 def update_frame():
-    ret1, frame1 = cam_in.read()
-    ret2, frame2 = cam_out.read()
-
-    if ret1:
-        frame1 = cv2.resize(frame1, (320, 240))
-        frame1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2RGB)
-        img1 = Image.fromarray(frame1)
-        imgtk1 = ImageTk.PhotoImage(image=img1)
-        label_cam_in.imgtk = imgtk1
-        label_cam_in.configure(image=imgtk1)
-
-    if ret2:
-        frame2 = cv2.resize(frame2, (320, 240))
-        frame2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2RGB)
-        img2 = Image.fromarray(frame2)
-        imgtk2 = ImageTk.PhotoImage(image=img2)
-        label_cam_out.imgtk = imgtk2
-        label_cam_out.configure(image=imgtk2)
-
-    root.after(30, update_frame)
+    start = time.perf_counter()
+    for lane in lanes:
+        render_preview(lane.cam, lane.label_cam)
+    render_ms = (time.perf_counter() - start) * 1000
+
+    # máy chậm (vẽ lâu) thì giãn chu kỳ để luồng Tk còn thời gian xử lý sự kiện
+    delay = max(int(1000 / PREVIEW_FPS), int(render_ms * 3))
+    root.after(delay, update_frame)
 
 
 def create_placeholder(size=(250, 250)):
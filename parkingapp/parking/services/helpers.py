@@ -1,9 +1,15 @@
 import os
 import math
 import calendar
-from datetime import datetime, date
+import threading
+import numpy as np
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, time, timedelta
+from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.conf import settings
+from django.utils import timezone
 
 from ..models import (FeeRule,
                       FeeType)
@@ -23,6 +29,78 @@ def upload_image(image, name, path):
     return save_path
 
 
+# HÀM: giải mã ảnh (bytes JPEG/PNG) trực tiếp trong bộ nhớ
+def decode_bytes(data: bytes) -> np.ndarray:
+    import cv2  # import khi dùng: worker API-only (ML_ENABLED=0) không nạp OpenCV
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Không đọc được ảnh")
+    return img
+
+
+# HÀM: giải mã ảnh upload từ bộ nhớ request (không ghi/đọc lại file trên đĩa)
+def decode_image(image) -> np.ndarray:
+    data = image.read()
+    image.seek(0)  # để các bước sau (upload Cloudinary) vẫn đọc lại được
+    return decode_bytes(data)
+
+
+# HÀM: nén ảnh (ndarray BGR) thành bytes JPEG trong bộ nhớ
+def encode_jpeg(img: np.ndarray, quality: int = 90) -> bytes:
+    import cv2
+    ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Không nén được ảnh")
+    return buf.tobytes()
+
+
+# HÀM: cắt vùng box (x1, y1, x2, y2) nới thêm margin (tỉ lệ theo kích thước box), trả về view không copy
+def crop_view(img: np.ndarray, box, margin: float = 0.0) -> np.ndarray:
+    x1, y1, x2, y2 = map(float, box)
+    dx, dy = (x2 - x1) * margin, (y2 - y1) * margin
+    h, w = img.shape[:2]
+    x1, y1 = max(0, int(x1 - dx)), max(0, int(y1 - dy))
+    x2, y2 = min(w, int(x2 + dx)), min(h, int(y2 + dy))
+    return img[y1:y2, x1:x2]
+
+
+# HÀM: đóng gói vector thành bytes float32 little-endian (lưu vào BinaryField)
+def pack_vector(vec) -> bytes:
+    return np.asarray(vec, dtype='<f4').tobytes()
+
+
+# HÀM: đọc vector float32 từ BinaryField, không copy dữ liệu
+def unpack_vector(blob) -> np.ndarray:
+    return np.frombuffer(blob, dtype='<f4')
+
+
+# HÀM: nhận đường dẫn ảnh hoặc ảnh đã giải mã (ndarray BGR)
+def load_image(image) -> np.ndarray:
+    if isinstance(image, np.ndarray):
+        return image
+    import cv2
+    img = cv2.imread(image)
+    if img is None:
+        raise FileNotFoundError(f"Không tìm thấy ảnh tại {image}")
+    return img
+
+
+_save_executor = None
+_save_lock = threading.Lock()
+
+
+# HÀM: lưu ảnh ra MEDIA_ROOT ở thread nền (chỉ khi bật SCAN_SAVE_IMAGES), không chặn lượt quét
+def save_image_async(data: bytes, filename, name, path):
+    global _save_executor
+    if not getattr(settings, 'SCAN_SAVE_IMAGES', False):
+        return None
+    if _save_executor is None:
+        with _save_lock:
+            if _save_executor is None:
+                _save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-save')
+    return _save_executor.submit(upload_image, ContentFile(data, name=filename), name, path)
+
+
 # HÀM: tính phí giữ xe
 def calculate_fee(minutes: int, fee_rule: FeeRule) -> int:
     if fee_rule.fee_type in [FeeType.MOTORCYCLE, FeeType.CAR]:
@@ -52,3 +130,19 @@ def create_df_dt(day, month, year) -> tuple[date, date]:
             "• Muốn theo năm: chỉ cần năm"
         )
     return df, dt
+
+
+# HÀM: 0h của ngày d theo múi giờ hiện tại (giống cách __date quy đổi)
+def start_of_day(d: date) -> datetime:
+    return timezone.make_aware(datetime.combine(d, time.min))
+
+
+# HÀM: khoảng ngày [date_from, date_to] (tính cả 2 đầu) -> điều kiện nửa mở trên cột datetime:
+# field >= 0h date_from và field < 0h ngày sau date_to. Không bọc cột trong DATE()/CONVERT_TZ nên MySQL dùng được index
+def date_range_lookups(field: str, date_from: Optional[date] = None, date_to: Optional[date] = None) -> dict:
+    lookups = {}
+    if date_from:
+        lookups[f'{field}__gte'] = start_of_day(date_from)
+    if date_to:
+        lookups[f'{field}__lt'] = start_of_day(date_to + timedelta(days=1))
+    return lookups
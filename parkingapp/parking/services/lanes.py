@@ -0,0 +1,81 @@
+import os
+import json
+import queue
+import threading
+
+# CẤU HÌNH LÀN MẶC ĐỊNH (1 làn vào + 1 làn ra như bãi nhỏ).
+# Bãi nhiều làn thì tạo lanes.json cạnh main_gui.py, mỗi làn 1 phần tử:
+# {"name": "in-2", "title": "LÀN VÀO 2", "camera": 2, "trigger": "VEHICLE_IN_2",
+#  "open_command": "OPEN_IN_2", "direction": "IN"}
+# trigger: dòng Arduino gửi lên khi có xe ở làn; open_command: lệnh gửi xuống để mở barie làn đó.
+DEFAULT_LANES = [
+    {"name": "in", "title": "CAMERA VÀO", "camera": 0, "trigger": "VEHICLE_IN",
+     "open_command": "OPEN_IN", "direction": "IN"},
+    {"name": "out", "title": "CAMERA RA", "camera": 1, "trigger": "VEHICLE_OUT",
+     "open_command": "OPEN_OUT", "direction": "OUT"},
+]
+DIRECTIONS = ("IN", "OUT")
+MAX_PENDING = 1  # số lượt chờ tối đa mỗi làn khi làn đang chụp/gửi (cảm biến báo lặp thì bỏ bớt)
+
+
+class Lane:
+    def __init__(self, name, camera, trigger, open_command, direction, title=None):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Làn {name}: direction phải là IN hoặc OUT")
+        self.name = name
+        self.camera = camera
+        self.trigger = trigger
+        self.open_command = open_command
+        self.direction = direction
+        self.title = title or name.upper()
+        # gán khi dựng giao diện / mở camera
+        self.cam = None
+        self.label_cam = None
+        self.label_captured = None
+        self.plate_text = None
+
+    def __repr__(self):
+        return f"Lane({self.name}, {self.direction}, camera={self.camera})"
+
+
+# HÀM: đọc cấu hình làn từ file JSON, không có file thì dùng 2 làn mặc định
+def load_lanes(path="lanes.json"):
+    configs = DEFAULT_LANES
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            configs = json.load(f)
+    lanes = [Lane(**config) for config in configs]
+    for field in ("name", "trigger"):
+        values = [getattr(lane, field) for lane in lanes]
+        if len(values) != len(set(values)):
+            raise ValueError(f"Cấu hình làn bị trùng {field}")
+    return lanes
+
+
+# Mỗi làn có 1 thread + hàng đợi riêng: chụp -> gửi -> mở barie của làn này không chờ làn khác
+class LaneWorker:
+    def __init__(self, lane, handler, max_pending=MAX_PENDING):
+        self.lane = lane
+        self.handler = handler
+        self._queue = queue.Queue(maxsize=max_pending)
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"lane-{self.lane.name}", daemon=True).start()
+        return self
+
+    # HÀM: báo có xe (gọi từ thread đọc Arduino), không chặn; làn đang bận và đã có lượt chờ thì bỏ qua
+    def submit(self):
+        try:
+            self._queue.put_nowait(True)
+            return True
+        except queue.Full:
+            print(f"⏳ Làn {self.lane.name} đang xử lý, bỏ qua tín hiệu lặp")
+            return False
+
+    def _run(self):
+        while True:
+            self._queue.get()
+            try:
+                self.handler(self.lane)
+            except Exception as e:
+                print(f"❌ Lỗi làn {self.lane.name}:", e)
@@ -1,68 +1,79 @@
+import os
 import serial
-import cv2
 import threading
 import tkinter as tk
-from handlers import init_globals, arduino_listener, update_frame, create_placeholder
+from handlers import init_globals, arduino_listener, update_frame, create_placeholder, play_async, capture_and_send
+from gate_http import GateClient, create_session
+from camera import CameraStream
+from voice_cache import VoiceCache
+from gate_journal import GateJournal, ReplayWorker
+from gate_ws_client import GateSocketClient
+from lanes import load_lanes, LaneWorker
+
+# ===== CẤU HÌNH LÀN (camera, tín hiệu Arduino, lệnh mở barie, hướng) =====
+lanes = load_lanes("lanes.json")
+LANES_PER_ROW = 4  # số làn hiển thị trên 1 hàng giao diện
 
 # ===== KẾT NỐI ARDUINO & CAMERA =====
 arduino = serial.Serial('COM3', 9600)
 API_URL = "http://127.0.0.1:8000/scan-plate/"
-cam_in = cv2.VideoCapture(0)
-cam_out = cv2.VideoCapture(1)
+# giữ kết nối tới server, có timeout + thử lại; mỗi làn + thread gửi lại hàng đợi có 1 kết nối riêng
+http_client = GateClient(API_URL, session=create_session(pool_size=len(lanes) + 1))
+# có access token của tài khoản nhân viên thì gửi khung hình qua 1 kết nối WebSocket giữ sẵn
+# (server đẩy quyết định về ngay); không có thì gửi từng lượt qua HTTP như cũ
+WS_URL = "ws://127.0.0.1:8000/ws/gate/"
+GATE_TOKEN = os.getenv("GATE_TOKEN")
+scan_client = GateSocketClient(WS_URL, GATE_TOKEN) if GATE_TOKEN else http_client
+journal = GateJournal("gate_journal.sqlite3")  # sự kiện chưa gửi được khi mất mạng
+replay_worker = ReplayWorker(journal, http_client).start()
+for lane in lanes:
+    lane.cam = CameraStream(lane.camera, f"camera-{lane.name}").start()  # thread đọc riêng, luôn giữ khung mới nhất
+
+# ===== GIỌNG ĐỌC (mp3 lưu sẵn trên đĩa, phát không cần mạng) =====
+voice_cache = VoiceCache("voice_cache", player=play_async)
+voice_cache.warm()
 
 # ===== TẠO GIAO DIỆN =====
 root = tk.Tk()
 root.title("BÃI ĐỖ XE THÔNG MINH")
 root.configure(bg="#f0f4f7")
+columns = min(len(lanes), LANES_PER_ROW)
 
 # ===== TIÊU ĐỀ =====
 title_label = tk.Label(
     root, text="BÃI ĐỖ XE THÔNG MINH",
     font=("Arial", 20, "bold"), bg="#00aaff", fg="white", pady=12
 )
-title_label.grid(row=0, column=0, columnspan=3, sticky="nsew", padx=5, pady=5)
+title_label.grid(row=0, column=0, columnspan=columns, sticky="nsew", padx=5, pady=5)
 
 # ===== ẢNH MẶC ĐỊNH =====
 placeholder_img = create_placeholder()
 
-# ===== CAMERA VÀO =====
-frame_in = tk.LabelFrame(root, text="CAMERA VÀO", font=("Arial", 12, "bold"), padx=10, pady=10, bg="white")
-frame_in.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
-label_cam_in = tk.Label(frame_in, image=placeholder_img, bg="white")
-label_cam_in.pack()
+# ===== MỖI LÀN: CAMERA, ẢNH CHỤP, BIỂN SỐ =====
+for i, lane in enumerate(lanes):
+    row, column = 1 + (i // LANES_PER_ROW) * 3, i % LANES_PER_ROW
+    frame = tk.LabelFrame(root, text=lane.title, font=("Arial", 12, "bold"), padx=10, pady=10, bg="white")
+    frame.grid(row=row, column=column, padx=10, pady=10, sticky="nsew")
+    lane.label_cam = tk.Label(frame, image=placeholder_img, bg="white")
+    lane.label_cam.pack()
 
-# ===== CAMERA RA =====
-frame_out = tk.LabelFrame(root, text="CAMERA RA", font=("Arial", 12, "bold"), padx=10, pady=10, bg="white")
-frame_out.grid(row=1, column=1, padx=10, pady=10, sticky="nsew")
-label_cam_out = tk.Label(frame_out, image=placeholder_img, bg="white")
-label_cam_out.pack()
+    lane.label_captured = tk.Label(root, image=placeholder_img, bg="white", bd=2, relief="groove")
+    lane.label_captured.grid(row=row + 1, column=column, pady=5)
 
+    lane.plate_text = tk.StringVar()
+    fg, bg = ("green", "#e8f5e9") if lane.direction == "IN" else ("red", "#ffebee")
+    plate_label = tk.Label(root, textvariable=lane.plate_text, font=("Arial", 14, "bold"), fg=fg, bg=bg, relief="groove")
+    plate_label.grid(row=row + 2, column=column, pady=5, padx=5, sticky="nsew")
 
-# ===== ẢNH CHỤP XE VÀO =====
-label_captured_in = tk.Label(root, image=placeholder_img, bg="white", bd=2, relief="groove")
-label_captured_in.grid(row=2, column=0, pady=5)
-
-# ===== ẢNH CHỤP XE RA =====
-label_captured_out = tk.Label(root, image=placeholder_img, bg="white", bd=2, relief="groove")
-label_captured_out.grid(row=2, column=1, pady=5)
-
-# ===== BIỂN SỐ XE VÀO =====
-plate_text_in = tk.StringVar()
-plate_label_in = tk.Label(root, textvariable=plate_text_in, font=("Arial", 14, "bold"), fg="green", bg="#e8f5e9", relief="groove")
-plate_label_in.grid(row=3, column=0, pady=5, padx=5, sticky="nsew")
-
-# ===== BIỂN SỐ XE RA =====
-plate_text_out = tk.StringVar()
-plate_label_out = tk.Label(root, textvariable=plate_text_out, font=("Arial", 14, "bold"), fg="red", bg="#ffebee", relief="groove")
-plate_label_out.grid(row=3, column=1, pady=5, padx=5,  sticky="nsew")
+# ===== THREAD XỬ LÝ RIÊNG CHO TỪNG LÀN =====
+lane_workers = {lane.trigger: LaneWorker(lane, capture_and_send).start() for lane in lanes}
 
 # ===== TRUYỀN BIẾN CHO handlers.py =====
 init_globals(
     arduino=arduino,
-    API_URL=API_URL, cam_in=cam_in, cam_out=cam_out,
-    label_captured_in=label_captured_in, label_captured_out=label_captured_out,
-    label_cam_in=label_cam_in, label_cam_out=label_cam_out,
-    plate_text_in=plate_text_in, plate_text_out=plate_text_out, root=root
+    API_URL=API_URL, scan_client=scan_client, lanes=lanes, lane_workers=lane_workers,
+    root=root, voice_cache=voice_cache,
+    journal=journal, replay_worker=replay_worker
 )
 
 # ===== CHẠY THREAD & CẬP NHẬT CAMERA =====
@@ -70,13 +81,17 @@ threading.Thread(target=arduino_listener, daemon=True).start()
 update_frame()
 
 # ===== TÙY CHỈNH KÍCH THƯỚC CỘT =====
-root.grid_columnconfigure(0, weight=1)
-root.grid_columnconfigure(1, weight=1)
-root.grid_columnconfigure(2, weight=0)
+for column in range(columns):
+    root.grid_columnconfigure(column, weight=1)
 
-root.geometry("1000x720")
+rows = (len(lanes) + LANES_PER_ROW - 1) // LANES_PER_ROW
+root.geometry(f"{500 * columns}x{60 + 660 * rows}")
 root.mainloop()
 
 # ===== GIẢI PHÓNG CAMERA =====
-cam_in.release()
-cam_out.release()
+for lane in lanes:
+    lane.cam.release()
+if scan_client is not http_client:
+    scan_client.close()
+http_client.close()
+journal.close()
@@ -0,0 +1,115 @@
+import threading
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# CẤU HÌNH
+MODEL_PLATE_PATH = "parking/runs/detect/plate/weights/best.pt"
+MODEL_CHAR_PATH = "parking/runs/detect/ocr/weights/best.pt"
+MODEL_VEHICLE_PATH = "yolov8n.pt"
+FACE_MODEL_NAME = "buffalo_l"
+REID_MODEL_NAME = "osnet_x1_0"
+
+
+# ----------  Các hàm load model (import thư viện nặng bên trong để chỉ chạy khi cần)  ----------
+# HÀM: giới hạn số thread nội bộ của torch/OpenCV để các bước chạy song song không tranh CPU
+def _apply_thread_budget():
+    threads = getattr(settings, 'SCAN_INTRAOP_THREADS', 0)
+    if threads > 0:
+        import cv2
+        import torch
+        cv2.setNumThreads(threads)
+        torch.set_num_threads(threads)
+
+
+def backend_for(name):
+    return getattr(settings, 'MODEL_BACKENDS', {}).get(name, 'native')
+
+
+def _load_yolo(name, path, backend):
+    from .backends import load_yolo
+    _apply_thread_budget()
+    return load_yolo(name, path, backend)
+
+
+def _load_face(backend):
+    from .backends import load_face
+    return load_face(FACE_MODEL_NAME, backend)
+
+
+def _load_reid(backend):
+    from .backends import load_reid
+    _apply_thread_budget()
+    return load_reid('reid', REID_MODEL_NAME, backend)
+
+
+class ModelsDisabled(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Worker này không chạy các model AI (ML_ENABLED=0)."
+    default_code = 'models_disabled'
+
+
+# Mỗi model chỉ được load 1 lần cho mỗi process, lần đầu tiên có nơi cần dùng.
+# Mỗi model có 1 lock riêng để các thread load song song các model khác nhau.
+class ModelRegistry:
+    def __init__(self, loaders, backends=None):
+        self._loaders = dict(loaders)
+        self.backends = dict(backends or {})
+        self._locks = {name: threading.Lock() for name in self._loaders}
+        self._models = {}
+
+    @property
+    def enabled(self):
+        # worker "API-only" (ML_ENABLED=0) không bao giờ import/load các thư viện AI
+        return getattr(settings, 'ML_ENABLED', True)
+
+    def names(self):
+        return list(self._loaders)
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is None:
+            if not self.enabled:
+                raise ModelsDisabled()
+            with self._locks[name]:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._loaders[name]()
+                    self._models[name] = model
+        return model
+
+    # HÀM: load trước các model (gọi khi worker khởi động), trả về lỗi theo từng model
+    def warm_up(self, names=None):
+        errors = {}
+        if not self.enabled:
+            return errors
+        for name in names or self.names():
+            try:
+                self.get(name)
+            except Exception as e:
+                errors[name] = str(e)
+        return errors
+
+    def is_ready(self, names=None):
+        if not self.enabled:
+            return True
+        return all(name in self._models for name in names or self.names())
+
+    def status(self):
+        return {name: name in self._models for name in self.names()}
+
+
+# HÀM: tạo registry với backend cho từng model (mặc định theo settings.MODEL_BACKENDS)
+def build_registry(backends=None):
+    names = ('plate', 'char', 'vehicle', 'face', 'reid')
+    chosen = {name: (backends or {}).get(name) or backend_for(name) for name in names}
+    return ModelRegistry({
+        'plate': lambda: _load_yolo('plate', MODEL_PLATE_PATH, chosen['plate']),
+        'char': lambda: _load_yolo('char', MODEL_CHAR_PATH, chosen['char']),
+        'vehicle': lambda: _load_yolo('vehicle', MODEL_VEHICLE_PATH, chosen['vehicle']),
+        'face': lambda: _load_face(chosen['face']),
+        'reid': lambda: _load_reid(chosen['reid']),
+    }, chosen)
+
+
+registry = build_registry()
@@ -0,0 +1,128 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .helpers import decode_bytes, save_image_async, crop_view, encode_jpeg
+from .model_registry import registry
+from .detection_face import math_emb, detect_face
+from .detection_plate import detect_license_plates, locate_vehicle
+from .detection_vehicle import extract_vehicle_features
+from .services import proces
+
+# CẤU HÌNH cắt vùng từ khung hình (tỉ lệ nới thêm so với box model trả về)
+VEHICLE_CROP_MARGIN = 0.05  # giữ biển số sát mép xe
+FACE_CROP_MARGIN = 0.2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# HÀM: thread pool dùng chung của process, giới hạn bởi SCAN_PIPELINE_WORKERS
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'SCAN_PIPELINE_WORKERS', 3),
+                                               thread_name_prefix='scan')
+    return _executor
+
+
+# Ghi lại thời gian (ms) của từng bước trong 1 lượt quét
+class StageTimer:
+    def __init__(self):
+        self.timings = {}
+
+    def run(self, name, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+# Mỗi ảnh chỉ đọc + giải mã 1 lần trong bộ nhớ, lưu ra đĩa (nếu bật) chạy nền
+def _decode(timer, name, image, folder):
+    data = image.read()
+    image.seek(0)
+    save_image_async(data, image.name, name, folder)
+    return timer.run(f'{name}_decode', decode_bytes, data)
+
+
+def _face_stage(timer, face_file):
+    img = _decode(timer, 'face', face_file, 'faces')
+    return timer.run('face_embedding', math_emb, img)
+
+
+def _plate_stage(timer, plate_file):
+    img = _decode(timer, 'plate', plate_file, 'plates')
+    return timer.run('plate_ocr', detect_license_plates, img)
+
+
+def _vehicle_stage(timer, vehicle_file):
+    img = _decode(timer, 'vehicle', vehicle_file, 'vehicles')
+    return timer.run('vehicle_features', extract_vehicle_features, img)
+
+
+# HÀM: chạy song song 3 nhánh độc lập (khuôn mặt, biển số, đặc trưng xe), chỉ chờ khi proces cần kết quả
+def run_scan(face_file, plate_file, vehicle_file, direction, captured_at=None):
+    timer = StageTimer()
+    start = time.perf_counter()
+    executor = get_executor()
+
+    face = executor.submit(_face_stage, timer, face_file)
+    plate = executor.submit(_plate_stage, timer, plate_file)
+    # lượt ra không cần so khớp ảnh xe
+    vehicle = executor.submit(_vehicle_stage, timer, vehicle_file) if direction != 'OUT' else None
+
+    emb = face.result()
+    plate_text = plate.result()
+    vehicle_features = vehicle.result() if vehicle else None
+    if emb is None:
+        ok, msg = False, "Không phát hiện khuôn mặt."
+    else:
+        ok, msg = timer.run('proces', proces, emb, face_file, vehicle_features, plate_text, direction, captured_at)
+
+    timer.timings['total'] = round((time.perf_counter() - start) * 1000, 1)
+    return ok, msg, plate_text, timer.timings
+
+
+# HÀM: khuôn mặt trong khung hình -> (embedding, ảnh khuôn mặt cắt sẵn để lưu), (None, None) nếu không thấy
+def _frame_face_stage(timer, frame):
+    face = timer.run('face_detect', detect_face, frame)
+    if face is None:
+        return None, None
+    face_jpeg = timer.run('face_encode', encode_jpeg, crop_view(frame, face.bbox, FACE_CROP_MARGIN))
+    return face.normed_embedding, ContentFile(face_jpeg, name='face.jpg')
+
+
+# HÀM: quét từ 1 khung hình (tùy chọn thêm 1 ảnh từ camera khuôn mặt riêng).
+# Ảnh chỉ giải mã 1 lần; vùng xe là view trên cùng mảng, model biển số và OSNet chạy trên vùng này.
+def run_frame_scan(image_file, direction, captured_at=None, face_file=None):
+    timer = StageTimer()
+    start = time.perf_counter()
+    executor = get_executor()
+
+    frame = _decode(timer, 'frame', image_file, 'frames')
+    face_frame = _decode(timer, 'face', face_file, 'faces') if face_file is not None else frame
+    face = executor.submit(_frame_face_stage, timer, face_frame)
+
+    box = timer.run('vehicle_detect', locate_vehicle, frame, registry.get('vehicle'))
+    vehicle_img = crop_view(frame, box, VEHICLE_CROP_MARGIN) if box is not None else frame
+    plate = executor.submit(timer.run, 'plate_ocr', detect_license_plates, vehicle_img)
+    # lượt ra không cần so khớp ảnh xe
+    vehicle = executor.submit(timer.run, 'vehicle_features', extract_vehicle_features, vehicle_img) \
+        if direction != 'OUT' else None
+
+    emb, face_img = face.result()
+    plate_text = plate.result()
+    vehicle_features = vehicle.result() if vehicle else None
+    if emb is None:
+        ok, msg = False, "Không phát hiện khuôn mặt."
+    else:
+        ok, msg = timer.run('proces', proces, emb, face_img, vehicle_features, plate_text, direction, captured_at)
+
+    timer.timings['total'] = round((time.perf_counter() - start) * 1000, 1)
+    return ok, msg, plate_text, timer.timings
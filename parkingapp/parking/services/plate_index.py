@@ -0,0 +1,118 @@
+import time
+import threading
+from django.conf import settings
+
+from ..models import Vehicle, normalize_plate
+
+
+# HÀM: khoảng cách Levenshtein, dừng sớm khi chắc chắn vượt quá max_dist
+def edit_distance(a: str, b: str, max_dist=None) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+    if max_dist is not None and len(a) - len(b) > max_dist:
+        return max_dist + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if max_dist is not None and min(cur) > max_dist:
+            return max_dist + 1
+        prev = cur
+    return prev[-1]
+
+
+# BK-tree: chỉ duyệt các nhánh có thể nằm trong bán kính max_dist (bất đẳng thức tam giác)
+class BKTree:
+    def __init__(self):
+        self._root = None  # [plate, value, {khoảng cách: node con}]
+
+    def add(self, plate, value):
+        if self._root is None:
+            self._root = [plate, value, {}]
+            return
+        node = self._root
+        while True:
+            dist = edit_distance(plate, node[0])
+            if dist == 0:
+                node[1] = value
+                return
+            child = node[2].get(dist)
+            if child is None:
+                node[2][dist] = [plate, value, {}]
+                return
+            node = child
+
+    def search(self, plate, max_dist):
+        results = []
+        stack = [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            dist = edit_distance(plate, node[0])
+            if dist <= max_dist:
+                results.append((dist, node[0], node[1]))
+            for d, child in node[2].items():
+                if dist - max_dist <= d <= dist + max_dist:
+                    stack.append(child)
+        return sorted(results, key=lambda x: x[0])
+
+
+# Chỉ mục biển số xe đã duyệt trong RAM, dựng lại khi có thay đổi hoặc hết hạn (đồng bộ giữa các worker)
+class PlateIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tree = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        self._tree = None
+
+    def _is_fresh(self):
+        ttl = getattr(settings, 'PLATE_INDEX_TTL', 60)
+        return self._tree is not None and time.monotonic() - self._built_at <= ttl
+
+    def _get_tree(self):
+        if not self._is_fresh():
+            with self._lock:
+                if self._is_fresh():
+                    return self._tree
+                tree = BKTree()
+                rows = Vehicle.objects.filter(is_approved=True).values_list('plate_normalized', 'id')
+                for plate, vehicle_id in rows:
+                    if plate:
+                        tree.add(plate, vehicle_id)
+                self._tree, self._built_at = tree, time.monotonic()
+        return self._tree
+
+    # HÀM: tìm xe gần đúng nhất; trả về (vehicle_id, khoảng cách) hoặc None nếu không có / không chắc chắn
+    def lookup(self, plate_text, max_dist=None):
+        plate = normalize_plate(plate_text)
+        if max_dist is None:
+            max_dist = getattr(settings, 'PLATE_MATCH_MAX_DISTANCE', 1)
+        if len(plate) < getattr(settings, 'PLATE_MATCH_MIN_LENGTH', 6):
+            return None
+        matches = self._get_tree().search(plate, max_dist)
+        if not matches:
+            return None
+        # 2 biển số cùng khoảng cách nhỏ nhất -> không đủ tin cậy để chọn
+        if len(matches) > 1 and matches[1][0] == matches[0][0]:
+            return None
+        return matches[0][2], matches[0][0]
+
+
+plate_index = PlateIndex()
+
+
+# HÀM: tìm xe đã duyệt theo biển số OCR: khớp chính xác (cột có index) rồi mới tới khớp gần đúng
+def find_approved_vehicle(plate_text):
+    plate = normalize_plate(plate_text)
+    if not plate:
+        return None
+    vehicles = Vehicle.objects.select_related("user").filter(is_approved=True)
+    vehicle = vehicles.filter(plate_normalized=plate).first()
+    if vehicle is not None:
+        return vehicle
+    match = plate_index.lookup(plate)
+    if match is None:
+        return None
+    return vehicles.filter(id=match[0]).first()
@@ -1,13 +1,14 @@
-from .detection_face import find_or_create_user_face
-from ..models import (Vehicle,
-                      ParkingStatus,
+from .detection_face import find_or_create_user_face, scoped_face_ids
+from ..models import (ParkingStatus,
                       User,
                       Payment,
                       PaymentStatus)
 from django.db import transaction
 from .payment import process_payment
 from .parking import create_parking, update_parking
+from .stats import record_check_out
 from .detection_vehicle import check_vehicle
+from .plate_index import find_approved_vehicle
 
 
 # HÀM: Tạo mới thanh toán
@@ -24,11 +25,9 @@ def create_payment(user: User, fee: int) -> tuple[bool, str]:
     return True, "Xin mời ra."
 
 
-def proces(emb, face_img, vehicle_img, plate_text: str, direction: ParkingStatus = "IN") -> tuple[bool, str]:
-    vehicle = Vehicle.objects.select_related("user").filter(
-        license_plate=plate_text,
-        is_approved=True
-    ).first()
+def proces(emb, face_img, vehicle_features, plate_text: str, direction: ParkingStatus = "IN",
+           captured_at=None) -> tuple[bool, str]:
+    vehicle = find_approved_vehicle(plate_text)
 
     if vehicle is None:
         return False, "Không tìm thấy phương tiện khớp với biển số"
@@ -36,7 +35,7 @@ def proces(emb, face_img, vehicle_img, plate_text: str, direction: ParkingStatus
     if direction == 'OUT':
 
         with transaction.atomic():
-            ok, log = update_parking(emb, vehicle)
+            ok, log = update_parking(emb, vehicle, captured_at)
             if not ok:
                 return ok, log
             try:
@@ -46,12 +45,13 @@ def proces(emb, face_img, vehicle_img, plate_text: str, direction: ParkingStatus
                 log.save(
                     update_fields=['check_out', 'duration_minutes', 'status', 'fee']
                 )
+                record_check_out(log)
             except Exception as e:
                 return ok, "Có lỗi " + str(e)
         return ok, msg
-    ok, msg = check_vehicle(vehicle.image, vehicle_img)
+    ok, msg = check_vehicle(vehicle, vehicle_features)
     if not ok:
         return ok, msg
-    user_face = find_or_create_user_face(emb, face_img)
-    ok, msg = create_parking(vehicle, vehicle.vehicle_type, user_face.id)
+    user_face = find_or_create_user_face(emb, face_img, candidate_ids=scoped_face_ids(vehicle))
+    ok, msg = create_parking(vehicle, vehicle.vehicle_type, user_face.id, captured_at)
     return ok, msg
@@ -0,0 +1,68 @@
+from datetime import date
+from typing import Optional
+from django.db.models import F, Sum, Count, Q
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .helpers import date_range_lookups
+from ..models import DailyParkingStat, ParkingLog, ParkingStatus
+
+STAT_FIELDS = ('entries', 'exits', 'revenue', 'minutes')
+
+
+# HÀM: cộng dồn vào dòng tổng hợp (ngày tạo lượt gửi, loại xe, người dùng) bằng F() -> không mất số khi ghi đồng thời.
+# Gọi trong cùng transaction với thao tác trên ParkingLog
+def _bump(log: ParkingLog, **deltas):
+    stat, _ = DailyParkingStat.objects.get_or_create(
+        day=timezone.localdate(log.created_date), vehicle_type=log.fee_rule.fee_type, user_id=log.user_id
+    )
+    DailyParkingStat.objects.filter(pk=stat.pk).update(**{field: F(field) + value for field, value in deltas.items()})
+
+
+# HÀM: ghi nhận 1 lượt vào bãi
+def record_check_in(log: ParkingLog):
+    _bump(log, entries=1)
+
+
+# HÀM: ghi nhận 1 lượt lấy xe (phí + thời gian gửi)
+def record_check_out(log: ParkingLog):
+    _bump(log, exits=1, revenue=log.fee or 0, minutes=log.duration_minutes or 0)
+
+
+# HÀM: lọc bảng tổng hợp theo khoảng ngày (tính cả 2 đầu) và người dùng
+def stats_range(date_from: Optional[date] = None, date_to: Optional[date] = None, user=None):
+    stats = DailyParkingStat.objects.all()
+    if user is not None:
+        stats = stats.filter(user=user)
+    if date_from:
+        stats = stats.filter(day__gte=date_from)
+    if date_to:
+        stats = stats.filter(day__lte=date_to)
+    return stats
+
+
+# HÀM: tổng 1 cột trong khoảng ngày
+def sum_stat(field: str, date_from: Optional[date] = None, date_to: Optional[date] = None, user=None) -> int:
+    return stats_range(date_from, date_to, user).aggregate(total=Coalesce(Sum(field), 0))['total']
+
+
+# HÀM: tính lại số liệu tổng hợp từ ParkingLog -> {(ngày, loại xe, user_id): {entries, exits, revenue, minutes}}
+def compute_daily_stats(date_from: Optional[date] = None, date_to: Optional[date] = None) -> dict:
+    logs = ParkingLog.objects.filter(**date_range_lookups('created_date', date_from, date_to))
+    out = Q(status=ParkingStatus.OUT)
+    rows = (logs.annotate(day=TruncDate('created_date'))
+            .values('day', 'fee_rule__fee_type', 'user_id')
+            .annotate(entries=Count('id'),
+                      exits=Count('id', filter=out),
+                      revenue=Coalesce(Sum('fee', filter=out), 0),
+                      minutes=Coalesce(Sum('duration_minutes', filter=out), 0))
+            .order_by())
+    return {(row['day'], row['fee_rule__fee_type'], row['user_id']): {field: row[field] for field in STAT_FIELDS}
+            for row in rows}
+
+
+# HÀM: số liệu đang lưu trong bảng tổng hợp, cùng dạng với compute_daily_stats
+def stored_daily_stats(date_from: Optional[date] = None, date_to: Optional[date] = None) -> dict:
+    rows = stats_range(date_from, date_to).values('day', 'vehicle_type', 'user_id', *STAT_FIELDS)
+    return {(row['day'], row['vehicle_type'], row['user_id']): {field: row[field] for field in STAT_FIELDS}
+            for row in rows}
@@ -0,0 +1,96 @@
+import io
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Các câu server trả về trong "msg" (services.proces / parking / detection_vehicle / Wallet.withdraw)
+KNOWN_PROMPTS = [
+    "Xin mời vào.",
+    "Xin mời ra.",
+    "Không tìm thấy phương tiện khớp với biển số",
+    "Phương tiện này đang có trong bãi",
+    "Không hợp lệ.",
+    "Xác thực khuôn mặt thất bại",
+    "Không tìm thấy xe lượt vào bãi",
+    "Phương tiện chưa có ảnh đăng ký.",
+    "Phát hiện gian lận biển số.",
+    "Có lỗi Số dư không đủ.",
+    "Có lỗi Ví đã bị khóa.",
+]
+
+
+def prompt_key(text):
+    return hashlib.sha1(text.strip().encode('utf-8')).hexdigest()
+
+
+def synthesize_gtts(text, lang):
+    from gtts import gTTS
+    fp = io.BytesIO()
+    gTTS(text=text, lang=lang).write_to_fp(fp)
+    return fp.getvalue()
+
+
+# Bộ đệm giọng đọc: file mp3 lưu trên đĩa theo hash của câu, nạp hết vào RAM khi khởi động.
+# Câu đã có -> phát ngay, không cần mạng; câu mới -> tạo bằng gTTS ở thread nền rồi phát và lưu lại.
+class VoiceCache:
+    def __init__(self, cache_dir, player, lang='vi', synthesize=synthesize_gtts):
+        self.cache_dir = cache_dir
+        self.lang = lang
+        self._player = player
+        self._synthesize = synthesize
+        self._audio = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts')
+        self.load()
+
+    def load(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.mp3'):
+                with open(os.path.join(self.cache_dir, filename), 'rb') as f:
+                    self._audio[filename[:-4]] = f.read()
+        return len(self._audio)
+
+    def __contains__(self, text):
+        return prompt_key(text) in self._audio
+
+    # HÀM: tạo trước các câu còn thiếu (chạy nền, lúc có mạng)
+    def warm(self, texts=KNOWN_PROMPTS):
+        for text in texts:
+            if text not in self:
+                self._schedule(text, play=False)
+
+    def speak(self, text):
+        if not text or not text.strip():
+            return
+        audio = self._audio.get(prompt_key(text))
+        if audio is not None:
+            self._player(audio)
+        else:
+            self._schedule(text, play=True)
+
+    def _schedule(self, text, play):
+        key = prompt_key(text)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._render, text, key, play)
+
+    def _render(self, text, key, play):
+        try:
+            audio = self._synthesize(text.strip(), self.lang)
+            tmp = os.path.join(self.cache_dir, f"{key}.mp3.tmp")
+            with open(tmp, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp, os.path.join(self.cache_dir, f"{key}.mp3"))
+            self._audio[key] = audio
+            if play:
+                self._player(audio)
+        except Exception as e:
+            print("❌ Không tạo được giọng đọc:", text, e)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
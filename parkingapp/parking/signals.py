@@ -1,10 +1,47 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.conf import settings
+from django.db import transaction
 from django.dispatch import receiver
-from .models import Wallet
+from .models import Wallet, UserFace, Vehicle
+from .services.face_index import face_index
+from .services.model_registry import registry
+from .services.detection_vehicle import schedule_vehicle_features
+from .services.plate_index import plate_index
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_wallet_for_new_user(sender, instance, created, **kwargs):
     if created:
         Wallet.objects.get_or_create(user=instance)
+
+
+# Đồng bộ chỉ mục khuôn mặt (chỉ khi process đã nạp chỉ mục) sau khi transaction commit:
+# transaction bị rollback không để lại vector ma trong chỉ mục
+@receiver(post_save, sender=UserFace)
+def update_face_index(sender, instance, **kwargs):
+    face_id, embedding = instance.id, instance.embedding
+    transaction.on_commit(lambda: face_index.loaded and face_index.upsert(face_id, embedding))
+
+
+@receiver(post_delete, sender=UserFace)
+def remove_from_face_index(sender, instance, **kwargs):
+    face_id = instance.id
+    transaction.on_commit(lambda: face_index.loaded and face_index.remove(face_id))
+
+
+# Xe vừa được duyệt mà chưa có đặc trưng -> tính 1 lần ở thread nền sau khi transaction lưu xe đã commit
+# (không tải ảnh/chạy OSNet trong request; worker API-only để lệnh backfill xử lý)
+@receiver(post_save, sender=Vehicle)
+def compute_features_on_approval(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'reid_embedding' in update_fields:
+        return
+    if not (instance.is_approved and instance.image and instance.reid_embedding is None and registry.enabled):
+        return
+    vehicle_id = instance.id
+    transaction.on_commit(lambda: schedule_vehicle_features(vehicle_id))
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_plate_index(sender, **kwargs):
+    plate_index.invalidate()
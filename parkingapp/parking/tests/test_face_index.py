@@ -0,0 +1,258 @@
+import io
+import os
+import tempfile
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from unittest.mock import patch, Mock
+
+from ..models import UserFace, Vehicle, FeeRule, FeeType, ParkingLog, ParkingStatus
+from ..services.face_index import FaceIndex, EMBEDDING_DIM
+from ..services.detection_face import find_or_create_user_face, scoped_face_ids
+from ..services.face_writer import FaceWriteBuffer
+from ..services.helpers import pack_vector, unpack_vector
+
+
+def _unit(seed):
+    vec = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+class FaceIndexTestCase(TestCase):
+    def setUp(self):
+        self.faces = [UserFace.objects.create(embedding=pack_vector(_unit(i))) for i in range(5)]
+        # embedding không hợp lệ phải bị bỏ qua
+        UserFace.objects.create(embedding=b'fake_face_data')
+
+    def test_search_returns_best_match(self):
+        index = FaceIndex()
+        index.load_from_db()
+        self.assertEqual(len(index), 5)
+
+        face_id, score = index.search(_unit(3), k=1)[0]
+        self.assertEqual(face_id, self.faces[3].id)
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+    def test_remove_keeps_matrix_contiguous(self):
+        index = FaceIndex()
+        index.load_from_db()
+        index.remove(self.faces[0].id)
+        self.assertEqual(len(index), 4)
+        face_id, _ = index.search(_unit(4), k=1)[0]
+        self.assertEqual(face_id, self.faces[4].id)
+
+    def test_sync_picks_up_new_rows(self):
+        index = FaceIndex()
+        index.load_from_db()
+        new_face = UserFace.objects.create(embedding=pack_vector(_unit(99)))
+        index.sync()
+        self.assertEqual(index.search(_unit(99), k=1)[0][0], new_face.id)
+
+    def test_sync_picks_up_updated_embeddings(self):
+        index = FaceIndex()
+        index.load_from_db()
+        face = UserFace.objects.get(id=self.faces[1].id)
+        face.embedding = pack_vector(_unit(42))  # vd. worker khác vừa ghi embedding cập nhật dần
+        face.save()
+        index.sync()
+        self.assertEqual(len(index), 5)
+        face_id, score = index.search(_unit(42), k=1)[0]
+        self.assertEqual(face_id, face.id)
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+    @patch('parking.signals.face_index')
+    def test_signal_updates_index_only_after_commit(self, mock_index):
+        mock_index.loaded = True
+        with self.captureOnCommitCallbacks(execute=True):
+            face = UserFace.objects.create(embedding=pack_vector(_unit(8)))
+            mock_index.upsert.assert_not_called()
+        mock_index.upsert.assert_called_once_with(face.id, face.embedding)
+
+    def test_snapshot_round_trip(self):
+        index = FaceIndex()
+        index.load_from_db()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'faces')
+            index.save_snapshot(path)
+
+            restored = FaceIndex()
+            self.assertTrue(restored.load_snapshot(path))
+            self.assertEqual(restored.search(_unit(2), k=1)[0][0], self.faces[2].id)
+
+            # snapshot cũ không được dùng khi bảng đã thay đổi
+            UserFace.objects.create(embedding=pack_vector(_unit(7)))
+            self.assertFalse(FaceIndex().load_snapshot(path))
+
+    def test_embedding_is_stored_as_float32_blob(self):
+        face = UserFace.objects.get(id=self.faces[1].id)
+        emb = unpack_vector(face.embedding)
+        self.assertEqual(emb.dtype, np.dtype('<f4'))
+        np.testing.assert_array_equal(emb, _unit(1))
+
+    def test_quantized_index_keeps_best_match(self):
+        for dtype in ('float16', 'int8'):
+            index = FaceIndex(dtype=dtype)
+            index.load_from_db()
+            face_id, score = index.search(_unit(3), k=1)[0]
+            self.assertEqual(face_id, self.faces[3].id)
+            self.assertAlmostEqual(score, 1.0, places=2)
+
+    def test_search_ids_only_scores_given_faces(self):
+        index = FaceIndex()
+        index.load_from_db()
+        results = index.search_ids(_unit(3), [self.faces[1].id, self.faces[3].id, 12345], k=3)
+        self.assertEqual([face_id for face_id, _ in results], [self.faces[3].id, self.faces[1].id])
+
+
+@override_settings(FACE_WRITE_BEHIND=False)
+class ScopedFaceGalleryTestCase(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(username='owner', password='123')
+        self.vehicle = Vehicle.objects.create(user=self.owner, name='Xe', license_plate='30A-11111',
+                                              vehicle_type=FeeType.CAR, is_approved=True)
+        other_vehicle = Vehicle.objects.create(user=self.owner, name='Xe 2', license_plate='30A-22222',
+                                               vehicle_type=FeeType.CAR, is_approved=True)
+        fee_rule = FeeRule.objects.create(fee_type='hourly', amount=1000, active=True)
+        self.driver = UserFace.objects.create(embedding=pack_vector(_unit(1)))
+        self.family = UserFace.objects.create(embedding=pack_vector(_unit(2)))
+        self.stranger = UserFace.objects.create(embedding=pack_vector(_unit(3)))
+        ParkingLog.objects.create(user=self.owner, vehicle=self.vehicle, fee_rule=fee_rule,
+                                  status=ParkingStatus.OUT, user_face=self.driver)
+        ParkingLog.objects.create(user=self.owner, vehicle=other_vehicle, fee_rule=fee_rule,
+                                  status=ParkingStatus.OUT, user_face=self.family)
+        self.index = FaceIndex()
+        self.index.load_from_db()
+
+    def test_gallery_covers_vehicle_and_owner(self):
+        self.assertEqual(set(scoped_face_ids(self.vehicle)), {self.driver.id, self.family.id})
+
+    def test_scoped_match_skips_global_search(self):
+        with patch('parking.services.detection_face.get_face_index', return_value=self.index), \
+                patch.object(self.index, 'search', wraps=self.index.search) as global_search:
+            face = find_or_create_user_face(_unit(1), candidate_ids=scoped_face_ids(self.vehicle))
+        self.assertEqual(face.id, self.driver.id)
+        global_search.assert_not_called()
+
+    def test_falls_back_to_global_search(self):
+        with patch('parking.services.detection_face.get_face_index', return_value=self.index):
+            face = find_or_create_user_face(_unit(3), candidate_ids=scoped_face_ids(self.vehicle))
+        self.assertEqual(face.id, self.stranger.id)
+
+
+@override_settings(FACE_WRITE_BEHIND=True, FACE_WRITE_BATCH=1000)
+class FaceWriteBufferTestCase(TestCase):
+    def setUp(self):
+        self.base = _unit(1)
+        self.face = UserFace.objects.create(embedding=pack_vector(self.base))
+        self.uploader = Mock(return_value='image/upload/v1/face.jpg')
+        self.buffer = FaceWriteBuffer(uploader=self.uploader)
+        self.buffer._ensure_thread = Mock()  # test tự gọi flush()
+
+    def test_updates_are_coalesced_until_flush(self):
+        e1, e2 = _unit(2), _unit(3)
+        self.buffer.submit(self.face.id, e1)
+        self.buffer.submit(self.face.id, e2)
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(bytes(UserFace.objects.get(id=self.face.id).embedding), pack_vector(self.base))
+
+        self.assertEqual(self.buffer.flush(), 1)
+        expected = ((self.base + e1) / 2 + e2) / 2
+        np.testing.assert_allclose(unpack_vector(UserFace.objects.get(id=self.face.id).embedding), expected, atol=1e-6)
+
+    def test_only_latest_image_is_uploaded(self):
+        self.buffer.submit(self.face.id, face_img=SimpleUploadedFile('a.jpg', b'first'))
+        self.buffer.submit(self.face.id, face_img=SimpleUploadedFile('b.jpg', b'second'))
+        self.buffer.flush()
+        self.uploader.assert_called_once_with(b'second', 'b.jpg')
+        self.assertTrue(UserFace.objects.get(id=self.face.id).face_img)
+
+    def test_failed_upload_is_retried_without_blocking_embedding(self):
+        self.uploader.side_effect = [RuntimeError('mất mạng'), 'image/upload/v1/face.jpg']
+        self.buffer.submit(self.face.id, _unit(2), SimpleUploadedFile('a.jpg', b'img'))
+        with self.assertLogs('parking.services.face_writer', level='ERROR'):
+            self.assertEqual(self.buffer.flush(), 1)
+        np.testing.assert_allclose(unpack_vector(UserFace.objects.get(id=self.face.id).embedding),
+                                   (self.base + _unit(2)) / 2, atol=1e-6)
+        self.assertFalse(UserFace.objects.get(id=self.face.id).face_img)
+        self.assertEqual(len(self.buffer), 1)  # chỉ còn ảnh chờ upload lại
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertTrue(UserFace.objects.get(id=self.face.id).face_img)
+        np.testing.assert_allclose(unpack_vector(UserFace.objects.get(id=self.face.id).embedding),
+                                   (self.base + _unit(2)) / 2, atol=1e-6)
+
+    @override_settings(FACE_IMAGE_MAX_ATTEMPTS=3)
+    def test_permanently_failing_upload_is_dropped(self):
+        other = UserFace.objects.create(embedding=pack_vector(self.base))
+        self.uploader.side_effect = RuntimeError('ảnh bị từ chối')
+        self.buffer.submit(self.face.id, _unit(2), SimpleUploadedFile('a.jpg', b'bad'))
+        self.buffer.submit(other.id, _unit(3))
+        with self.assertLogs('parking.services.face_writer', level='ERROR'):
+            self.assertEqual(self.buffer.flush(), 2)
+            self.buffer.flush()
+            self.buffer.flush()
+        self.assertEqual(self.uploader.call_count, 3)
+        self.assertEqual(len(self.buffer), 0)
+        np.testing.assert_allclose(unpack_vector(UserFace.objects.get(id=other.id).embedding),
+                                   (self.base + _unit(3)) / 2, atol=1e-6)
+
+    def test_requeued_updates_merge_with_later_ones(self):
+        e1, e2 = _unit(2), _unit(3)
+        self.buffer.submit(self.face.id, e1)
+        with patch.object(self.buffer, '_write', side_effect=RuntimeError('db lỗi')), \
+                self.assertLogs('parking.services.face_writer', level='ERROR'):
+            self.buffer.flush()
+        self.buffer.submit(self.face.id, e2)
+        self.assertEqual(self.buffer.flush(), 1)
+        expected = ((self.base + e1) / 2 + e2) / 2
+        np.testing.assert_allclose(unpack_vector(UserFace.objects.get(id=self.face.id).embedding), expected, atol=1e-6)
+
+
+class CompactUserFacesTestCase(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        owner = User.objects.create_user(username='owner', password='123')
+        vehicle = Vehicle.objects.create(user=owner, name='Xe', license_plate='30A-11111', vehicle_type=FeeType.CAR)
+        fee_rule = FeeRule.objects.create(fee_type='hourly', amount=1000, active=True)
+        rng = np.random.default_rng(0)
+        # 3 lượt của cùng 1 người (nhiễu nhỏ) + 1 người khác
+        self.same = [UserFace.objects.create(embedding=pack_vector(_unit(1) + rng.normal(0, 0.005, EMBEDDING_DIM)))
+                     for _ in range(3)]
+        self.other = UserFace.objects.create(embedding=pack_vector(_unit(2)))
+        for face in self.same + [self.other]:
+            ParkingLog.objects.create(user=owner, vehicle=vehicle, fee_rule=fee_rule,
+                                      status=ParkingStatus.OUT, user_face=face)
+
+    def test_merges_duplicates_and_repoints_logs(self):
+        call_command('compact_user_faces', threshold=0.9, stdout=io.StringIO())
+        keep = self.same[0]
+        self.assertEqual(set(UserFace.objects.values_list('id', flat=True)), {keep.id, self.other.id})
+        self.assertEqual(ParkingLog.objects.filter(user_face=keep).count(), 3)
+        self.assertEqual(ParkingLog.objects.filter(user_face=self.other).count(), 1)
+
+    def test_dry_run_does_not_write(self):
+        out = io.StringIO()
+        call_command('compact_user_faces', threshold=0.9, dry_run=True, stdout=out)
+        self.assertEqual(UserFace.objects.count(), 4)
+        self.assertIn('2 bản ghi có thể gộp', out.getvalue())
+
+
+class CompactChainedFacesTestCase(TestCase):
+    def setUp(self):
+        a = _unit(1)
+        c = _unit(2) - (_unit(2) @ a) * a
+        c /= np.linalg.norm(c)
+        b = (a + c) / np.linalg.norm(a + c)  # cos(A, B) = cos(B, C) ≈ 0.707, cos(A, C) = 0
+        self.a, self.b, self.c = (UserFace.objects.create(embedding=pack_vector(vec)) for vec in (a, b, c))
+
+    def test_chained_faces_are_not_merged_transitively(self):
+        call_command('compact_user_faces', threshold=0.7, stdout=io.StringIO())
+        self.assertEqual(set(UserFace.objects.values_list('id', flat=True)), {self.a.id, self.c.id})
+
+    def test_merged_embedding_is_unit_length(self):
+        call_command('compact_user_faces', threshold=0.7, stdout=io.StringIO())
+        emb = unpack_vector(UserFace.objects.get(id=self.a.id).embedding)
+        self.assertAlmostEqual(float(np.linalg.norm(emb)), 1.0, places=5)
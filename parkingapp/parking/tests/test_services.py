@@ -0,0 +1,315 @@
+import json
+import tempfile
+from datetime import timedelta
+from unittest import skipUnless
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from unittest.mock import patch
+
+from ..models import Vehicle, FeeType, normalize_plate
+from ..services.helpers import pack_vector, crop_view
+from ..services.detection_vehicle import check_vehicle
+from ..services.detection_plate import characters_to_text
+from ..services.plate_index import BKTree, edit_distance, find_approved_vehicle, plate_index
+from ..services.backends import load_yolo, onnx_path
+from ..services.model_registry import build_registry
+
+User = get_user_model()
+
+
+class CheckVehicleTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='123')
+        self.emb = np.linspace(0.1, 1.0, 512, dtype=np.float32)
+        self.hist = np.linspace(1.0, 0.1, 512, dtype=np.float32)
+        self.vehicle = Vehicle.objects.create(
+            user=self.user, name='Xe test', license_plate='30A-12345', vehicle_type=FeeType.CAR,
+            image='sample', reid_embedding=pack_vector(self.emb), color_hist=pack_vector(self.hist)
+        )
+
+    @patch('parking.services.detection_vehicle.requests.get')
+    def test_uses_precomputed_features(self, mock_get):
+        vehicle = Vehicle.objects.get(id=self.vehicle.id)
+        ok, _ = check_vehicle(vehicle, (self.emb, self.hist))
+        self.assertTrue(ok)
+        mock_get.assert_not_called()
+
+    @patch('parking.services.detection_vehicle.requests.get')
+    def test_rejects_different_vehicle(self, mock_get):
+        vehicle = Vehicle.objects.get(id=self.vehicle.id)
+        ok, _ = check_vehicle(vehicle, (self.emb[::-1].copy(), self.hist))
+        self.assertFalse(ok)
+        mock_get.assert_not_called()
+
+
+class PlateLookupTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='driver', password='123')
+        self.vehicle = Vehicle.objects.create(user=self.user, name='Xe A', license_plate='30A-123.45',
+                                              vehicle_type=FeeType.CAR, is_approved=True)
+        Vehicle.objects.create(user=self.user, name='Xe B', license_plate='51F-678.90',
+                               vehicle_type=FeeType.CAR, is_approved=True)
+        plate_index.invalidate()
+
+    def test_normalized_column(self):
+        self.assertEqual(self.vehicle.plate_normalized, '30A12345')
+        self.assertEqual(normalize_plate(' 30a-123.45 '), '30A12345')
+
+    def test_exact_match_ignores_separators(self):
+        self.assertEqual(find_approved_vehicle('30A12345'), self.vehicle)
+
+    def test_single_misread_character(self):
+        self.assertEqual(find_approved_vehicle('30A12346'), self.vehicle)
+        self.assertEqual(find_approved_vehicle('30A1234'), self.vehicle)
+
+    def test_too_far_or_not_approved(self):
+        self.assertIsNone(find_approved_vehicle('99Z99999'))
+        Vehicle.objects.filter(id=self.vehicle.id).update(is_approved=False)
+        plate_index.invalidate()
+        self.assertIsNone(find_approved_vehicle('30A12346'))
+
+    def test_ambiguous_match_is_rejected(self):
+        Vehicle.objects.create(user=self.user, name='Xe C', license_plate='30A-123.47',
+                               vehicle_type=FeeType.CAR, is_approved=True)
+        self.assertIsNone(find_approved_vehicle('30A12346'))
+
+    def test_bk_tree_search(self):
+        tree = BKTree()
+        for i, plate in enumerate(['30A12345', '30A12346', '51F67890']):
+            tree.add(plate, i)
+        self.assertEqual([m[2] for m in tree.search('30A12345', 1)], [0, 1])
+        self.assertEqual(edit_distance('51F67890', '51F6789'), 1)
+
+
+class CropViewTestCase(TestCase):
+    def test_crop_is_view_of_frame(self):
+        frame = np.zeros((100, 200, 3), dtype=np.uint8)
+        crop = crop_view(frame, (20, 10, 120, 60))
+        self.assertEqual(crop.shape, (50, 100, 3))
+        self.assertTrue(np.shares_memory(crop, frame))
+
+    def test_margin_is_clipped_to_frame(self):
+        frame = np.zeros((100, 200, 3), dtype=np.uint8)
+        crop = crop_view(frame, (0, 0, 100, 100), margin=0.5)
+        self.assertEqual(crop.shape, (100, 150, 3))
+
+
+class PlateCharactersTestCase(TestCase):
+    def test_two_line_plate_is_read_top_to_bottom_left_to_right(self):
+        names = {0: '5', 1: '9', 2: 'A', 3: '1', 4: '2', 5: '3'}
+        # dòng trên "59A", dòng dưới "123", box trả về lộn xộn
+        xyxy = np.array([
+            [120, 150, 160, 230],  # 3
+            [20, 30, 60, 110],     # 5
+            [70, 152, 110, 232],   # 2
+            [120, 28, 160, 108],   # A
+            [20, 148, 60, 228],    # 1
+            [70, 31, 110, 111],    # 9
+        ], dtype=np.float32)
+        cls = np.array([5, 0, 4, 2, 3, 1])
+        self.assertEqual(characters_to_text(xyxy, cls, names), '59A123')
+        self.assertEqual(characters_to_text(np.empty((0, 4)), np.empty(0, dtype=int), names), '')
+
+    def test_slanted_two_line_plate_keeps_lines_apart(self):
+        names = {0: '5', 1: '9', 2: 'A', 3: '1', 4: '2', 5: '3'}
+        # biển nghiêng: cy tăng 15px mỗi ký tự, dòng trên 70..100, dòng dưới 140..170
+        # (khoảng cách 100 -> 140 nhỏ hơn LINE_THRESHOLD nhưng mỗi ký tự vẫn gần ký tự mở dòng của nó)
+        xyxy = np.array([
+            [70, 125, 110, 185],   # 2
+            [20, 40, 60, 100],     # 5
+            [120, 70, 160, 130],   # A
+            [120, 140, 160, 200],  # 3
+            [70, 55, 110, 115],    # 9
+            [20, 110, 60, 170],    # 1
+        ], dtype=np.float32)
+        cls = np.array([4, 0, 2, 5, 1, 3])
+        self.assertEqual(characters_to_text(xyxy, cls, names), '59A123')
+
+
+class ModelBackendTestCase(TestCase):
+    @override_settings(MODEL_BACKENDS={'plate': 'onnx', 'reid': 'onnx-int8'})
+    def test_backend_is_chosen_per_model(self):
+        registry = build_registry({'char': 'onnx'})
+        self.assertEqual(registry.backends['plate'], 'onnx')
+        self.assertEqual(registry.backends['char'], 'onnx')
+        self.assertEqual(registry.backends['reid'], 'onnx-int8')
+        self.assertEqual(registry.backends['vehicle'], 'native')
+
+    def test_missing_onnx_file_is_reported(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(MODEL_ONNX_DIR=tmp):
+            self.assertTrue(onnx_path('char', 'onnx-int8').endswith('char.int8.onnx'))
+            with self.assertRaises(FileNotFoundError):
+                load_yolo('char', 'best.pt', 'onnx-int8')
+        with self.assertRaises(ValueError):
+            load_yolo('char', 'best.pt', 'tensorrt')
+
+
+class DailyStatsTestCase(TestCase):
+    def setUp(self):
+        from ..models import FeeRule, UserFace, UserRole
+        self.user = User.objects.create_user(username='stats', password='123')
+        self.staff = User.objects.create_user(username='staff', password='123', user_role=UserRole.STAFF)
+        FeeRule.objects.create(fee_type=FeeType.CAR, amount=20000)
+        self.vehicle = Vehicle.objects.create(user=self.user, name='Xe test', license_plate='30A-99999',
+                                              vehicle_type=FeeType.CAR)
+        self.face = UserFace.objects.create(embedding=pack_vector(np.ones(4)))
+
+    def _check_in_and_out(self):
+        from ..models import ParkingLog, ParkingStatus
+        from ..services.parking import create_parking
+        from ..services.stats import record_check_out
+        create_parking(self.vehicle, FeeType.CAR, self.face.id)
+        log = ParkingLog.objects.get(vehicle=self.vehicle)
+        log.status, log.fee, log.duration_minutes = ParkingStatus.OUT, 20000, 95
+        log.save(update_fields=['status', 'fee', 'duration_minutes'])
+        record_check_out(log)
+
+    def test_check_in_and_out_update_rollup(self):
+        from django.utils import timezone
+        from ..models import DailyParkingStat
+        from ..services.finance import get_total_revenue_range
+        from ..services.parking import get_total_count_parking, get_total_time_parking
+        self._check_in_and_out()
+
+        stat = DailyParkingStat.objects.get(user=self.user)
+        self.assertEqual((stat.day, stat.vehicle_type), (timezone.localdate(), FeeType.CAR))
+        self.assertEqual((stat.entries, stat.exits, stat.revenue, stat.minutes), (1, 1, 20000, 95))
+        today = timezone.localdate()
+        self.assertEqual(get_total_revenue_range('all', self.staff, today, today), 20000)
+        self.assertEqual(get_total_revenue_range('my', self.staff, today, today), 0)
+        self.assertEqual(get_total_count_parking('my', self.user), 1)
+        self.assertEqual(get_total_time_parking('all', self.staff), 95)
+
+    def test_rebuild_command_repairs_drift(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from ..models import DailyParkingStat
+        self._check_in_and_out()
+        DailyParkingStat.objects.filter(user=self.user).update(revenue=1)
+
+        out = StringIO()
+        call_command('rebuild_daily_stats', '--check', stdout=out)
+        self.assertIn('1 dòng lệch', out.getvalue())
+        call_command('rebuild_daily_stats', stdout=StringIO())
+        self.assertEqual(DailyParkingStat.objects.get(user=self.user).revenue, 20000)
+
+
+class DateRangeIndexTestCase(TestCase):
+    def setUp(self):
+        from ..models import FeeRule, ParkingLog, ParkingStatus
+        self.user = User.objects.create_user(username='explain', password='123')
+        fee_rule = FeeRule.objects.create(fee_type=FeeType.CAR, amount=20000)
+        vehicle = Vehicle.objects.create(user=self.user, name='Xe test', license_plate='30A-11111',
+                                         vehicle_type=FeeType.CAR)
+        for status in (ParkingStatus.IN, ParkingStatus.OUT, ParkingStatus.OUT):
+            ParkingLog.objects.create(user=self.user, vehicle=vehicle, fee_rule=fee_rule, status=status)
+
+    def test_half_open_range_matches_date_lookup(self):
+        from django.utils import timezone
+        from ..models import ParkingLog
+        from ..services.helpers import date_range_lookups
+        today = timezone.localdate()
+        self.assertEqual(ParkingLog.objects.filter(**date_range_lookups('created_date', today, today)).count(),
+                         ParkingLog.objects.filter(created_date__date=today).count())
+        self.assertEqual(ParkingLog.objects.filter(**date_range_lookups('created_date', None, today)).count(), 3)
+
+
+# Kế hoạch truy vấn chỉ kiểm tra được trên MySQL (CI): cần đủ nhiều dòng để optimizer chọn index
+# thay vì quét cả bảng, ANALYZE TABLE tự commit nên phải dùng TransactionTestCase
+@skipUnless(connection.vendor == 'mysql', "EXPLAIN FORMAT=JSON của MySQL")
+class DateRangeIndexPlanTestCase(TransactionTestCase):
+    DAYS = 40
+    LOGS_PER_DAY = 20
+
+    def setUp(self):
+        from ..models import FeeRule, ParkingLog, ParkingStatus, TransactionType, WalletTransaction
+        fee_rule = FeeRule.objects.create(fee_type=FeeType.CAR, amount=20000)
+        self.users = [User.objects.create_user(username=f'explain{i}', password='123') for i in range(20)]
+        vehicles = [Vehicle.objects.create(user=user, name='Xe test', license_plate=f'30A-{10000 + i}',
+                                           vehicle_type=FeeType.CAR) for i, user in enumerate(self.users[:4])]
+        statuses = (ParkingStatus.IN, ParkingStatus.OUT)
+        ParkingLog.objects.bulk_create([
+            ParkingLog(user=vehicles[i % 4].user, vehicle=vehicles[i % 4], fee_rule=fee_rule, status=statuses[i % 2])
+            for i in range(self.DAYS * self.LOGS_PER_DAY)
+        ])
+        # created_date là auto_now_add -> rải các lượt ra DAYS ngày bằng update
+        ids = list(ParkingLog.objects.order_by('id').values_list('id', flat=True))
+        now = timezone.now()
+        for day in range(self.DAYS):
+            chunk = ids[day * self.LOGS_PER_DAY:(day + 1) * self.LOGS_PER_DAY]
+            ParkingLog.objects.filter(id__in=chunk).update(created_date=now - timedelta(days=day))
+        WalletTransaction.objects.bulk_create([
+            WalletTransaction(wallet=user.wallet, amount=10000, transaction_type=TransactionType.DEPOSIT,
+                              active=i % 4 != 0)
+            for user in self.users for i in range(30)
+        ])
+        with connection.cursor() as cursor:
+            for model in (ParkingLog, WalletTransaction):
+                cursor.execute(f'ANALYZE TABLE {model._meta.db_table}')
+                cursor.fetchall()
+
+    # HÀM: tên index MySQL chọn cho bảng trong truy vấn (None = quét cả bảng)
+    def _chosen_key(self, queryset):
+        def find(node):
+            if isinstance(node, dict):
+                if 'access_type' in node:
+                    return node
+                node = list(node.values())
+            if isinstance(node, list):
+                for child in node:
+                    table = find(child)
+                    if table is not None:
+                        return table
+            return None
+        return find(json.loads(queryset.explain(format='json'))).get('key')
+
+    def test_range_filters_use_indexes(self):
+        from ..models import ParkingLog, ParkingStatus
+        from ..services.helpers import date_range_lookups
+        today = timezone.localdate()
+        date_range = date_range_lookups('created_date', today, today)
+
+        self.assertEqual(self._chosen_key(ParkingLog.objects.filter(**date_range)), 'parklog_created_idx')
+        self.assertEqual(self._chosen_key(ParkingLog.objects.filter(status=ParkingStatus.OUT, **date_range)),
+                         'parklog_status_created_idx')
+        self.assertEqual(self._chosen_key(ParkingLog.objects.filter(user=self.users[0], status=ParkingStatus.OUT,
+                                                                    **date_range)),
+                         'parklog_user_status_crt_idx')
+
+    def test_date_cast_lookup_cannot_use_index(self):
+        from ..models import ParkingLog
+        key = self._chosen_key(ParkingLog.objects.filter(created_date__date__gte=timezone.localdate()))
+        self.assertNotEqual(key, 'parklog_created_idx')
+
+    def test_wallet_history_uses_index(self):
+        from ..models import WalletTransaction
+        queryset = WalletTransaction.objects.filter(wallet=self.users[0].wallet, active=True)
+        self.assertEqual(self._chosen_key(queryset), 'wallettx_wallet_active_id_idx')
+
+
+class VehicleApprovalFeaturesTestCase(TestCase):
+    @patch('parking.signals.registry')
+    @patch('parking.signals.schedule_vehicle_features')
+    def test_features_are_scheduled_after_commit(self, mock_schedule, mock_registry):
+        mock_registry.enabled = True
+        user = User.objects.create_user(username='approve', password='123')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            vehicle = Vehicle.objects.create(user=user, name='Xe test', license_plate='30A-22222',
+                                             vehicle_type=FeeType.CAR, image='sample', is_approved=True)
+            mock_schedule.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+        mock_schedule.assert_called_once_with(vehicle.id)
+
+    @patch('parking.services.detection_vehicle.close_old_connections')  # job chạy ngay trên thread của test
+    @patch('parking.services.detection_vehicle.refresh_vehicle_features', side_effect=RuntimeError('cloudinary'))
+    def test_job_failure_is_logged(self, *_):
+        from ..services.detection_vehicle import _refresh_vehicle_features_job
+        user = User.objects.create_user(username='approve2', password='123')
+        vehicle = Vehicle.objects.create(user=user, name='Xe test', license_plate='30A-33333',
+                                         vehicle_type=FeeType.CAR, image='sample')
+        Vehicle.objects.filter(id=vehicle.id).update(is_approved=True)
+        with self.assertLogs('parking.services.detection_vehicle', level='ERROR'):
+            _refresh_vehicle_features_job(vehicle.id)
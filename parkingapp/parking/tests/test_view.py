@@ -3,9 +3,11 @@ from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from ..models import Vehicle
-from unittest.mock import patch
-from ..models import FeeRule, ParkingLog, UserRole, ParkingStatus, UserFace
+from unittest.mock import patch, Mock
+from django.test import TestCase, override_settings
+from ..models import FeeRule, ParkingLog, UserRole, ParkingStatus, UserFace, GateEvent
 from datetime import datetime, timedelta, date
+import numpy as np
 
 User = get_user_model()
 
@@ -176,7 +178,7 @@ class ParkingLogViewSetTestCase(APITestCase):
         self.fee_rule = FeeRule.objects.create(fee_type='hourly', amount=1000, active=True)
 
         # Tạo UserFace (nếu cần)
-        self.user_face = UserFace.objects.create(embedding='fake_face_data')
+        self.user_face = UserFace.objects.create(embedding=b'fake_face_data')
 
         self.client = APIClient()
 
@@ -292,3 +294,247 @@ class ParkingLogViewSetTestCase(APITestCase):
 #         response = self.client.get(url)
 #         self.assertEqual(response.status_code, 200)
 #         self.assertEqual(response.data, 50)
+
+
+class ModelsReadyViewTestCase(APITestCase):
+    @patch('parking.views.registry')
+    def test_ready_reports_model_status(self, mock_registry):
+        mock_registry.is_ready.return_value = False
+        mock_registry.status.return_value = {'plate': True, 'face': False}
+        response = self.client.get(reverse('ready'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.data['models'], {'plate': True, 'face': False})
+
+    @override_settings(ML_ENABLED=False)
+    def test_scan_rejected_on_api_only_worker(self):
+        response = self.client.post(reverse('scan-plate'), {})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertTrue(self.client.get(reverse('ready')).data['ready'])
+
+
+class ScanPlateViewSetTestCase(APITestCase):
+    def _files(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return {name: SimpleUploadedFile(f'{name}.jpg', b'jpeg', content_type='image/jpeg')
+                for name in ('plate_img', 'face_img', 'vehicle_img')}
+
+    @override_settings(DEBUG=True)
+    @patch('parking.services.pipeline.decode_bytes', side_effect=lambda data: data)
+    @patch('parking.services.pipeline.proces', return_value=(True, "Xin mời vào."))
+    @patch('parking.services.pipeline.extract_vehicle_features', return_value=('emb', 'hist'))
+    @patch('parking.services.pipeline.detect_license_plates', return_value='30A12345')
+    @patch('parking.services.pipeline.math_emb', return_value='face_emb')
+    def test_scan_runs_stages_and_joins_for_proces(self, mock_emb, mock_plate, mock_features, mock_proces, _):
+        data = dict(self._files(), direction='IN')
+        response = self.client.post(reverse('scan-plate'), data, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['plate_text'], '30A12345')
+        args = mock_proces.call_args[0]
+        self.assertEqual((args[0], args[2], args[3], args[4]), ('face_emb', ('emb', 'hist'), '30A12345', 'IN'))
+        self.assertIn('plate_ocr', response.data['timings'])
+
+    @patch('parking.services.pipeline.decode_bytes', side_effect=lambda data: data)
+    @patch('parking.services.pipeline.proces', return_value=(True, "Xin mời ra."))
+    @patch('parking.services.pipeline.extract_vehicle_features')
+    @patch('parking.services.pipeline.detect_license_plates', return_value='30A12345')
+    @patch('parking.services.pipeline.math_emb', return_value='face_emb')
+    def test_scan_out_skips_vehicle_features(self, mock_emb, mock_plate, mock_features, mock_proces, _):
+        data = dict(self._files(), direction='OUT')
+        response = self.client.post(reverse('scan-plate'), data, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        mock_features.assert_not_called()
+
+    @patch('parking.services.pipeline.decode_bytes', side_effect=lambda data: data)
+    @patch('parking.services.pipeline.proces')
+    @patch('parking.services.pipeline.extract_vehicle_features', return_value=('emb', 'hist'))
+    @patch('parking.services.pipeline.detect_license_plates', return_value='30A12345')
+    @patch('parking.services.pipeline.math_emb', return_value=None)
+    def test_scan_without_face_is_rejected(self, mock_emb, mock_plate, mock_features, mock_proces, _):
+        data = dict(self._files(), direction='IN')
+        response = self.client.post(reverse('scan-plate'), data, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['ok'])
+        self.assertEqual(response.data['msg'], "Không phát hiện khuôn mặt.")
+        mock_proces.assert_not_called()
+
+    @patch('parking.services.pipeline.registry')
+    @patch('parking.services.pipeline.decode_bytes', return_value=np.zeros((100, 200, 3), dtype=np.uint8))
+    @patch('parking.services.pipeline.proces', return_value=(True, "Xin mời vào."))
+    @patch('parking.services.pipeline.extract_vehicle_features', return_value=('emb', 'hist'))
+    @patch('parking.services.pipeline.detect_license_plates', return_value='30A12345')
+    @patch('parking.services.pipeline.locate_vehicle', return_value=np.array([20, 10, 120, 60]))
+    @patch('parking.services.pipeline.detect_face')
+    def test_scan_single_frame_crops_one_decoded_image(self, mock_face, mock_locate, mock_plate, mock_features,
+                                                       mock_proces, mock_decode, _):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        mock_face.return_value.bbox = np.array([150, 20, 190, 70])
+        mock_face.return_value.normed_embedding = 'face_emb'
+        data = {'image': SimpleUploadedFile('in.jpg', b'jpeg', content_type='image/jpeg'), 'direction': 'IN'}
+        response = self.client.post(reverse('scan-plate'), data, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_decode.call_count, 1)
+        frame = mock_decode.return_value
+        vehicle_img = mock_plate.call_args[0][0]
+        self.assertTrue(np.shares_memory(vehicle_img, frame))
+        self.assertIs(mock_features.call_args[0][0], vehicle_img)
+        args = mock_proces.call_args[0]
+        self.assertEqual((args[0], args[2], args[3], args[4]), ('face_emb', ('emb', 'hist'), '30A12345', 'IN'))
+        self.assertEqual(args[1].name, 'face.jpg')
+
+    def test_scan_without_images_is_rejected(self):
+        response = self.client.post(reverse('scan-plate'), {'direction': 'IN'}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class GateEventReplayTestCase(APITestCase):
+    def _file(self, name):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return SimpleUploadedFile(name, b'jpeg', content_type='image/jpeg')
+
+    def _batch(self, event_id):
+        import json
+        data = {'events': json.dumps([{'event_id': event_id, 'direction': 'IN',
+                                       'captured_at': '2026-10-18T07:30:00+00:00'}])}
+        for name in ('plate_img', 'face_img', 'vehicle_img'):
+            data[f'{event_id}.{name}'] = self._file(f'{name}.jpg')
+        return data
+
+    @patch('parking.views.run_scan', return_value=(True, "Xin mời vào.", '30A12345', {}))
+    def test_batch_replay_is_idempotent(self, mock_scan):
+        url = reverse('scan-plate-batch')
+        first = self.client.post(url, self._batch('evt-1'), format='multipart')
+        second = self.client.post(url, self._batch('evt-1'), format='multipart')
+
+        self.assertEqual(mock_scan.call_count, 1)
+        self.assertEqual(first.data['results'][0]['msg'], "Xin mời vào.")
+        self.assertEqual(second.data['results'][0]['msg'], "Xin mời vào.")
+        captured_at = mock_scan.call_args[0][4]
+        self.assertEqual((captured_at.hour, captured_at.minute), (7, 30))
+
+    @patch('parking.views.run_scan', return_value=(True, "Xin mời vào.", '30A12345', {}))
+    def test_scan_with_same_event_id_is_not_reprocessed(self, mock_scan):
+        data = {name: self._file(f'{name}.jpg') for name in ('plate_img', 'face_img', 'vehicle_img')}
+        data.update(direction='IN', event_id='evt-2')
+        self.client.post(reverse('scan-plate'), data, format='multipart')
+        for f in ('plate_img', 'face_img', 'vehicle_img'):
+            data[f] = self._file(f'{f}.jpg')
+        response = self.client.post(reverse('scan-plate'), data, format='multipart')
+
+        self.assertEqual(mock_scan.call_count, 1)
+        self.assertTrue(response.data['ok'])
+
+    @patch('parking.views.run_scan', return_value=(True, "Xin mời vào.", '30A12345', {}))
+    def test_batch_rejects_non_object_events_individually(self, mock_scan):
+        import json
+        data = self._batch('evt-7')
+        data['events'] = json.dumps(["x", json.loads(data['events'])[0]])
+        response = self.client.post(reverse('scan-plate-batch'), data, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        first, second = response.data['results']
+        self.assertIn('error', first)
+        self.assertEqual((second['event_id'], second['msg']), ('evt-7', "Xin mời vào."))
+
+    @patch('parking.views.run_scan', side_effect=RuntimeError('model lỗi'))
+    def test_failed_event_can_be_retried(self, mock_scan):
+        response = self.client.post(reverse('scan-plate-batch'), self._batch('evt-3'), format='multipart')
+        self.assertIn('error', response.data['results'][0])
+        self.assertFalse(GateEvent.objects.filter(event_id='evt-3').exists())
+
+    @patch('parking.views.run_scan')
+    def test_duplicate_of_event_in_progress_is_marked_pending(self, mock_scan):
+        GateEvent.objects.create(event_id='evt-4', direction='IN')  # bản đầu chưa có kết quả
+        response = self.client.post(reverse('scan-plate-batch'), self._batch('evt-4'), format='multipart')
+        self.assertTrue(response.data['results'][0]['pending'])
+
+        data = {name: self._file(f'{name}.jpg') for name in ('plate_img', 'face_img', 'vehicle_img')}
+        data.update(direction='IN', event_id='evt-4')
+        response = self.client.post(reverse('scan-plate'), data, format='multipart')
+        self.assertEqual(response.status_code, 409)
+        mock_scan.assert_not_called()
+
+    @patch('parking.views.run_scan', return_value=(True, "Xin mời vào.", '30A12345', {}))
+    def test_stale_pending_event_does_not_block_journal(self, mock_scan):
+        from datetime import timedelta
+        from django.utils import timezone
+        # worker xử lý bản đầu chết giữa chừng: dòng kẹt ở "đang xử lý"
+        GateEvent.objects.create(event_id='evt-6', direction='IN')
+        url = reverse('scan-plate-batch')
+        self.assertTrue(self.client.post(url, self._batch('evt-6'), format='multipart').data['results'][0]['pending'])
+
+        GateEvent.objects.filter(event_id='evt-6').update(updated_date=timezone.now() - timedelta(minutes=5))
+        result = self.client.post(url, self._batch('evt-6'), format='multipart').data['results'][0]
+        self.assertNotIn('pending', result)
+        self.assertEqual(result['msg'], "Xin mời vào.")
+        self.assertTrue(GateEvent.objects.get(event_id='evt-6').ok)
+        self.assertEqual(mock_scan.call_count, 1)
+
+    def test_concurrent_first_submission_is_deduplicated(self):
+        from django.db import IntegrityError
+        from ..services.gate_events import process_gate_event
+        GateEvent.objects.create(event_id='evt-5', direction='IN', ok=True, msg="Xin mời vào.")
+        scan = Mock()
+        with patch.object(GateEvent.objects, 'get_or_create', side_effect=IntegrityError):
+            ok, msg, _, timings = process_gate_event('evt-5', 'IN', None, scan)
+        self.assertEqual((ok, msg, timings['duplicate']), (True, "Xin mời vào.", True))
+        scan.assert_not_called()
+
+
+class GateSocketTestCase(TestCase):
+    scope = {'type': 'websocket', 'path': '/ws/gate/', 'query_string': b'token=abc', 'headers': []}
+
+    async def test_rejects_connection_without_valid_token(self):
+        from asgiref.testing import ApplicationCommunicator
+        from ..gate_ws import gate_socket
+        with patch('parking.gate_ws.get_gate_user', return_value=None):
+            communicator = ApplicationCommunicator(gate_socket, self.scope)
+            await communicator.send_input({'type': 'websocket.connect'})
+            message = await communicator.receive_output(1)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': 4401})
+
+    @patch('parking.gate_ws.scan_event', return_value=(True, "Xin mời vào.", '30A12345', {}))
+    async def test_pushes_decision_for_streamed_frame(self, mock_scan):
+        import json
+        from asgiref.testing import ApplicationCommunicator
+        from ..gate_ws import gate_socket, build_frame
+        with patch('parking.gate_ws.get_gate_user', return_value=object()):
+            communicator = ApplicationCommunicator(gate_socket, self.scope)
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual(await communicator.receive_output(1), {'type': 'websocket.accept'})
+
+            header = {'event_id': 'evt-ws', 'lane': 'in-2', 'direction': 'IN', 'captured_at': None}
+            await communicator.send_input({'type': 'websocket.receive', 'bytes': build_frame(header, b'jpeg')})
+            reply = json.loads((await communicator.receive_output(2))['text'])
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(1)
+
+        self.assertEqual(reply, {'ok': True, 'msg': "Xin mời vào.", 'plate_text': '30A12345',
+                                 'event_id': 'evt-ws', 'lane': 'in-2'})
+        files, direction, event_id = mock_scan.call_args[0][:3]
+        self.assertEqual((files['image'].read(), direction, event_id), (b'jpeg', 'IN', 'evt-ws'))
+
+    @patch('parking.gate_ws.scan_event', return_value=(False, "Sự kiện đang được xử lý.", '', {'pending': True}))
+    async def test_marks_reply_pending_for_event_in_progress(self, mock_scan):
+        import json
+        from asgiref.testing import ApplicationCommunicator
+        from ..gate_ws import gate_socket, build_frame
+        with patch('parking.gate_ws.get_gate_user', return_value=object()):
+            communicator = ApplicationCommunicator(gate_socket, self.scope)
+            await communicator.send_input({'type': 'websocket.connect'})
+            await communicator.receive_output(1)
+            header = {'event_id': 'evt-ws', 'lane': 'in-2', 'direction': 'IN', 'captured_at': None}
+            await communicator.send_input({'type': 'websocket.receive', 'bytes': build_frame(header, b'jpeg')})
+            reply = json.loads((await communicator.receive_output(2))['text'])
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(1)
+        self.assertTrue(reply['pending'])
+
+    def test_frames_run_outside_pipeline_pool(self):
+        from ..gate_ws import get_executor
+        from ..services import pipeline
+        self.assertIsNot(get_executor(), pipeline.get_executor())
+
+    def test_parse_frame_rejects_missing_direction(self):
+        from ..gate_ws import build_frame, parse_frame, GateProtocolError
+        with self.assertRaises(GateProtocolError):
+            parse_frame(build_frame({'event_id': 'x'}, b'jpeg'))
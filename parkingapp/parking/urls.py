@@ -15,5 +15,7 @@ router.register('walletTransactions', views.WalletTransactionViewSet, basename='
 urlpatterns = [
     path('', include(router.urls)),
     path('scan-plate/', views.ScanPlateViewSet.as_view(), name='scan-plate'),
+    path('scan-plate/batch/', views.ScanBatchView.as_view(), name='scan-plate-batch'),
+    path('ready/', views.ModelsReadyView.as_view(), name='ready'),
     path('o/', include('oauth2_provider.urls', namespace='oauth2_provider')),
 ]
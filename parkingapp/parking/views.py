@@ -1,5 +1,7 @@
+import json
 from typing import Optional
-from datetime import date
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import viewsets, generics, status, permissions
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
@@ -15,11 +17,11 @@ from .services.parking import (get_total_count_parking,
                                get_total_time_parking)
 
 from .services.vehicle import get_user_vehicle_stats
-from .services.services import proces
+from .services.pipeline import run_scan, run_frame_scan
+from .services.gate_events import process_gate_event, parse_captured_at
 from .services.users import get_total_customer
-from .services.helpers import upload_image, create_df_dt
-from .services.detection_face import math_emb
-from .services.detection_plate import detect_license_plates
+from .services.helpers import create_df_dt, date_range_lookups
+from .services.model_registry import registry, ModelsDisabled
 from .models import User, Vehicle, FeeRule, Payment, UserRole, ParkingLog, ParkingStatus, WalletTransaction
 from . import serializers, perms
 from . import paginator
@@ -170,11 +172,7 @@ class ParkingLogViewSet(viewsets.ViewSet, generics.ListAPIView):
         except ValueError:
             raise ValidationError("ngày, tháng, năm phải là số dương")
         df, dt = create_df_dt(day, month, year)
-        if df:
-            parking_logs = parking_logs.filter(created_date__date__gte=df)
-        if dt:
-            parking_logs = parking_logs.filter(created_date__date__lte=dt)
-        return parking_logs
+        return parking_logs.filter(**date_range_lookups('created_date', df, dt))
 
     @action(methods=['get'], detail=False, url_path="occupancy", permission_classes=[perms.IsStaffOrAdmin])
     def get_parking_occupancy(self, request):
@@ -183,41 +181,103 @@ class ParkingLogViewSet(viewsets.ViewSet, generics.ListAPIView):
 
     @action(methods=['get'], detail=False, url_path="count-today")
     def get_parking_count_today(self, request):
-        now = date.today()
-        count_today = ParkingLog.objects.filter(created_date__date=now).count()
+        today = timezone.localdate()
+        count_today = ParkingLog.objects.filter(**date_range_lookups('created_date', today, today)).count()
         return Response(count_today, status=status.HTTP_200_OK)
 
 
-class ScanPlateViewSet(APIView):
-    def post(self, request, *args, **kwargs):
-        if 'plate_img' not in request.FILES:
-            return Response({"ok": False, "error": "Không có ảnh được gửi"}, status=status.HTTP_400_BAD_REQUEST)
+SCAN_FILES = ('face_img', 'plate_img', 'vehicle_img')
+# chế độ 1 khung hình: server tự cắt vùng xe/biển số/khuôn mặt; face_image (tùy chọn) từ camera khuôn mặt riêng
+FRAME_FILES = ('image', 'face_image')
+MAX_BATCH_EVENTS = 20
 
-        if 'face_img' not in request.FILES:
-            return Response({"ok": False, "error": "Không có ảnh được gửi"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if 'vehicle_img' not in request.FILES:
-            return Response({"ok": False, "error": "Không có ảnh được gửi"}, status=status.HTTP_400_BAD_REQUEST)
+# HÀM: lấy các file ảnh của 1 lượt quét theo tiền tố (lô: "<event_id>."), None nếu thiếu ảnh bắt buộc
+def scan_files(uploaded, prefix=''):
+    files = {name: uploaded.get(f"{prefix}{name}") for name in SCAN_FILES + FRAME_FILES}
+    if files['image'] or all(files[name] for name in SCAN_FILES):
+        return files
+    return None
+
 
-        face_img = request.FILES['face_img']
-        save_path_face = upload_image(face_img, 'face', 'faces')
+# HÀM: chạy 1 lượt quét từ các file ảnh, idempotent theo event_id (nếu máy cổng gửi kèm)
+def scan_event(files, direction, event_id=None, captured_at=None):
+    captured_at = parse_captured_at(captured_at)
+    if files.get('image'):
+        scan = lambda: run_frame_scan(files['image'], direction, captured_at, files.get('face_image'))
+    else:
+        scan = lambda: run_scan(files['face_img'], files['plate_img'], files['vehicle_img'], direction, captured_at)
+    return process_gate_event(event_id, direction, captured_at, scan)
 
-        plate_file = request.FILES['plate_img']
-        save_path_plate = upload_image(plate_file, 'plate', 'plates')
 
-        vehicle_file = request.FILES['vehicle_img']
-        save_path_vehicle = upload_image(vehicle_file, 'vehicle', 'vehicles')
+class ScanPlateViewSet(APIView):
+    def post(self, request, *args, **kwargs):
+        if not registry.enabled:
+            raise ModelsDisabled()
+
+        files = scan_files(request.FILES)
+        if files is None:
+            return Response({"ok": False, "error": "Không có ảnh được gửi"}, status=status.HTTP_400_BAD_REQUEST)
 
         direction = self.request.data.get('direction')
         try:
-            emb = math_emb(save_path_face)
-            plate_text = detect_license_plates(save_path_plate)
-            ok, msg = proces(emb, face_img, save_path_vehicle, plate_text, direction)
-            return Response({"ok": ok, "msg": msg, "plate_text": plate_text}, status=status.HTTP_200_OK)
+            ok, msg, plate_text, timings = scan_event(files, direction,
+                                                      request.data.get('event_id'), request.data.get('captured_at'))
+            payload = {"ok": ok, "msg": msg, "plate_text": plate_text}
+            if timings.get('pending'):
+                # bản gửi trước chưa xử lý xong -> máy cổng giữ sự kiện trong hàng đợi và gửi lại
+                return Response(dict(payload, pending=True), status=status.HTTP_409_CONFLICT)
+            if settings.DEBUG:
+                payload["timings"] = timings
+            return Response(payload, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"ok": False, "error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Nhận lô sự kiện máy cổng lưu khi mất mạng, xử lý theo đúng thứ tự gửi.
+# events: JSON [{"event_id", "direction", "captured_at"}], ảnh của mỗi sự kiện gửi với tên "<event_id>.<loại ảnh>"
+# (loại ảnh: image [+ face_image] hoặc đủ 3 ảnh plate_img, face_img, vehicle_img)
+class ScanBatchView(APIView):
+    def post(self, request, *args, **kwargs):
+        if not registry.enabled:
+            raise ModelsDisabled()
+        try:
+            events = json.loads(request.data.get('events') or '[]')
+        except ValueError:
+            return Response({"error": "events không phải JSON hợp lệ"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(events, list) or len(events) > MAX_BATCH_EVENTS:
+            return Response({"error": f"events phải là danh sách tối đa {MAX_BATCH_EVENTS} sự kiện"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        for event in events:
+            if not isinstance(event, dict):
+                results.append({"event_id": '', "ok": False, "error": "Sự kiện phải là object JSON"})
+                continue
+            event_id = str(event.get('event_id') or '')
+            files = scan_files(request.FILES, f"{event_id}.")
+            if not event_id or files is None:
+                results.append({"event_id": event_id, "ok": False, "error": "Thiếu mã sự kiện hoặc ảnh"})
+                continue
+            try:
+                ok, msg, plate_text, timings = scan_event(files, event.get('direction'), event_id,
+                                                          event.get('captured_at'))
+                result = {"event_id": event_id, "ok": ok, "msg": msg, "plate_text": plate_text}
+                if timings.get('pending'):
+                    result["pending"] = True  # máy cổng giữ lại, gửi lại lần sau
+                results.append(result)
+            except Exception as e:
+                results.append({"event_id": event_id, "ok": False, "error": str(e)})
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class ModelsReadyView(APIView):
+    def get(self, request, *args, **kwargs):
+        ready = registry.is_ready()
+        return Response({"ready": ready, "ml_enabled": registry.enabled, "models": registry.status()},
+                        status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
 class StatsViewSet(viewsets.ViewSet):
     @action(methods=['get'], detail=False, url_path='revenue', permission_classes=[perms.IsStaffOrAdmin])
     def get_stats_revenue(self, request):
@@ -13,4 +13,24 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'parkingapp.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# import sau khi Django đã setup (cần models)
+from parking.gate_ws import GATE_WS_PATH, gate_socket  # noqa: E402
+
+
+# HTTP đi qua Django như cũ; WebSocket của máy cổng đi vào gate_socket
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        if scope['path'] == GATE_WS_PATH:
+            return await gate_socket(scope, receive, send)
+        await receive()
+        return await send({'type': 'websocket.close', 'code': 4404})
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                return await send({'type': 'lifespan.shutdown.complete'})
+    return await django_application(scope, receive, send)
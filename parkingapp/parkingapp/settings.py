@@ -32,6 +32,47 @@ AUTH_USER_MODEL = 'parking.User'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'parking/media')
 MEDIA_URL = 'parking/media/'
 
+# Worker "API-only" đặt ML_ENABLED=0: không import/load các model AI (YOLO, insightface, OSNet)
+ML_ENABLED = os.getenv('ML_ENABLED', '1') == '1'
+
+# Số thread chạy song song các bước của 1 lượt quét (khuôn mặt, biển số, đặc trưng xe)
+SCAN_PIPELINE_WORKERS = int(os.getenv('SCAN_PIPELINE_WORKERS', '3'))
+# Số lượt quét qua WebSocket (/ws/gate/) chạy cùng lúc; mỗi lượt lại dùng thread pool ở trên cho các bước
+GATE_WS_WORKERS = int(os.getenv('GATE_WS_WORKERS', '4'))
+# Sự kiện cổng ở trạng thái "đang xử lý" quá số giây này (worker chết giữa chừng) thì lượt gửi lại được xử lý lại
+GATE_EVENT_CLAIM_TIMEOUT = int(os.getenv('GATE_EVENT_CLAIM_TIMEOUT', '60'))
+# Số thread nội bộ mỗi model (torch/OpenCV) được dùng, 0 = mặc định của thư viện
+SCAN_INTRAOP_THREADS = int(os.getenv('SCAN_INTRAOP_THREADS', '0'))
+
+# Lưu ảnh quét vào MEDIA_ROOT (chạy nền); mặc định chỉ xử lý ảnh trong bộ nhớ
+SCAN_SAVE_IMAGES = os.getenv('SCAN_SAVE_IMAGES', '0') == '1'
+
+# Khớp biển số gần đúng: số ký tự sai tối đa, độ dài tối thiểu, thời gian dựng lại chỉ mục (giây)
+PLATE_MATCH_MAX_DISTANCE = int(os.getenv('PLATE_MATCH_MAX_DISTANCE', '1'))
+PLATE_MATCH_MIN_LENGTH = int(os.getenv('PLATE_MATCH_MIN_LENGTH', '6'))
+PLATE_INDEX_TTL = int(os.getenv('PLATE_INDEX_TTL', '60'))
+
+# Snapshot chỉ mục khuôn mặt (memmap) dùng chung giữa các worker
+FACE_INDEX_PATH = os.getenv('FACE_INDEX_PATH', os.path.join(BASE_DIR, 'parking/index/faces'))
+# Kiểu dữ liệu ma trận chỉ mục trong RAM: float32 | float16 | int8 (DB luôn lưu float32)
+FACE_INDEX_DTYPE = os.getenv('FACE_INDEX_DTYPE', 'float32')
+# Số lượt gửi xe gần nhất của xe/chủ xe dùng làm tập khuôn mặt so khớp trước khi tìm toàn bộ
+FACE_SCOPED_GALLERY_SIZE = int(os.getenv('FACE_SCOPED_GALLERY_SIZE', '20'))
+# Ghi sau (write-behind) embedding/ảnh khuôn mặt: chu kỳ ghi (giây), số khuôn mặt chờ tối đa trước khi ghi ngay;
+# FACE_WRITE_BEHIND=0 thì ghi luôn trong lượt check-in
+FACE_WRITE_BEHIND = os.getenv('FACE_WRITE_BEHIND', '1') == '1'
+FACE_WRITE_INTERVAL = float(os.getenv('FACE_WRITE_INTERVAL', '2'))
+FACE_WRITE_BATCH = int(os.getenv('FACE_WRITE_BATCH', '100'))
+# Ảnh khuôn mặt upload lỗi quá số lần này thì bỏ ảnh (embedding vẫn được ghi)
+FACE_IMAGE_MAX_ATTEMPTS = int(os.getenv('FACE_IMAGE_MAX_ATTEMPTS', '3'))
+
+# Backend chạy từng model: native | onnx | onnx-int8, vd MODEL_BACKENDS="plate=onnx,char=onnx-int8,reid=onnx"
+# (model chưa khai báo chạy native; file ONNX tạo bằng "python manage.py export_models")
+MODEL_BACKENDS = dict(
+    item.strip().split('=', 1) for item in os.getenv('MODEL_BACKENDS', '').split(',') if '=' in item
+)
+MODEL_ONNX_DIR = os.getenv('MODEL_ONNX_DIR', os.path.join(BASE_DIR, 'parking/runs/onnx'))
+
 # Application definition
 API_KEY = '2zar31aJv8jR7U8hbBL9SG6qpXV_4DfJNQZoZgqeb6iB2RTig'
 